@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This script is for benchmarking PLCMemory.Write latency under contention, comparing observers notified under the memory lock against observers notified through PLCMemoryDispatcher
+
+import sys
+import time
+import threading
+import argparse
+import statistics
+
+from mujinplc import plcmemory, plccontroller
+
+import logging
+log = logging.getLogger(__name__)
+
+def ConfigureLogging(logLevel=logging.DEBUG, outputStream=sys.stderr):
+    handler = logging.StreamHandler(outputStream)
+    try:
+        import logutils.colorize
+        handler = logutils.colorize.ColorizingStreamHandler(outputStream)
+        handler.level_map[logging.DEBUG] = (None, 'green', False)
+        handler.level_map[logging.INFO] = (None, None, False)
+        handler.level_map[logging.WARNING] = (None, 'yellow', False)
+        handler.level_map[logging.ERROR] = (None, 'red', False)
+        handler.level_map[logging.CRITICAL] = ('white', 'magenta', True)
+    except ImportError:
+        pass
+    handler.setFormatter(logging.Formatter('%(asctime)s %(name)s [%(levelname)s] [%(filename)s:%(lineno)s %(funcName)s] %(message)s'))
+    handler.setLevel(logLevel)
+
+    root = logging.getLogger()
+    root.setLevel(logLevel)
+    root.handlers = []
+    root.addHandler(handler)
+
+class SlowObserver:
+    """
+    Simulates an observer doing some work for every notification, such as PLCMemoryLogger at debug level.
+    """
+
+    def __init__(self, delay):
+        self._delay = delay
+
+    def MemoryModified(self, modifications):
+        deadline = time.perf_counter() + self._delay
+        while time.perf_counter() < deadline:
+            pass
+
+def Percentile(samples, percentile):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percentile / 100.0))]
+
+def RunBenchmark(numObservers, useDispatcher, numWriters, numWrites, slowObserverDelay):
+    dispatcher = plcmemory.PLCMemoryDispatcher() if useDispatcher else None
+    memory = plcmemory.PLCMemory(dispatcher=dispatcher)
+
+    # one slow observer, the rest behave like idle controllers
+    observers = [SlowObserver(slowObserverDelay)]
+    memory.AddObserver(observers[0])
+    for index in range(numObservers - 1):
+        observers.append(plccontroller.PLCController(memory))
+
+    writeLatencies = []
+    readLatencies = []
+    isok = [True]
+
+    def RunWriter(writerIndex):
+        latencies = []
+        for count in range(numWrites):
+            start = time.perf_counter()
+            memory.Write({'writer%dCounter' % writerIndex: count})
+            latencies.append(time.perf_counter() - start)
+        writeLatencies.extend(latencies)
+
+    def RunReader():
+        latencies = []
+        while isok[0]:
+            start = time.perf_counter()
+            memory.Read(['writer0Counter'])
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0)
+        readLatencies.extend(latencies)
+
+    reader = threading.Thread(target=RunReader, name='reader')
+    reader.start()
+    writers = [threading.Thread(target=RunWriter, args=(index,), name='writer%d' % index) for index in range(numWriters)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    isok[0] = False
+    reader.join()
+
+    return writeLatencies, readLatencies
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PLCMemory Write latency with many observers.')
+    parser.add_argument('--writers', type=int, default=4, help='number of concurrent writer threads')
+    parser.add_argument('--writes', type=int, default=2000, help='number of writes per writer thread')
+    parser.add_argument('--slowObserverDelay', type=float, default=0.0001, help='seconds spent by the slow observer for each notification')
+    options = parser.parse_args()
+
+    ConfigureLogging(logging.INFO)
+
+    print('%-10s %-10s %12s %12s %12s %12s' % ('observers', 'dispatch', 'write p50', 'write p99', 'read p50', 'read p99'))
+    for numObservers in (1, 10, 100):
+        for useDispatcher in (False, True):
+            writeLatencies, readLatencies = RunBenchmark(numObservers, useDispatcher, options.writers, options.writes, options.slowObserverDelay)
+            print('%-10d %-10s %10.1fus %10.1fus %10.1fus %10.1fus' % (
+                numObservers,
+                'deferred' if useDispatcher else 'locked',
+                statistics.median(writeLatencies) * 1e6,
+                Percentile(writeLatencies, 99) * 1e6,
+                statistics.median(readLatencies) * 1e6,
+                Percentile(readLatencies, 99) * 1e6,
+            ))
+
+if __name__ == '__main__':
+    main()
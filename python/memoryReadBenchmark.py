@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This script is for benchmarking PLCMemory.Read throughput as the number of reader threads grows, while a writer keeps modifying the memory
+
+import sys
+import time
+import threading
+import argparse
+
+from mujinplc import plcmemory
+
+import logging
+log = logging.getLogger(__name__)
+
+def ConfigureLogging(logLevel=logging.DEBUG, outputStream=sys.stderr):
+    handler = logging.StreamHandler(outputStream)
+    try:
+        import logutils.colorize
+        handler = logutils.colorize.ColorizingStreamHandler(outputStream)
+        handler.level_map[logging.DEBUG] = (None, 'green', False)
+        handler.level_map[logging.INFO] = (None, None, False)
+        handler.level_map[logging.WARNING] = (None, 'yellow', False)
+        handler.level_map[logging.ERROR] = (None, 'red', False)
+        handler.level_map[logging.CRITICAL] = ('white', 'magenta', True)
+    except ImportError:
+        pass
+    handler.setFormatter(logging.Formatter('%(asctime)s %(name)s [%(levelname)s] [%(filename)s:%(lineno)s %(funcName)s] %(message)s'))
+    handler.setLevel(logLevel)
+
+    root = logging.getLogger()
+    root.setLevel(logLevel)
+    root.handlers = []
+    root.addHandler(handler)
+
+class LockedPLCMemory(plcmemory.PLCMemory):
+    """
+    Reads under the write lock, the way PLCMemory used to, for comparison.
+    """
+
+    def Read(self, keys):
+        keyvalues = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    keyvalues[key] = self._entries[key]
+        return keyvalues
+
+def RunBenchmark(memoryClass, numReaders, duration, numKeys):
+    memory = memoryClass()
+    keys = ['signal%d' % index for index in range(numKeys)]
+    memory.Write({key: 0 for key in keys})
+
+    isok = [True]
+    readCounts = [0] * numReaders
+
+    def RunWriter():
+        count = 0
+        while isok[0]:
+            count += 1
+            memory.Write({key: count for key in keys[:10]})
+
+    def RunReader(readerIndex):
+        count = 0
+        while isok[0]:
+            memory.Read(keys)
+            count += 1
+        readCounts[readerIndex] = count
+
+    threads = [threading.Thread(target=RunWriter, name='writer')]
+    threads += [threading.Thread(target=RunReader, args=(index,), name='reader%d' % index) for index in range(numReaders)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    isok[0] = False
+    for thread in threads:
+        thread.join()
+    return sum(readCounts) / duration
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PLCMemory Read throughput with many reader threads.')
+    parser.add_argument('--duration', type=float, default=2.0, help='seconds to run each configuration')
+    parser.add_argument('--keys', type=int, default=20, help='number of keys read at once')
+    options = parser.parse_args()
+
+    ConfigureLogging(logging.INFO)
+
+    print('%-10s %16s %16s' % ('readers', 'locked reads/s', 'lock-free reads/s'))
+    for numReaders in (1, 2, 4, 8):
+        lockedThroughput = RunBenchmark(LockedPLCMemory, numReaders, options.duration, options.keys)
+        lockFreeThroughput = RunBenchmark(plcmemory.PLCMemory, numReaders, options.duration, options.keys)
+        print('%-10d %16.0f %16.0f' % (numReaders, lockedThroughput, lockFreeThroughput))
+
+if __name__ == '__main__':
+    main()
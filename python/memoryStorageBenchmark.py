@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This script is for benchmarking PLCMemory storage engines, comparing the default dictionary against PLCCompactStorage
+
+import sys
+import time
+import argparse
+import tracemalloc
+
+from mujinplc import plcmemory, plcstorage
+
+import logging
+log = logging.getLogger(__name__)
+
+def ConfigureLogging(logLevel=logging.DEBUG, outputStream=sys.stderr):
+    handler = logging.StreamHandler(outputStream)
+    try:
+        import logutils.colorize
+        handler = logutils.colorize.ColorizingStreamHandler(outputStream)
+        handler.level_map[logging.DEBUG] = (None, 'green', False)
+        handler.level_map[logging.INFO] = (None, None, False)
+        handler.level_map[logging.WARNING] = (None, 'yellow', False)
+        handler.level_map[logging.ERROR] = (None, 'red', False)
+        handler.level_map[logging.CRITICAL] = ('white', 'magenta', True)
+    except ImportError:
+        pass
+    handler.setFormatter(logging.Formatter('%(asctime)s %(name)s [%(levelname)s] [%(filename)s:%(lineno)s %(funcName)s] %(message)s'))
+    handler.setLevel(logLevel)
+
+    root = logging.getLogger()
+    root.setLevel(logLevel)
+    root.handlers = []
+    root.addHandler(handler)
+
+def CreateSignals(numSignals):
+    signals = {}
+    for index in range(numSignals):
+        signalType = (bool, int, str)[index % 3]
+        signals['signal%d' % index] = signalType
+    return signals
+
+def CreateValues(signals, count):
+    keyvalues = {}
+    for name, signalType in signals.items():
+        if signalType is bool:
+            keyvalues[name] = count % 2 == 0
+        elif signalType is int:
+            keyvalues[name] = count
+        else:
+            keyvalues[name] = 'value%d' % (count % 10)
+    return keyvalues
+
+def MeasureMemoryUsage(createMemory, keyvalues):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    memory = createMemory()
+    memory.Write(keyvalues)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    usage = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return memory, usage
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PLCMemory storage engines.')
+    parser.add_argument('--signals', type=int, default=3000, help='number of signals')
+    parser.add_argument('--iterations', type=int, default=200, help='number of bulk reads and writes')
+    options = parser.parse_args()
+
+    ConfigureLogging(logging.INFO)
+
+    signals = CreateSignals(options.signals)
+    schema = plcstorage.PLCSignalSchema(signals)
+    names = list(signals.keys())
+    initialValues = CreateValues(signals, 0)
+
+    dictMemory, dictUsage = MeasureMemoryUsage(lambda: plcmemory.PLCMemory(changeLogSize=0), initialValues)
+    compactMemory, compactUsage = MeasureMemoryUsage(lambda: plcmemory.PLCMemory(changeLogSize=0, storage=plcstorage.PLCCompactStorage(schema)), initialValues)
+    print('memory per signal: dict %.1f bytes, compact %.1f bytes' % (dictUsage / len(signals), compactUsage / len(signals)))
+
+    slots = compactMemory.GetSlots(names)
+    batches = [CreateValues(signals, count) for count in range(1, options.iterations + 1)]
+    slotBatches = [dict(zip(slots, batch.values())) for batch in batches]
+
+    for label, memory, write, read in (
+        ('dict Write/Read', dictMemory, dictMemory.Write, lambda: dictMemory.Read(names)),
+        ('compact Write/Read', compactMemory, compactMemory.Write, lambda: compactMemory.Read(names)),
+    ):
+        start = time.perf_counter()
+        for batch in batches:
+            write(batch)
+        writeElapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        for count in range(options.iterations):
+            read()
+        readElapsed = time.perf_counter() - start
+        print('%-24s write %8.1fus read %8.1fus' % (label, writeElapsed / options.iterations * 1e6, readElapsed / options.iterations * 1e6))
+
+    start = time.perf_counter()
+    for slotBatch in slotBatches:
+        compactMemory.WriteSlots(slotBatch)
+    writeElapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    for count in range(options.iterations):
+        compactMemory.ReadSlots(slots)
+    readElapsed = time.perf_counter() - start
+    print('%-24s write %8.1fus read %8.1fus' % ('compact WriteSlots/ReadSlots', writeElapsed / options.iterations * 1e6, readElapsed / options.iterations * 1e6))
+
+if __name__ == '__main__':
+    main()
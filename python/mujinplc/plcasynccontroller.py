@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import typing # noqa: F401 # used in type check
+
+from . import plcmemory, plccontroller, plcsignaldispatcher
+
+import logging
+log = logging.getLogger(__name__)
+
+class AsyncPLCController:
+    """
+    An asyncio counterpart of PLCController. Waits are coroutines resolved by memory change notifications through a PLCSignalDispatcher, so they do not block a thread. Many controllers can share one dispatcher, so that any number of concurrent handshakes run in a single event loop thread with a single observer and a single state snapshot.
+
+    Unlike PLCController, the state snapshot is always up to date, so there is no Sync.
+    """
+
+    _memory = None # type: plcmemory.PLCMemory # an instance of PLCMemory
+    _signalDispatcher = None # type: plcsignaldispatcher.PLCSignalDispatcher # resolves waits and holds the state snapshot
+
+    def __init__(self, memory: plcmemory.PLCMemory, signalDispatcher: typing.Optional[plcsignaldispatcher.PLCSignalDispatcher] = None, keys: typing.Optional[typing.Iterable[str]] = None, prefixes: typing.Optional[typing.Iterable[str]] = None):
+        """
+        :param signalDispatcher: Dispatcher to share with other controllers on the same memory. By default the controller creates its own.
+        :param keys: If given and a new dispatcher is created, only modifications to these keys are tracked.
+        :param prefixes: If given and a new dispatcher is created, only modifications to keys starting with one of these prefixes are tracked.
+        """
+        self._memory = memory
+        if signalDispatcher is None:
+            signalDispatcher = plcsignaldispatcher.PLCSignalDispatcher(memory, keys=keys, prefixes=prefixes)
+        self._signalDispatcher = signalDispatcher
+
+    def GetSignalDispatcher(self) -> plcsignaldispatcher.PLCSignalDispatcher:
+        return self._signalDispatcher
+
+    async def WaitUntilPredicate(self, predicate: plccontroller.PLCWaitPredicate, timeout: typing.Optional[float] = None) -> bool:
+        """
+        Wait until a compiled predicate is true. If it is already true, return immediately.
+
+        :return: True if successfully waited, False if timed out.
+        """
+        try:
+            return await asyncio.wait_for(self._signalDispatcher.WaitUntilPredicateAsync(predicate), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    async def WaitUntil(self, key: str, value: plcmemory.PLCMemory.ValueType, timeout: typing.Optional[float] = None) -> bool:
+        """
+        Wait until a key is at the expected value. If the key is already at such value, return immediately.
+
+        :return: True if successfully waited, False if timed out.
+        """
+        return await self.WaitUntilPredicate(plccontroller.PLCWaitPredicate({key: value}), timeout=timeout)
+
+    async def WaitUntilAny(self, exceptions: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]], timeout: typing.Optional[float] = None) -> bool:
+        """
+        Wait until any of the keys is at the expected value.
+
+        :return: True if successfully waited, False if timed out.
+        """
+        return await self.WaitUntilPredicate(plccontroller.PLCWaitPredicate(exceptions=exceptions), timeout=timeout)
+
+    async def WaitUntilAll(self, expectations: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]], timeout: typing.Optional[float] = None) -> bool:
+        """
+        Wait until all of the keys are at the expected value.
+
+        :return: True if successfully waited, False if timed out.
+        """
+        return await self.WaitUntilPredicate(plccontroller.PLCWaitPredicate(expectations=expectations), timeout=timeout)
+
+    async def WaitUntilAllOrAny(self, expectations: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] = None, exceptions: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] = None, timeout: typing.Optional[float] = None) -> bool:
+        """
+        Wait until multiple keys are ALL at their expected value, OR ANY one key is at its exceptional value.
+
+        :return: True if successfully waited, False if timed out.
+        """
+        return await self.WaitUntilPredicate(plccontroller.PLCWaitPredicate(expectations, exceptions), timeout=timeout)
+
+    def Set(self, key: str, value: plcmemory.PLCMemory.ValueType) -> None:
+        """
+        Set key in PLC memory.
+        """
+        self._memory.Write({key: value})
+
+    def SetMultiple(self, keyvalues: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
+        """
+        Set multiple keys in PLC memory.
+        """
+        self._memory.Write(keyvalues)
+
+    def Get(self, key: str, defaultValue: plcmemory.PLCMemory.ValueType = None) -> plcmemory.PLCMemory.ValueType:
+        """
+        Get value of a key in the current state snapshot of the PLC memory.
+        """
+        return self._signalDispatcher.Get(key, defaultValue=defaultValue)
+
+    def GetMultiple(self, keys: typing.Iterable[str]) -> typing.Mapping[str, plcmemory.PLCMemory.ValueType]:
+        """
+        Get values of multiple keys in the current state snapshot of the PLC memory.
+        """
+        return self._signalDispatcher.GetMultiple(keys)
+
+    def GetString(self, key: str, defaultValue: str = '') -> str:
+        value = self.Get(key, defaultValue=defaultValue)
+        if not isinstance(value, str):
+            return defaultValue
+        return value
+
+    def GetBoolean(self, key: str, defaultValue: bool = False) -> bool:
+        value = self.Get(key, defaultValue=defaultValue)
+        if not isinstance(value, bool):
+            return defaultValue
+        return value
+
+    def GetInteger(self, key: str, defaultValue: int = 0) -> int:
+        value = self.Get(key, defaultValue=defaultValue)
+        if not isinstance(value, int):
+            return defaultValue
+        return value
@@ -2,6 +2,8 @@
 
 import threading
 import time
+import contextlib
+import collections
 import typing # noqa: F401 # used in type check
 
 from . import plcmemory
@@ -9,79 +11,384 @@ from . import plcmemory
 import logging
 log = logging.getLogger(__name__)
 
+class PLCWaitPredicate:
+    """
+    A wait condition compiled once and reusable across waits: true when ALL keys are at their expected value, OR ANY key is at its exceptional value. Used with PLCController.WaitUntilPredicate.
+
+    While waiting, only the keys present in each modification batch are looked at, and the expectations that are not yet satisfied are tracked in a set, so every wakeup costs time proportional to the number of modified keys rather than to the size of the condition. The predicate itself holds no state of a particular wait, so one instance can be shared by many waits and threads.
+    """
+
+    _expectations = None # type: typing.Dict[str, plcmemory.PLCMemory.ValueType] # values that all have to be met
+    _exceptions = None # type: typing.Dict[str, plcmemory.PLCMemory.ValueType] # values of which any one ends the wait
+
+    def __init__(self, expectations: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] = None, exceptions: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] = None):
+        self._expectations = dict(expectations or {})
+        self._exceptions = dict(exceptions or {})
+
+    def IsEmpty(self) -> bool:
+        return not self._expectations and not self._exceptions
+
+    def GetKeys(self) -> typing.Set[str]:
+        """
+        Keys whose modifications can change the value of the predicate.
+        """
+        return set(self._expectations) | set(self._exceptions)
+
+    def Start(self, state: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> typing.Optional[typing.Set[str]]:
+        """
+        Evaluate the predicate against a full state, at the start of a wait.
+
+        :return: None if the predicate is already true, otherwise the set of expectation keys not yet at their expected value, to be passed to Update.
+        """
+        for key, value in self._exceptions.items():
+            if key in state and state[key] == value:
+                return None
+        unsatisfied = set(key for key, value in self._expectations.items() if key not in state or state[key] != value)
+        if self._expectations and not unsatisfied:
+            return None
+        return unsatisfied
+
+    def Update(self, unsatisfied: typing.Set[str], modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> bool:
+        """
+        Apply a modification batch to the set of unsatisfied expectation keys returned by Start.
+
+        :return: True if the predicate became true.
+        """
+        expectations = self._expectations
+        exceptions = self._exceptions
+        for key, value in modifications.items():
+            if key in exceptions and exceptions[key] == value:
+                return True
+            if key in expectations:
+                if expectations[key] == value:
+                    unsatisfied.discard(key)
+                else:
+                    unsatisfied.add(key)
+        return bool(expectations) and not unsatisfied
+
+PLCEdge = collections.namedtuple('PLCEdge', ['key', 'rising', 'value', 'version', 'timestamp'])
+PLCEdge.__doc__ = """
+A rising or falling edge of a signal, that is a change of its truthiness. Version and timestamp are those of the modification batch that caused it, the timestamp is the monotonic time in nanoseconds at which it was written to the memory.
+"""
+
 class PLCController:
 
     _memory = None # type: plcmemory.PLCMemory # an instance of PLCMemory
-    _state = None # type: typing.Dict[str, plcmemory.PLCMemory.ValueType] # current state which is a snapshot of the PLCMemory in time, _state is intentionally not protected by lock
-
-    _queue = None # type: typing.List[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] # incoming modifications queue
-    _lock = None # type: threading.Lock # protects _queue
+    _state = None # type: typing.Mapping[str, plcmemory.PLCMemory.ValueType] # current state which is a snapshot of the PLCMemory in time, _state is intentionally not protected by lock
+    _sharedState = False # type: bool # if True, _state is the PLCStateSnapshot shared with other readers of the memory instead of a private dictionary
+
+    _queue = None # type: typing.Deque[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] # incoming modifications queue
+    _maxQueueSize = 1024 # type: int # number of queued batches at which the queue is coalesced into a single batch
+    _coalescedBatches = 0 # type: int # number of queued batches merged away by coalescing
+    _coalesceCount = 0 # type: int # number of times the queue was coalesced
+    _lock = None # type: threading.Lock # protects _queue and the coalescing counters
     _condition = None # type: threading.Condition # condition variable for _queue
 
     _maxHeartbeatInterval = None # type: typing.Optional[float] # if heartbeat has not been received in this interval, connection is considered to be lost
     _heartbeatSignal = None # type typing.Optional[str] # name of the heartbeat signal that is changed contantly
     _lastHeartbeat = None # type typing.Optional[int] # timestamp of the last heartbeat
+    _connectedSignal = None # type: typing.Optional[str] # name of the signal a PLCHeartbeatWatchdog publishes the connection state to, replaces heartbeat tracking when set
+    _connected = False # type: bool # value of the connected signal as of the last enqueued batch
 
-    def __init__(self, memory: plcmemory.PLCMemory, maxHeartbeatInterval: typing.Optional[float] = None, heartbeatSignal: typing.Optional[str] = None):
-        self._memory = memory
-        self._state = {}
+    _transaction = None # type: typing.Optional[plcmemory.PLCMemoryTransaction] # if set, Set and SetMultiple are collected into this transaction
 
-        self._queue = []
+    _stateVersion = 0 # type: int # version of the newest modification batch applied to _state
+    _stateTimestamp = 0 # type: int # monotonic timestamp in nanoseconds of the newest modification batch applied to _state
+
+    _edgeValues = None # type: typing.Optional[typing.Dict[str, plcmemory.PLCMemory.ValueType]] # value of each edge tracked key as of the last enqueued batch, None until the initial state is received
+    _edges = None # type: typing.Dict[str, typing.Deque[PLCEdge]] # edges not yet consumed by WaitForEdge or PopEdges, by key
+    _edgeCallbacks = None # type: typing.Dict[typing.Tuple[str, bool], typing.List[typing.Callable[[PLCEdge], None]]] # callbacks by key and whether they are for rising edges
+    _edgeCondition = None # type: threading.Condition # condition variable for _edges, shares _lock
+    _maxEdgeQueueSize = 4096 # type: int # number of unconsumed edges kept per key
+    _droppedEdges = 0 # type: int # number of unconsumed edges dropped because the edge queue of their key was full
+
+    def __init__(self, memory: plcmemory.PLCMemory, maxHeartbeatInterval: typing.Optional[float] = None, heartbeatSignal: typing.Optional[str] = None, keys: typing.Optional[typing.Iterable[str]] = None, prefixes: typing.Optional[typing.Iterable[str]] = None, maxQueueSize: int = 1024, edgeKeys: typing.Optional[typing.Iterable[str]] = None, maxEdgeQueueSize: int = 4096, sharedState: bool = False, connectedSignal: typing.Optional[str] = None):
+        """
+        :param keys: If given, only modifications to these keys are tracked, other keys will not show up in the local state snapshot, unless sharedState is set.
+        :param prefixes: If given, only modifications to keys starting with one of these prefixes are tracked.
+        :param maxQueueSize: When this many modification batches are queued and not yet consumed, they are merged into a single batch holding the latest value of every key, so that an idle or slow controller does not grow without bound. Intermediate values of a key are lost when its batches are merged.
+        :param edgeKeys: Keys whose rising and falling edges are tracked, for WaitForEdge, PopEdges, OnRisingEdge and OnFallingEdge. Edges are detected as modifications arrive, before they are queued, so no pulse is missed even if the queue is coalesced.
+        :param maxEdgeQueueSize: Number of unconsumed edges kept per key, older edges are dropped beyond that.
+        :param sharedState: If True, instead of merging every modification into a private copy of the state, the controller reads from the immutable snapshots published by the memory, and only keeps a reference to the snapshot of the version it has consumed. Saves memory and merge work when many controllers observe the same memory. All keys of the memory can be read at that version, regardless of keys and prefixes.
+        :param connectedSignal: If given, the connection state is read from this signal, as published by a PLCHeartbeatWatchdog, instead of timing heartbeats in every controller. maxHeartbeatInterval and heartbeatSignal are ignored.
+        """
+        self._memory = memory
+        self._sharedState = sharedState
+        if sharedState:
+            self._state = memory.GetSnapshot()
+        else:
+            self._state = {}
+
+        self._queue = collections.deque()
+        self._maxQueueSize = max(maxQueueSize, 1)
+        self._coalescedBatches = 0
+        self._coalesceCount = 0
         self._lock = threading.Lock()
         self._condition = threading.Condition(self._lock)
 
         self._maxHeartbeatInterval = maxHeartbeatInterval
         self._heartbeatSignal = heartbeatSignal
-
-        self._memory.AddObserver(self)
+        self._connectedSignal = connectedSignal
+        if connectedSignal:
+            self._maxHeartbeatInterval = None
+            self._heartbeatSignal = None
+
+        edgeKeys = list(edgeKeys or [])
+        self._edges = {key: collections.deque() for key in edgeKeys}
+        self._edgeCallbacks = {}
+        self._edgeCondition = threading.Condition(self._lock)
+        self._maxEdgeQueueSize = max(maxEdgeQueueSize, 1)
+        self._droppedEdges = 0
+
+        if keys is not None or prefixes is not None:
+            # heartbeat signal and edge keys have to be tracked regardless
+            keys = list(keys or [])
+            if heartbeatSignal:
+                keys.append(heartbeatSignal)
+            if connectedSignal:
+                keys.append(connectedSignal)
+            keys.extend(edgeKeys)
+        self._memory.AddObserver(self, keys=keys, prefixes=prefixes)
+
+    def GetMemory(self) -> plcmemory.PLCMemory:
+        return self._memory
 
     def MemoryModified(self, modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
         self._Enqueue(modifications)
 
     def _Enqueue(self, modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
-        if not modifications:
-            return
-        if not self._heartbeatSignal or self._heartbeatSignal in modifications:
+        if self._maxHeartbeatInterval and modifications and (not self._heartbeatSignal or self._heartbeatSignal in modifications):
             self._lastHeartbeat = time.monotonic()
+        edges = None # type: typing.Optional[typing.List[PLCEdge]]
         with self._lock:
-            self._queue.append(modifications)
+            if self._connectedSignal and self._connectedSignal in modifications:
+                self._connected = bool(modifications[self._connectedSignal])
+            if self._edges:
+                if self._edgeValues is None:
+                    # the first notification is the initial state, which is not an edge
+                    self._edgeValues = {key: modifications.get(key) for key in self._edges}
+                else:
+                    edges = self._DetectEdges(modifications)
+            if not modifications:
+                return
+            if len(self._queue) >= self._maxQueueSize:
+                self._CoalesceQueue(modifications)
+            else:
+                self._queue.append(modifications)
             self._condition.notify()
+            if edges:
+                self._edgeCondition.notify_all()
+
+        if edges and self._edgeCallbacks:
+            for edge in edges:
+                for callback in self._edgeCallbacks.get((edge.key, edge.rising), ()):
+                    try:
+                        callback(edge)
+                    except Exception as e:
+                        log.exception('caught exception in edge callback %r: %s', callback, e)
+
+    def _DetectEdges(self, modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> typing.List[PLCEdge]:
+        """
+        Compare modifications with the previous values of the edge tracked keys, and queue the edges. Has to be called under lock.
+        """
+        edges = [] # type: typing.List[PLCEdge]
+        edgeValues = self._edgeValues # type: typing.Dict[str, plcmemory.PLCMemory.ValueType] # type: ignore
+        for key, value in modifications.items():
+            if key not in edgeValues:
+                continue
+            previousValue = edgeValues[key]
+            edgeValues[key] = value
+            if bool(value) == bool(previousValue):
+                continue
+            if isinstance(modifications, plcmemory.PLCModifications):
+                edge = PLCEdge(key, bool(value), value, modifications.version, modifications.timestamp)
+            else:
+                edge = PLCEdge(key, bool(value), value, 0, plcmemory.GetMonotonicTimestamp())
+            queue = self._edges[key]
+            if len(queue) >= self._maxEdgeQueueSize:
+                queue.popleft()
+                self._droppedEdges += 1
+            queue.append(edge)
+            edges.append(edge)
+        return edges
+
+    def _CoalesceQueue(self, modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
+        """
+        Replace everything queued and the new modifications with a single merged batch. Has to be called under lock.
+        """
+        if isinstance(modifications, plcmemory.PLCModifications):
+            # keep the version and timestamp of the newest batch
+            merged = modifications.CreateEmpty() # type: typing.Dict[str, plcmemory.PLCMemory.ValueType]
+        else:
+            merged = {}
+        for keyvalues in self._queue:
+            merged.update(keyvalues)
+        merged.update(modifications)
+        self._coalescedBatches += len(self._queue)
+        self._coalesceCount += 1
+        self._queue.clear()
+        self._queue.append(merged)
+
+    def GetQueueStats(self) -> typing.Dict[str, int]:
+        """
+        Statistics about the incoming modifications queue, for monitoring slow consumers.
+
+        :return: A dictionary containing the number of queued batches, the maximum queue size, the number of times the queue was coalesced, the number of batches merged away by coalescing and the number of edges dropped because they were not consumed.
+        """
+        with self._lock:
+            return {
+                'queued': len(self._queue),
+                'maxQueueSize': self._maxQueueSize,
+                'coalesceCount': self._coalesceCount,
+                'coalescedBatches': self._coalescedBatches,
+                'droppedEdges': self._droppedEdges,
+            }
 
     def _Dequeue(self, timeout: typing.Optional[float] = None, timeoutOnDisconnect: bool = True) -> typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]]:
-        start = time.monotonic()
-        modifications = None
+        """
+        Wait for the next modification batch. The wait is a single condition wait until either the timeout or the heartbeat expiry, whichever comes first. A heartbeat always arrives as a modification batch, which wakes the waiter, so nothing has to be polled. With a connected signal, disconnection also arrives as a modification batch, and there is no heartbeat expiry to wait for.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
 
-        while True:
-            if timeout is not None and timeout < 0:
-                # timed out
-                return None
+        with self._lock:
+            while not self._queue:
+                waitTimeout = self._GetWaitTimeout(deadline, timeoutOnDisconnect)
+                if waitTimeout is not None and waitTimeout < 0:
+                    # timed out, or because of disconnection
+                    return None
+                self._condition.wait(waitTimeout)
+            modifications = self._queue.popleft()
+
+        self._ApplyToState(modifications)
+        return modifications
 
-            with self._lock:
-                if self._queue:
-                    modifications = self._queue.pop(0)
-                    break
-                if self._condition.wait(0.05):
-                    modifications = self._queue.pop(0)
-                    break
+    def _GetWaitTimeout(self, deadline: typing.Optional[float], timeoutOnDisconnect: bool) -> typing.Optional[float]:
+        """
+        Seconds to wait on a condition until the deadline or the heartbeat expiry, whichever comes first. Has to be called under lock.
 
-            if timeout is not None and time.monotonic() - start > timeout:
-                # timed out
-                return None
+        :return: None to wait without timeout, or a negative number if the deadline passed or the connection is lost.
+        """
+        now = time.monotonic()
+        if deadline is not None and now >= deadline:
+            return -1.0
 
-            if timeoutOnDisconnect and not self.IsConnected():
-                # timed out because of disconnection
-                return None
+        wakeup = deadline
+        if timeoutOnDisconnect and self._connectedSignal and not self._connected:
+            return -1.0
+        if timeoutOnDisconnect and self._maxHeartbeatInterval:
+            if self._lastHeartbeat is None or now - self._lastHeartbeat >= self._maxHeartbeatInterval:
+                return -1.0
+            expiry = self._lastHeartbeat + self._maxHeartbeatInterval
+            if wakeup is None or expiry < wakeup:
+                wakeup = expiry
+        return None if wakeup is None else wakeup - now
 
-        self._state.update(modifications)
-        return modifications
+    def _UpdateStateVersion(self, modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
+        if isinstance(modifications, plcmemory.PLCModifications):
+            self._stateVersion = modifications.version
+            self._stateTimestamp = modifications.timestamp
+
+    def GetStateVersion(self) -> int:
+        """
+        Version of the newest modification batch applied to the current state snapshot.
+        """
+        return self._stateVersion
+
+    def GetStateTimestamp(self) -> int:
+        """
+        Monotonic timestamp in nanoseconds at which the newest modification batch applied to the current state snapshot was written to the memory.
+        """
+        return self._stateTimestamp
+
+    def WaitForEdge(self, key: str, rising: typing.Optional[bool] = None, timeout: typing.Optional[float] = None, timeoutOnDisconnect: bool = True) -> typing.Optional[PLCEdge]:
+        """
+        Consume the next edge of a key, waiting for it if none is queued. Edges are queued from construction of the controller, so an edge that happened before the call is returned immediately, and a pulse shorter than the time between two calls still produces its two edges.
+
+        :param key: One of the edgeKeys the controller was constructed with.
+        :param rising: If True or False, only wait for rising or falling edges, edges in the other direction are consumed and dropped.
+        :return: The edge, or None if timed out.
+        """
+        queue = self._edges.get(key)
+        if queue is None:
+            raise ValueError('edges of %s are not tracked' % key)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while True:
+                while queue:
+                    edge = queue.popleft()
+                    if rising is None or edge.rising == rising:
+                        return edge
+                waitTimeout = self._GetWaitTimeout(deadline, timeoutOnDisconnect)
+                if waitTimeout is not None and waitTimeout < 0:
+                    return None
+                self._edgeCondition.wait(waitTimeout)
+
+    def PopEdges(self, key: str) -> typing.List[PLCEdge]:
+        """
+        Consume all queued edges of a key without waiting.
+        """
+        queue = self._edges.get(key)
+        if queue is None:
+            raise ValueError('edges of %s are not tracked' % key)
+        with self._lock:
+            edges = list(queue)
+            queue.clear()
+        return edges
+
+    def OnRisingEdge(self, key: str, callback: typing.Callable[[PLCEdge], None]) -> None:
+        """
+        Call callback with every subsequent rising edge of a key. Callbacks are called by the thread that wrote the memory, as soon as the modification arrives, and must not block.
+
+        :param key: One of the edgeKeys the controller was constructed with.
+        """
+        self._AddEdgeCallback(key, True, callback)
+
+    def OnFallingEdge(self, key: str, callback: typing.Callable[[PLCEdge], None]) -> None:
+        """
+        Call callback with every subsequent falling edge of a key. Callbacks are called by the thread that wrote the memory, as soon as the modification arrives, and must not block.
+
+        :param key: One of the edgeKeys the controller was constructed with.
+        """
+        self._AddEdgeCallback(key, False, callback)
+
+    def _AddEdgeCallback(self, key: str, rising: bool, callback: typing.Callable[[PLCEdge], None]) -> None:
+        if key not in self._edges:
+            raise ValueError('edges of %s are not tracked' % key)
+        with self._lock:
+            # copy on write, so that callbacks can be iterated without lock
+            callbacks = dict(self._edgeCallbacks)
+            callbacks[(key, rising)] = callbacks.get((key, rising), []) + [callback]
+            self._edgeCallbacks = callbacks
 
     def _DequeueAll(self) -> None:
         modifications = {} # type: typing.Dict[str, plcmemory.PLCMemory.ValueType]
+        newest = None # type: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]]
         with self._lock:
-            for keyvalues in self._queue:
-                modifications.update(keyvalues)
-            self._queue = []
-        self._state.update(modifications)
+            if not self._sharedState:
+                for keyvalues in self._queue:
+                    modifications.update(keyvalues)
+            if self._queue:
+                newest = self._queue[-1]
+            self._queue.clear()
+        if newest is not None:
+            self._ApplyToState(modifications, newest)
+
+    def _ApplyToState(self, modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType], newest: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] = None) -> None:
+        """
+        Advance _state past dequeued modifications. With a shared state, this only moves to the snapshot carried by the newest batch.
+
+        :param newest: Newest batch the modifications were merged from, if they are not a batch themselves.
+        """
+        if newest is None:
+            newest = modifications
+        if self._sharedState:
+            snapshot = getattr(newest, 'snapshot', None)
+            if snapshot is not None:
+                self._state = snapshot
+        else:
+            self._state.update(modifications) # type: ignore
+        self._UpdateStateVersion(newest)
 
     def Sync(self) -> None:
         """
@@ -93,6 +400,8 @@ class PLCController:
         """
         Whether time since last heartbeat is within expectation indicating an active connection.
         """
+        if self._connectedSignal:
+            return self._connected
         if self._maxHeartbeatInterval:
             return self._lastHeartbeat is not None and time.monotonic() - self._lastHeartbeat < self._maxHeartbeatInterval
         return True
@@ -194,56 +503,96 @@ class PLCController:
 
         :return: True if successfully waited, False if timed out.
         """
-        expectations = expectations or {}
-        exceptions = exceptions or {}
+        return self.WaitUntilPredicate(PLCWaitPredicate(expectations, exceptions), timeout=timeout)
+
+    def WaitUntilPredicate(self, predicate: PLCWaitPredicate, timeout: typing.Optional[float] = None) -> bool:
+        """
+        Wait until a compiled predicate is true. If it is already true, return immediately.
 
-        # combine dictionaries
-        keyvalues = {} # type: typing.Dict[str, plcmemory.PLCMemory.ValueType]
-        keyvalues.update(expectations)
-        keyvalues.update(exceptions)
-        if not keyvalues:
+        :return: True if successfully waited, False if timed out.
+        """
+        if predicate.IsEmpty():
             return True
 
         # always clear the queue first
         self._DequeueAll()
 
-        while True:
-            start = time.monotonic()
+        unsatisfied = predicate.Start(self._state)
+        if unsatisfied is None:
+            return True
 
-            # check if any exceptions is already met
-            for key, value in exceptions.items():
-                if key in self._state and self._state[key] == value:
-                    return True
-
-            # check if all expectations are already met
-            if expectations:
-                met = True
-                for key, value in expectations.items():
-                    if key not in self._state or self._state[key] != value:
-                        met = False
-                        break
-                if met:
-                    return True
-
-            # wait for it to change
-            if not self.WaitForAny(keyvalues, timeout=timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            modifications = self._Dequeue(timeout=None if deadline is None else deadline - time.monotonic())
+            if not modifications:
                 return False
+            if predicate.Update(unsatisfied, modifications):
+                return True
 
-            if timeout is not None:
-                timeout -= time.monotonic() - start
+    def Select(self, conditions: typing.Mapping[str, plcmemory.PLCMemory.ValueType], timeout: typing.Optional[float] = None) -> typing.Dict[str, plcmemory.PLCMemory.ValueType]:
+        """
+        Wait until any of the keys is at the expected value, and tell which ones are.
+
+        If some keys are already at such value, return immediately.
+
+        :return: A dictionary of every key that is at its expected value, in the same state snapshot, mapped to its value. Empty if timed out.
+        """
+        if not conditions:
+            return {}
+
+        # always clear the queue first
+        self._DequeueAll()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self._state
+            fired = {key: state[key] for key, value in conditions.items() if key in state and state[key] == value}
+            if fired:
+                return fired
+            while True:
+                modifications = self._Dequeue(timeout=None if deadline is None else deadline - time.monotonic())
+                if not modifications:
+                    return {}
+                if any(key in conditions and conditions[key] == value for key, value in modifications.items()):
+                    break
 
     def Set(self, key: str, value: plcmemory.PLCMemory.ValueType) -> None:
         """
         Set key in PLC memory.
         """
+        if self._transaction is not None:
+            self._transaction.Write({key: value})
+            return
         self._memory.Write({key: value})
 
     def SetMultiple(self, keyvalues: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
         """
         Set multiple keys in PLC memory.
         """
+        if self._transaction is not None:
+            self._transaction.Write(keyvalues)
+            return
         self._memory.Write(keyvalues)
 
+    @contextlib.contextmanager
+    def Transaction(self, coalesce: bool = True) -> typing.Iterator[plcmemory.PLCMemoryTransaction]:
+        """
+        Collect all Set and SetMultiple calls made within the with block, and write them to PLC memory as a single modification batch when the block exits. When the same key is set more than once, only the last value is written. Nested blocks join the outer transaction.
+
+        :param coalesce: If False, setting a key again to a different value first writes what was collected so far, so that pulses such as a trigger set and reset within the block are still seen by observers.
+        """
+        if self._transaction is not None:
+            yield self._transaction
+            return
+
+        transaction = self._memory.Transaction(coalesce=coalesce)
+        self._transaction = transaction
+        try:
+            with transaction:
+                yield transaction
+        finally:
+            self._transaction = None
+
     def Get(self, key: str, defaultValue: plcmemory.PLCMemory.ValueType = None) -> plcmemory.PLCMemory.ValueType:
         """
         Get value of a key in the current state snapshot of the PLC memory.
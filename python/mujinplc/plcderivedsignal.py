@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+import typing # noqa: F401 # used in type check
+
+import logging
+log = logging.getLogger(__name__)
+
+ValueType = typing.Optional[typing.Union[str, int, bool]]
+
+class PLCExpression:
+    """
+    Base class of boolean expressions over PLC memory signals, used to define derived signals with PLCMemory.AddDerivedSignal.
+    """
+
+class PLCEquals(PLCExpression):
+    """
+    True when the signal has the given value. A signal that does not exist is considered to be None.
+    """
+
+    key = None # type: str
+    value = None # type: ValueType
+
+    def __init__(self, key: str, value: ValueType):
+        self.key = key
+        self.value = value
+
+class PLCAnd(PLCExpression):
+    """
+    True when all operands are true. Operands are expressions, or dictionaries that are shorthand for PLCEquals on each of their entries.
+    """
+
+    operands = None # type: typing.List[PLCExpression]
+
+    def __init__(self, *operands: typing.Union[PLCExpression, typing.Mapping[str, ValueType]]):
+        self.operands = []
+        for operand in operands:
+            if isinstance(operand, PLCExpression):
+                self.operands.append(operand)
+            else:
+                self.operands.extend(PLCEquals(key, value) for key, value in operand.items())
+
+class PLCOr(PLCAnd):
+    """
+    True when any operand is true. Operands are expressions, or dictionaries that are shorthand for PLCEquals on each of their entries.
+    """
+
+class PLCNot(PLCExpression):
+    """
+    True when the operand is false.
+    """
+
+    operand = None # type: PLCExpression
+
+    def __init__(self, operand: PLCExpression):
+        self.operand = operand
+
+class _PLCDerivedNode:
+    """
+    Node of a compiled expression. Every node remembers its current value, and combining nodes remember how many of their children are true, so that a change to one input is propagated in O(depth) without re-evaluating the rest of the expression.
+    """
+
+    __slots__ = ('parent', 'children', 'value', 'key', 'expected', 'isAnd', 'negate', 'trueCount', 'derivedKey')
+
+    def __init__(self, parent: typing.Optional['_PLCDerivedNode']):
+        self.parent = parent # type: typing.Optional[_PLCDerivedNode]
+        self.children = [] # type: typing.List[_PLCDerivedNode]
+        self.value = False # type: bool
+        self.key = None # type: typing.Optional[str] # for leaves, the input signal
+        self.expected = None # type: ValueType # for leaves, the value the input signal is compared with
+        self.isAnd = True # type: bool # for combining nodes, whether all or any children have to be true
+        self.negate = False # type: bool # for combining nodes, whether the result is inverted
+        self.trueCount = 0 # type: int # for combining nodes, number of children that are true
+        self.derivedKey = None # type: typing.Optional[str] # for root nodes, the derived signal
+
+    def Evaluate(self) -> bool:
+        """
+        Value of a combining node according to its counter.
+        """
+        if self.isAnd:
+            return (self.trueCount == len(self.children)) != self.negate
+        return (self.trueCount > 0) != self.negate
+
+class PLCDerivedSignals:
+    """
+    PLCDerivedSignals keeps derived signals of a PLCMemory up to date. Only the leaves reading a modified signal are re-evaluated, and changes propagate up to the derived signals through per-node counters. Used internally by PLCMemory, has to be called under the memory lock.
+    """
+
+    _roots = None # type: typing.Dict[str, _PLCDerivedNode] # root node of each derived signal
+    _leaves = None # type: typing.Dict[str, typing.List[_PLCDerivedNode]] # index from input signal to the leaves reading it
+
+    def __init__(self):
+        self._roots = {}
+        self._leaves = {}
+
+    def IsDerived(self, key: str) -> bool:
+        return key in self._roots
+
+    def CheckWritable(self, keys: typing.Iterable[str]) -> None:
+        """
+        Raise ValueError if any of the keys is a derived signal, which cannot be written directly.
+        """
+        for key in keys:
+            if key in self._roots:
+                raise ValueError('signal %s is a derived signal and cannot be written' % key)
+
+    def Add(self, key: str, expression: PLCExpression, entries: typing.Mapping[str, ValueType]) -> bool:
+        """
+        Compile a derived signal and evaluate it against the current memory.
+
+        :return: Value of the derived signal.
+        """
+        if key in self._roots:
+            raise ValueError('signal %s is already a derived signal' % key)
+        if key in self._leaves:
+            raise ValueError('signal %s is already used as an input of a derived signal' % key)
+
+        leaves = [] # type: typing.List[_PLCDerivedNode]
+        root = self._Compile(expression, None, leaves)
+        if any(leaf.key == key for leaf in leaves):
+            raise ValueError('derived signal %s cannot depend on itself' % key)
+        root.derivedKey = key
+
+        # evaluate bottom up, by feeding every leaf its current input
+        for leaf in leaves:
+            self._leaves.setdefault(leaf.key, []).append(leaf) # type: ignore
+            leaf.value = entries.get(leaf.key) == leaf.expected # type: ignore
+        self._Initialize(root)
+        self._roots[key] = root
+        return root.value
+
+    def Update(self, modifications: typing.Mapping[str, ValueType]) -> typing.Dict[str, bool]:
+        """
+        Propagate modifications to the derived signals.
+
+        :return: New values of the derived signals that changed. A derived signal that changed and changed back within the modifications is left out.
+        """
+        derivedModifications = {} # type: typing.Dict[str, bool]
+        previousValues = {} # type: typing.Dict[str, bool] # value of each changed derived signal before the modifications
+        pending = [modifications] # type: typing.List[typing.Mapping[str, ValueType]]
+        while pending:
+            changed = {} # type: typing.Dict[str, bool]
+            for key, value in pending.pop().items():
+                for leaf in self._leaves.get(key, ()):
+                    leafValue = value == leaf.expected
+                    if leafValue != leaf.value:
+                        leaf.value = leafValue
+                        self._Propagate(leaf, changed, previousValues)
+            if changed:
+                derivedModifications.update(changed)
+                # derived signals can be inputs of other derived signals
+                pending.append(changed)
+        return {key: value for key, value in derivedModifications.items() if value != previousValues[key]}
+
+    def _Compile(self, expression: PLCExpression, parent: typing.Optional[_PLCDerivedNode], leaves: typing.List[_PLCDerivedNode]) -> _PLCDerivedNode:
+        node = _PLCDerivedNode(parent)
+        if isinstance(expression, PLCEquals):
+            node.key = expression.key
+            node.expected = expression.value
+            leaves.append(node)
+        elif isinstance(expression, PLCNot):
+            # a negated conjunction of one child
+            node.negate = True
+            node.children.append(self._Compile(expression.operand, node, leaves))
+        elif isinstance(expression, PLCAnd):
+            node.isAnd = not isinstance(expression, PLCOr)
+            for operand in expression.operands:
+                node.children.append(self._Compile(operand, node, leaves))
+        else:
+            raise ValueError('unsupported expression %r' % expression)
+        return node
+
+    def _Initialize(self, node: _PLCDerivedNode) -> None:
+        """
+        Compute the counters and values of combining nodes from the values of the leaves, for a newly compiled expression.
+        """
+        if node.key is not None:
+            return
+        for child in node.children:
+            self._Initialize(child)
+        node.trueCount = sum(1 for child in node.children if child.value)
+        node.value = node.Evaluate()
+
+    def _Propagate(self, node: _PLCDerivedNode, changed: typing.Dict[str, bool], previousValues: typing.Dict[str, bool]) -> None:
+        """
+        Propagate the changed value of a node up to its derived signal, stopping as soon as a node keeps its value.
+
+        :param previousValues: Receives the value a derived signal had before it first changed.
+        """
+        while node.parent is not None:
+            parent = node.parent
+            parent.trueCount += 1 if node.value else -1
+            value = parent.Evaluate()
+            if value == parent.value:
+                return
+            parent.value = value
+            node = parent
+        previousValues.setdefault(node.derivedKey, not node.value) # type: ignore
+        changed[node.derivedKey] = node.value # type: ignore
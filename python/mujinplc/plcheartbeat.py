@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+import time
+import heapq
+import threading
+import typing # noqa: F401 # used in type check
+
+from . import plcmemory, plcmemorystats
+
+import logging
+log = logging.getLogger(__name__)
+
+class PLCHeartbeatStats:
+    """
+    Statistics of the intervals between consecutive heartbeats, to tune maxHeartbeatInterval from data. All times are in nanoseconds.
+    """
+
+    _intervals = None # type: plcmemorystats.PLCHistogram # intervals between heartbeats
+    _count = 0 # type: int # number of intervals recorded
+    _mean = 0.0 # type: float # running mean of the intervals
+    _sumSquares = 0.0 # type: float # running sum of squared differences from the mean, for the jitter
+    _disconnectCount = 0 # type: int # number of times the connection was lost
+
+    def __init__(self):
+        self._intervals = plcmemorystats.PLCHistogram()
+        self._count = 0
+        self._mean = 0.0
+        self._sumSquares = 0.0
+        self._disconnectCount = 0
+
+    def Record(self, interval: int) -> None:
+        self._intervals.Record(interval)
+        self._count += 1
+        delta = interval - self._mean
+        self._mean += delta / self._count
+        self._sumSquares += delta * (interval - self._mean)
+
+    def RecordDisconnect(self) -> None:
+        self._disconnectCount += 1
+
+    def GetStats(self) -> typing.Dict[str, typing.Any]:
+        """
+        :return: A dictionary containing the number of intervals, their mean, jitter (standard deviation), maximum gap, approximate 50th and 99th percentiles, and the number of disconnects.
+        """
+        stats = self._intervals.GetStats()
+        return {
+            'count': self._count,
+            'mean': self._mean,
+            'jitter': (self._sumSquares / self._count) ** 0.5 if self._count else 0.0,
+            'maxGap': stats['max'],
+            'p50': stats['p50'],
+            'p99': stats['p99'],
+            'disconnectCount': self._disconnectCount,
+        }
+
+class _PLCHeartbeatWatch:
+    """
+    A heartbeat signal watched by PLCHeartbeatWatchdog.
+    """
+
+    __slots__ = ('heartbeatSignal', 'maxHeartbeatInterval', 'connectedSignal', 'lastHeartbeat', 'connected', 'stats')
+
+    def __init__(self, heartbeatSignal: typing.Optional[str], maxHeartbeatInterval: float, connectedSignal: typing.Optional[str]):
+        self.heartbeatSignal = heartbeatSignal # type: typing.Optional[str] # None if any modification counts as a heartbeat
+        self.maxHeartbeatInterval = maxHeartbeatInterval # type: float
+        self.connectedSignal = connectedSignal # type: typing.Optional[str] # memory key the connection state is published to
+        self.lastHeartbeat = None # type: typing.Optional[float] # monotonic time of the last heartbeat
+        self.connected = False # type: bool
+        self.stats = PLCHeartbeatStats()
+
+class PLCHeartbeatWatchdog:
+    """
+    PLCHeartbeatWatchdog tracks heartbeats of a PLCMemory once for everyone, instead of every PLCController timing heartbeats on its own. Connect and disconnect transitions are published as a memory key and to callbacks, so controllers and logic subscribe to them instead of polling.
+
+    Example::
+
+        watchdog = PLCHeartbeatWatchdog(memory)
+        watchdog.Watch('heartbeat', 0.1, connectedSignal='isConnected')
+        watchdog.Start()
+        controller = PLCController(memory, connectedSignal='isConnected')
+
+    A heartbeat only records its timestamp. The expiries of all watched signals are kept in a timer heap served by a single thread, which checks each expiry when it is due and pushes it back if a heartbeat arrived in the meantime, so the cost of a heartbeat does not depend on how many controllers there are.
+    """
+
+    _memory = None # type: plcmemory.PLCMemory # an instance of PLCMemory
+    _watches = None # type: typing.Dict[typing.Optional[str], _PLCHeartbeatWatch] # watched heartbeat signals
+    _connectedSignals = None # type: typing.Set[str] # keys written by the watchdog, which never count as heartbeats
+    _timers = None # type: typing.List[typing.Tuple[float, int, _PLCHeartbeatWatch]] # heap of expiries of connected watches
+    _timerCount = 0 # type: int # tie breaker of timers with the same expiry
+    _transitions = None # type: typing.List[typing.Tuple[_PLCHeartbeatWatch, bool]] # transitions not yet published
+    _callbacks = None # type: typing.List[typing.Callable[[typing.Optional[str], bool], None]] # called with the heartbeat signal and the new connection state
+    _condition = None # type: threading.Condition # protects everything above, wakes up the watchdog thread
+    _thread = None # type: typing.Optional[threading.Thread] # watchdog thread
+    _isok = False # type: bool # signal that the watchdog thread should continue to run
+
+    def __init__(self, memory: plcmemory.PLCMemory):
+        self._memory = memory
+        self._watches = {}
+        self._connectedSignals = set()
+        self._timers = []
+        self._timerCount = 0
+        self._transitions = []
+        self._callbacks = []
+        self._condition = threading.Condition()
+        self._isok = False
+        memory.AddObserver(self)
+
+    def __del__(self):
+        self.Stop()
+
+    def Watch(self, heartbeatSignal: typing.Optional[str], maxHeartbeatInterval: float, connectedSignal: typing.Optional[str] = None) -> None:
+        """
+        Start watching a heartbeat signal. The connection is considered lost when the signal has not changed for maxHeartbeatInterval seconds.
+
+        :param heartbeatSignal: Name of the heartbeat signal that is changed constantly, or None if any modification counts as a heartbeat.
+        :param connectedSignal: If given, the connection state is written to this key on every transition, starting with False.
+        """
+        watch = _PLCHeartbeatWatch(heartbeatSignal, maxHeartbeatInterval, connectedSignal)
+        with self._condition:
+            self._watches[heartbeatSignal] = watch
+            if connectedSignal:
+                self._connectedSignals.add(connectedSignal)
+            self._transitions.append((watch, False))
+            self._condition.notify_all()
+
+    def OnConnectionChanged(self, callback: typing.Callable[[typing.Optional[str], bool], None]) -> None:
+        """
+        Register a callback called on the watchdog thread with the heartbeat signal and the new connection state on every transition.
+        """
+        with self._condition:
+            self._callbacks.append(callback)
+
+    def IsConnected(self, heartbeatSignal: typing.Optional[str] = None) -> bool:
+        """
+        Whether time since last heartbeat of the signal is within expectation indicating an active connection.
+        """
+        with self._condition:
+            watch = self._watches.get(heartbeatSignal)
+            return watch is not None and watch.connected
+
+    def GetHeartbeatStats(self, heartbeatSignal: typing.Optional[str] = None) -> typing.Dict[str, typing.Any]:
+        """
+        :return: Statistics of the intervals between heartbeats of the signal, see PLCHeartbeatStats.GetStats.
+        """
+        with self._condition:
+            return self._watches[heartbeatSignal].stats.GetStats()
+
+    def MemoryModified(self, modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
+        if not modifications:
+            return
+        now = time.monotonic()
+        with self._condition:
+            for heartbeatSignal, watch in self._watches.items():
+                if heartbeatSignal is None:
+                    if all(key in self._connectedSignals for key in modifications):
+                        continue
+                elif heartbeatSignal not in modifications:
+                    continue
+                if watch.lastHeartbeat is not None:
+                    watch.stats.Record(int((now - watch.lastHeartbeat) * 1000000000))
+                watch.lastHeartbeat = now
+                if not watch.connected:
+                    watch.connected = True
+                    self._PushTimer(watch)
+                    self._transitions.append((watch, True))
+                    self._condition.notify_all()
+
+    def _PushTimer(self, watch: _PLCHeartbeatWatch) -> None:
+        """
+        Has to be called under lock.
+        """
+        self._timerCount += 1
+        heapq.heappush(self._timers, (watch.lastHeartbeat + watch.maxHeartbeatInterval, self._timerCount, watch)) # type: ignore
+
+    def _ExpireTimers(self, now: float) -> None:
+        """
+        Pop due timers, and disconnect the watches that have not received a heartbeat since. Has to be called under lock.
+        """
+        while self._timers and self._timers[0][0] <= now:
+            _, _, watch = heapq.heappop(self._timers)
+            if not watch.connected or self._watches.get(watch.heartbeatSignal) is not watch:
+                continue
+            if watch.lastHeartbeat + watch.maxHeartbeatInterval > now: # type: ignore
+                # a heartbeat arrived since the timer was pushed
+                self._PushTimer(watch)
+                continue
+            watch.connected = False
+            watch.stats.RecordDisconnect()
+            self._transitions.append((watch, False))
+
+    def _Publish(self, transitions: typing.List[typing.Tuple[_PLCHeartbeatWatch, bool]], callbacks: typing.List[typing.Callable[[typing.Optional[str], bool], None]]) -> None:
+        """
+        Write transitions to the memory in a single batch and call the callbacks. Has to be called without lock, since writing notifies the watchdog itself.
+        """
+        keyvalues = {} # type: typing.Dict[str, plcmemory.PLCMemory.ValueType]
+        for watch, connected in transitions:
+            log.debug('heartbeat %s %s', watch.heartbeatSignal, 'connected' if connected else 'disconnected')
+            if watch.connectedSignal:
+                keyvalues[watch.connectedSignal] = connected
+        if keyvalues:
+            self._memory.Write(keyvalues)
+        for watch, connected in transitions:
+            for callback in callbacks:
+                try:
+                    callback(watch.heartbeatSignal, connected)
+                except Exception as e:
+                    log.exception('caught exception in connection callback of %s: %s', watch.heartbeatSignal, e)
+
+    def Start(self) -> None:
+        """
+        Start the watchdog thread.
+        """
+        self.Stop()
+
+        self._isok = True
+        self._thread = threading.Thread(target=self._RunThread, name='plcheartbeat')
+        self._thread.start()
+
+    def IsRunning(self) -> bool:
+        return self._isok
+
+    def SetStop(self) -> None:
+        with self._condition:
+            self._isok = False
+            self._condition.notify_all()
+
+    def Stop(self) -> None:
+        """
+        Stop the watchdog thread. Will block until the background thread terminates.
+        """
+        self.SetStop()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _RunThread(self) -> None:
+        while True:
+            with self._condition:
+                while self._isok:
+                    self._ExpireTimers(time.monotonic())
+                    if self._transitions:
+                        break
+                    waitTimeout = None if not self._timers else max(self._timers[0][0] - time.monotonic(), 0.0)
+                    self._condition.wait(waitTimeout)
+                if not self._isok:
+                    return
+                transitions = self._transitions
+                self._transitions = []
+                callbacks = list(self._callbacks)
+            try:
+                self._Publish(transitions, callbacks)
+            except Exception as e:
+                log.exception('caught exception when publishing heartbeat transitions: %s', e)
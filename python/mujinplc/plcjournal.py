@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import mmap
+import time
+import bisect
+import struct
+import threading
+import collections
+import typing # noqa: F401 # used in type check
+
+from . import plcmemory, plcserialization
+
+import logging
+log = logging.getLogger(__name__)
+
+_segmentMagic = b'MJPLCJNL'
+_segmentFormatVersion = 2
+_segmentHeaderFormat = '<8sIQQ' # magic, format version, monotonic and wall clock timestamps in nanoseconds when the segment was created
+_segmentHeaderSize = struct.calcsize(_segmentHeaderFormat)
+_recordHeaderFormat = '<IQQBHH' # size of the encoded key values, version, monotonic timestamp in nanoseconds, record kind, size of the writer name, size of the namespace
+_recordHeaderSize = struct.calcsize(_recordHeaderFormat)
+_indexEntryFormat = '<QQ' # monotonic timestamp in nanoseconds, offset of the record in the segment
+_indexEntrySize = struct.calcsize(_indexEntryFormat)
+
+_recordKindModifications = 0
+_recordKindSnapshot = 1 # full memory state, written at the start of every segment
+
+_segmentFilenameRegex = re.compile(r'^(\d{8})\.plcjournal$')
+
+PLCJournalRecord = collections.namedtuple('PLCJournalRecord', ['version', 'timestamp', 'writer', 'namespace', 'isSnapshot', 'keyvalues'])
+PLCJournalRecord.__doc__ = """
+A record read back from a journal. Timestamps are monotonic nanoseconds, as in PLCModifications. Snapshot records hold the full state of the memory of their namespace instead of a modification batch.
+"""
+
+def _GetSegmentPath(directory: str, segmentNumber: int) -> str:
+    return os.path.join(directory, '%08d.plcjournal' % segmentNumber)
+
+def _GetIndexPath(directory: str, segmentNumber: int) -> str:
+    return os.path.join(directory, '%08d.plcindex' % segmentNumber)
+
+def _ListSegmentNumbers(directory: str) -> typing.List[int]:
+    segmentNumbers = []
+    for filename in os.listdir(directory):
+        match = _segmentFilenameRegex.match(filename)
+        if match:
+            segmentNumbers.append(int(match.group(1)))
+    return sorted(segmentNumbers)
+
+class PLCMemoryJournal:
+    """
+    PLCMemoryJournal is an observer that appends every modification batch of a PLCMemory to a compact binary log, together with its monotonic timestamp, writer and namespace. Given a PLCMemoryArena instead of a memory, it records every memory of the arena in one log.
+
+    The log is split into segments of roughly segmentSize bytes. Every segment starts with a snapshot of the full state of every recorded memory, so it can be replayed on its own, and has a sparse index from timestamps to record offsets so that PLCJournalReader can seek without scanning.
+
+    MemoryModified only queues the batch, which may be called under the memory lock when the memory has no dispatcher. Records are encoded and written by a journal thread, so that file I/O never holds up writers. Close has to be called to write every queued record.
+    """
+
+    _directory = None # type: str # directory holding the segment and index files
+    _segmentSize = 0 # type: int # segments are rotated once they grow past this size
+    _indexInterval = 0 # type: int # approximate number of bytes between index entries
+    _lock = None # type: threading.Lock # protects the files against Flush and Close from other threads
+    _condition = None # type: threading.Condition # protects _pending and the counts, wakes up the journal thread and Flush
+    _pending = None # type: typing.Deque[plcmemory.PLCModifications] # batches not yet written, in the order they were notified
+    _queuedCount = 0 # type: int # number of batches queued so far
+    _writtenCount = 0 # type: int # number of batches written so far
+    _thread = None # type: typing.Optional[threading.Thread] # journal thread writing the queued batches
+    _isok = False # type: bool # whether the journal is still recording
+    _states = None # type: typing.Dict[str, typing.Dict[str, plcmemory.PLCMemory.ValueType]] # mirror of each recorded memory by namespace, written as the snapshots of every new segment
+    _versions = None # type: typing.Dict[str, int] # version of each recorded memory by namespace
+    _lastTimestamp = 0 # type: int # timestamp of the last record, records of different memories are kept in timestamp order
+    _segmentNumber = 0 # type: int # number of the current segment
+    _segmentFile = None # type: typing.Optional[typing.BinaryIO] # current segment file
+    _indexFile = None # type: typing.Optional[typing.BinaryIO] # index file of the current segment
+    _segmentOffset = 0 # type: int # size of the current segment
+    _indexedOffset = 0 # type: int # offset of the last indexed record in the current segment
+
+    def __init__(self, memory: typing.Any, directory: str, segmentSize: int = 64 * 1024 * 1024, indexInterval: int = 64 * 1024):
+        """
+        :param memory: PLCMemory or PLCMemoryArena to record.
+        :param directory: Directory to write the journal to. Existing segments are kept, new segments are numbered after them.
+        :param segmentSize: Size in bytes after which a new segment is started.
+        :param indexInterval: Approximate number of bytes between entries of the sparse time index.
+        """
+        self._directory = directory
+        self._segmentSize = segmentSize
+        self._indexInterval = indexInterval
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._pending = collections.deque()
+        self._states = {}
+        self._versions = {}
+        os.makedirs(directory, exist_ok=True)
+        segmentNumbers = _ListSegmentNumbers(directory)
+        self._segmentNumber = segmentNumbers[-1] + 1 if segmentNumbers else 0
+        self._isok = True
+        # daemon, so that a journal that is never closed does not keep the interpreter alive
+        self._thread = threading.Thread(target=self._RunThread, name='plcjournal', daemon=True)
+        self._thread.start()
+        memory.AddObserver(self)
+
+    def __del__(self):
+        self.Close()
+
+    def Flush(self) -> None:
+        """
+        Write every batch queued so far, and flush buffered records to the files.
+        """
+        with self._condition:
+            queuedCount = self._queuedCount
+            while self._writtenCount < queuedCount:
+                self._condition.wait()
+        with self._lock:
+            if self._segmentFile is not None:
+                self._segmentFile.flush()
+                self._indexFile.flush() # type: ignore
+
+    def Close(self) -> None:
+        """
+        Stop recording, write every queued batch and close the current segment. Will block until the journal thread terminates.
+        """
+        with self._condition:
+            self._isok = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._CloseSegment()
+
+    def MemoryModified(self, modifications: plcmemory.PLCModifications) -> None:
+        with self._condition:
+            if not self._isok:
+                return
+            self._pending.append(modifications)
+            self._queuedCount += 1
+            self._condition.notify_all()
+
+    def _RunThread(self) -> None:
+        while True:
+            with self._condition:
+                while self._isok and not self._pending:
+                    self._condition.wait()
+                if not self._pending:
+                    # stopped, and everything queued is written
+                    return
+                batches = list(self._pending)
+                self._pending.clear()
+
+            with self._lock:
+                for modifications in batches:
+                    try:
+                        self._WriteBatch(modifications)
+                    except Exception as e:
+                        log.exception('caught exception when writing journal record to %s: %s', self._directory, e)
+
+            with self._condition:
+                self._writtenCount += len(batches)
+                self._condition.notify_all()
+
+    def _WriteBatch(self, modifications: plcmemory.PLCModifications) -> None:
+        """
+        Append a modification batch to the current segment, rotating segments as needed. Has to be called under lock by the journal thread.
+        """
+        namespace = modifications.namespace
+        # notifications of different memories can arrive slightly out of order
+        timestamp = self._lastTimestamp = max(modifications.timestamp, self._lastTimestamp)
+        self._versions[namespace] = modifications.version
+        state = self._states.get(namespace)
+        if state is None:
+            # first notification of every memory is its current state
+            self._states[namespace] = dict(modifications)
+            if self._segmentFile is None:
+                self._OpenSegment(timestamp)
+            else:
+                self._AppendRecord(_recordKindSnapshot, modifications.version, timestamp, '', namespace, modifications)
+            return
+
+        state.update(modifications)
+        self._AppendRecord(_recordKindModifications, modifications.version, timestamp, modifications.writer, namespace, modifications)
+        if self._segmentOffset >= self._segmentSize:
+            self._CloseSegment()
+            self._segmentNumber += 1
+            self._OpenSegment(timestamp)
+
+    def _OpenSegment(self, timestamp: int) -> None:
+        self._segmentFile = open(_GetSegmentPath(self._directory, self._segmentNumber), 'wb')
+        self._indexFile = open(_GetIndexPath(self._directory, self._segmentNumber), 'wb')
+        self._segmentFile.write(struct.pack(_segmentHeaderFormat, _segmentMagic, _segmentFormatVersion, timestamp, int(time.time() * 1000000000)))
+        self._segmentOffset = _segmentHeaderSize
+        self._indexedOffset = -self._indexInterval
+        for namespace, state in self._states.items():
+            self._AppendRecord(_recordKindSnapshot, self._versions[namespace], timestamp, '', namespace, state)
+
+    def _CloseSegment(self) -> None:
+        if self._segmentFile is not None:
+            self._segmentFile.close()
+            self._indexFile.close() # type: ignore
+            self._segmentFile = None
+            self._indexFile = None
+
+    def _AppendRecord(self, kind: int, version: int, timestamp: int, writer: str, namespace: str, keyvalues: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
+        encodedWriter = writer.encode('utf-8')
+        encodedNamespace = namespace.encode('utf-8')
+        encodedKeyValues = plcserialization.EncodeKeyValues(keyvalues)
+        if self._segmentOffset - self._indexedOffset >= self._indexInterval:
+            self._indexFile.write(struct.pack(_indexEntryFormat, timestamp, self._segmentOffset)) # type: ignore
+            self._indexedOffset = self._segmentOffset
+        self._segmentFile.write(struct.pack(_recordHeaderFormat, len(encodedKeyValues), version, timestamp, kind, len(encodedWriter), len(encodedNamespace))) # type: ignore
+        self._segmentFile.write(encodedWriter) # type: ignore
+        self._segmentFile.write(encodedNamespace) # type: ignore
+        self._segmentFile.write(encodedKeyValues) # type: ignore
+        self._segmentOffset += _recordHeaderSize + len(encodedWriter) + len(encodedNamespace) + len(encodedKeyValues)
+
+class PLCJournalReader:
+    """
+    PLCJournalReader reads back a journal written by PLCMemoryJournal. Seeking to a timestamp takes a binary search over the segments followed by a binary search over the sparse index of one segment.
+    """
+
+    _directory = None # type: str
+    _segmentNumbers = None # type: typing.List[int] # numbers of the non-empty segments, in order
+    _segmentTimestamps = None # type: typing.List[int] # timestamp of the first record of each segment
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._segmentNumbers = []
+        self._segmentTimestamps = []
+        for segmentNumber in _ListSegmentNumbers(directory):
+            for record in self._ReadSegment(segmentNumber, _segmentHeaderSize):
+                self._segmentNumbers.append(segmentNumber)
+                self._segmentTimestamps.append(record[1].timestamp)
+                break
+
+    def GetSegmentCount(self) -> int:
+        return len(self._segmentNumbers)
+
+    def GetTimeRange(self) -> typing.Optional[typing.Tuple[int, int]]:
+        """
+        Timestamps of the first and last records in the journal, or None if the journal is empty.
+        """
+        if not self._segmentNumbers:
+            return None
+        lastTimestamp = self._segmentTimestamps[-1]
+        # scan from the last index entry of the last segment
+        for offset, record in self._ReadSegment(self._segmentNumbers[-1], self._SeekSegment(len(self._segmentNumbers) - 1, 1 << 64)):
+            lastTimestamp = record.timestamp
+        return self._segmentTimestamps[0], lastTimestamp
+
+    def ReadRecords(self, start: typing.Optional[int] = None, end: typing.Optional[int] = None) -> typing.Iterator[PLCJournalRecord]:
+        """
+        Iterate over the records with a timestamp between start and end, inclusive.
+
+        :param start: Monotonic timestamp in nanoseconds to start at, or None to start at the beginning of the journal.
+        :param end: Monotonic timestamp in nanoseconds to stop at, or None to read until the end of the journal.
+        """
+        if not self._segmentNumbers:
+            return
+        segmentPosition = 0
+        offset = _segmentHeaderSize
+        if start is not None:
+            segmentPosition = max(0, bisect.bisect_left(self._segmentTimestamps, start) - 1)
+            offset = self._SeekSegment(segmentPosition, start)
+        for segmentNumber in self._segmentNumbers[segmentPosition:]:
+            for offset, record in self._ReadSegment(segmentNumber, offset):
+                if start is not None and record.timestamp < start:
+                    continue
+                if end is not None and record.timestamp > end:
+                    return
+                yield record
+            offset = _segmentHeaderSize
+
+    def Replay(self, memory: typing.Any, start: typing.Optional[int] = None, end: typing.Optional[int] = None, speed: typing.Optional[float] = 1.0, namespace: typing.Optional[str] = None) -> int:
+        """
+        Replay the journal into a memory. The memory is first brought to the state it had at the start timestamp, then the recorded modifications are written with their original pacing.
+
+        :param memory: PLCMemory to replay into, or PLCMemoryArena to replay every namespace into the memory of the same namespace, creating it if needed.
+        :param start: Monotonic timestamp in nanoseconds to start at, or None to start at the beginning of the journal.
+        :param end: Monotonic timestamp in nanoseconds to stop at, or None to replay until the end of the journal.
+        :param speed: Replay speed relative to the recording, for example 1.0 for real time or 10.0 for ten times faster. None to replay as fast as possible.
+        :param namespace: If given, only replay the records of this namespace.
+        :return: Number of records replayed after the start timestamp.
+        """
+        if not self._segmentNumbers:
+            return 0
+
+        # rebuild the state at the start timestamp from the snapshots at the beginning of its segment
+        segmentPosition = 0
+        if start is not None:
+            segmentPosition = max(0, bisect.bisect_left(self._segmentTimestamps, start) - 1)
+        states = {} # type: typing.Dict[str, typing.Dict[str, plcmemory.PLCMemory.ValueType]]
+        replayStart = None # type: typing.Optional[typing.Tuple[int, float]] # recorded timestamp and local monotonic time when replay started
+        count = 0
+        for segmentNumber in self._segmentNumbers[segmentPosition:]:
+            for offset, record in self._ReadSegment(segmentNumber, _segmentHeaderSize):
+                if namespace is not None and record.namespace != namespace:
+                    continue
+                if replayStart is None:
+                    if start is not None and record.timestamp < start:
+                        states.setdefault(record.namespace, {}).update(record.keyvalues)
+                        continue
+                    self._WriteStates(memory, states)
+                    replayStart = (record.timestamp, time.monotonic())
+                if end is not None and record.timestamp > end:
+                    return count
+                if speed is not None:
+                    delay = replayStart[1] + (record.timestamp - replayStart[0]) / 1e9 / speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                self._GetReplayMemory(memory, record.namespace).Write(record.keyvalues)
+                count += 1
+        if replayStart is None:
+            self._WriteStates(memory, states)
+        return count
+
+    def _SeekSegment(self, segmentPosition: int, timestamp: int) -> int:
+        """
+        Offset in the segment of the last indexed record before the timestamp, from which records can be scanned.
+        """
+        entries = []
+        try:
+            with open(_GetIndexPath(self._directory, self._segmentNumbers[segmentPosition]), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return _segmentHeaderSize
+        for entryOffset in range(0, len(data) - _indexEntrySize + 1, _indexEntrySize):
+            entries.append(struct.unpack_from(_indexEntryFormat, data, entryOffset))
+        position = bisect.bisect_left(entries, (timestamp, 0)) - 1
+        if position < 0:
+            return _segmentHeaderSize
+        return entries[position][1]
+
+    def _ReadSegment(self, segmentNumber: int, offset: int) -> typing.Iterator[typing.Tuple[int, PLCJournalRecord]]:
+        """
+        Iterate over the records of a segment starting at the offset, yielding the offset of each record together with the record. Stops at a truncated record at the end of the segment.
+        """
+        path = _GetSegmentPath(self._directory, segmentNumber)
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _segmentHeaderSize:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                magic, formatVersion, createdTimestamp, createdTime = struct.unpack_from(_segmentHeaderFormat, buffer, 0)
+                if magic != _segmentMagic or formatVersion != _segmentFormatVersion:
+                    raise ValueError('%s is not a plc memory journal segment' % path)
+                while offset + _recordHeaderSize <= size:
+                    keyvaluesSize, version, timestamp, kind, writerSize, namespaceSize = struct.unpack_from(_recordHeaderFormat, buffer, offset)
+                    namespaceOffset = offset + _recordHeaderSize + writerSize
+                    keyvaluesOffset = namespaceOffset + namespaceSize
+                    if keyvaluesOffset + keyvaluesSize > size:
+                        log.warn('journal segment %s is truncated at offset %d', path, offset)
+                        return
+                    writer = bytes(buffer[offset + _recordHeaderSize:namespaceOffset]).decode('utf-8')
+                    namespace = bytes(buffer[namespaceOffset:keyvaluesOffset]).decode('utf-8')
+                    keyvalues, _ = plcserialization.DecodeKeyValues(buffer, keyvaluesOffset)
+                    yield offset, PLCJournalRecord(version, timestamp, writer, namespace, kind == _recordKindSnapshot, keyvalues)
+                    offset = keyvaluesOffset + keyvaluesSize
+
+    def _WriteStates(self, memory: typing.Any, states: typing.Mapping[str, typing.Mapping[str, plcmemory.PLCMemory.ValueType]]) -> None:
+        for namespace, state in states.items():
+            if state:
+                self._GetReplayMemory(memory, namespace).Write(state)
+
+    def _GetReplayMemory(self, memory: typing.Any, namespace: str) -> plcmemory.PLCMemory:
+        """
+        Memory to replay the records of a namespace into. When replaying into an arena, the memory of the namespace is created if it does not exist yet.
+        """
+        if isinstance(memory, plcmemory.PLCMemory):
+            return memory
+        try:
+            return memory.GetMemory(namespace)
+        except KeyError:
+            return memory.CreateMemory(namespace)
@@ -3,9 +3,12 @@
 import typing # noqa: F401 # used in type check
 import enum
 
-from . import plccontroller
+from . import plcmemory, plccontroller, plcasynccontroller
 from . import PLCDataObject
 
+import logging
+log = logging.getLogger(__name__)
+
 class PLCWaitTimeout(Exception):
     """
     Timed out when waiting for some signal to change to expected state.
@@ -195,16 +198,144 @@ class PLCStartOrderCycleParameters(PLCDataObject):
     placeContainerId = '' # type: str # barcode of the dest contianer, for example: "pallet1"
     placeContainerType = '' # type: str # type of the source container, if all the same, set to ""
 
-class PLCLogic:
+class PLCStatusReader:
     """
-    MUJIN specific PLC logic implementation.
+    Fills a status object from a single consistent state snapshot in one pass. The keys to read and how to convert each of them are worked out once, so that polling status at high rates costs one GetMultiple per read.
+
+    Example::
+
+        reader = PLCStatusReader(PLCOrderCycleStatus, {'orderCycleFinishCode': PLCOrderCycleFinishCode})
+        status = reader.Read(controller)
     """
 
-    _controller = None # type: plccontroller.PLCController # an instance of PLCController
+    _statusType = None # type: typing.Type[PLCDataObject] # class of the status object to fill
+    _keys = None # type: typing.List[str] # keys to read, the attribute names of the status
+    _fields = None # type: typing.List[typing.Tuple[str, type, typing.Any, typing.Optional[typing.Callable[[typing.Any], typing.Any]]]] # key, expected value type, default value and conversion of each attribute
 
-    def __init__(self, controller: plccontroller.PLCController):
+    def __init__(self, statusType: typing.Type[PLCDataObject], conversions: typing.Optional[typing.Mapping[str, typing.Callable[[typing.Any], typing.Any]]] = None):
+        """
+        :param statusType: A PLCDataObject whose public attributes are named after the signals they are read from.
+        :param conversions: Conversion applied to the value of some attributes, such as an enum type. Values of these attributes are read as integers.
+        """
+        conversions = conversions or {}
+        self._statusType = statusType
+        self._keys = []
+        self._fields = []
+        for key in dir(statusType):
+            if key.startswith('_'):
+                continue
+            defaultValue = getattr(statusType, key)
+            conversion = conversions.get(key)
+            if conversion is not None:
+                valueType = int # type: type
+                defaultValue = int(defaultValue)
+            else:
+                valueType = type(defaultValue)
+            self._keys.append(key)
+            self._fields.append((key, valueType, defaultValue, conversion))
+
+    def GetKeys(self) -> typing.List[str]:
+        return list(self._keys)
+
+    def Read(self, controller: typing.Any) -> PLCDataObject:
+        """
+        Read the status from the current state snapshot of a PLCController or AsyncPLCController.
+        """
+        return self.ReadFrom(controller.GetMultiple(self._keys))
+
+    def ReadFrom(self, keyvalues: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> PLCDataObject:
+        """
+        Fill the status from values already read. Values of the wrong type are replaced by the default value, the same way as GetBoolean, GetInteger and GetString do.
+        """
+        values = {}
+        for key, valueType, defaultValue, conversion in self._fields:
+            value = keyvalues.get(key, defaultValue)
+            if not isinstance(value, valueType):
+                value = defaultValue
+            values[key] = value if conversion is None else conversion(value)
+        status = self._statusType()
+        status.__dict__.update(values)
+        return status
+
+class _PLCLogicBase:
+    """
+    Signals and wait conditions shared by PLCLogic and AsyncPLCLogic.
+    """
+
+    _controller = None # type: typing.Any # an instance of PLCController or AsyncPLCController
+
+    # wait conditions, compiled once
+    _orderCycleReadyPredicate = None # type: plccontroller.PLCWaitPredicate
+    _orderCycleRunningPredicate = None # type: plccontroller.PLCWaitPredicate
+    _orderCycleStoppedPredicate = None # type: plccontroller.PLCWaitPredicate
+    _stoppedPredicate = None # type: plccontroller.PLCWaitPredicate
+    _moveToHomeReadyPredicate = None # type: plccontroller.PLCWaitPredicate
+    _robotMovingPredicates = None # type: typing.Dict[bool, plccontroller.PLCWaitPredicate] # by expected isRobotMoving
+    _preparationCycleReadyPredicate = None # type: plccontroller.PLCWaitPredicate
+    _preparationCycleRunningPredicate = None # type: plccontroller.PLCWaitPredicate
+    _preparationCycleStoppedPredicate = None # type: plccontroller.PLCWaitPredicate
+
+    # status readers, compiled once
+    _orderCycleStatusReader = None # type: PLCStatusReader
+    _preparationCycleStatusReader = None # type: PLCStatusReader
+    _errorKeys = ['isError', 'errorcode', 'detailedErrorCode'] # type: typing.List[str] # read together by CheckError
+
+    def __init__(self, controller: typing.Any):
         self._controller = controller
 
+        self._orderCycleStatusReader = PLCStatusReader(PLCOrderCycleStatus, {'orderCycleFinishCode': PLCOrderCycleFinishCode})
+        self._preparationCycleStatusReader = PLCStatusReader(PLCPreparationCycleStatus, {'preparationFinishCode': PLCPreparationFinishCode})
+
+        # every wait also ends when MUJIN controller is in error
+        exceptions = {'isError': True}
+        self._orderCycleReadyPredicate = plccontroller.PLCWaitPredicate({
+            'isRunningOrderCycle': False,
+            'isRobotMoving': False,
+            'isModeAuto': True,
+            'isSystemReady': True,
+            'isCycleReady': True,
+        }, exceptions)
+        self._orderCycleRunningPredicate = plccontroller.PLCWaitPredicate({
+            'isRunningOrderCycle': True,
+        }, exceptions)
+        self._orderCycleStoppedPredicate = plccontroller.PLCWaitPredicate({
+            'isRunningOrderCycle': False,
+        }, exceptions)
+        self._stoppedPredicate = plccontroller.PLCWaitPredicate({
+            'isRunningOrderCycle': False,
+            'isRobotMoving': False,
+        }, exceptions)
+        self._moveToHomeReadyPredicate = plccontroller.PLCWaitPredicate({
+            'isRunningOrderCycle': False,
+            'isRobotMoving': False,
+            'isModeAuto': True,
+            'isSystemReady': True,
+        }, exceptions)
+        self._robotMovingPredicates = {
+            isRobotMoving: plccontroller.PLCWaitPredicate({
+                'isRobotMoving': isRobotMoving,
+            }, exceptions)
+            for isRobotMoving in (True, False)
+        }
+        self._preparationCycleReadyPredicate = plccontroller.PLCWaitPredicate({
+            'isRunningPreparation': False,
+            'isModeAuto': True,
+            'isSystemReady': True,
+            'isCycleReady': True,
+        }, exceptions)
+        self._preparationCycleRunningPredicate = plccontroller.PLCWaitPredicate({
+            'isRunningPreparation': True,
+        }, exceptions)
+        self._preparationCycleStoppedPredicate = plccontroller.PLCWaitPredicate({
+            'isRunningPreparation': False,
+        }, exceptions)
+
+    def GetController(self) -> typing.Any:
+        """
+        Controller the logic reads and writes signals through.
+        """
+        return self._controller
+
     def ClearAllSignals(self) -> None:
         """
         Clear all signals to the MUJIN controller. Set them all to false.
@@ -222,13 +353,6 @@ class PLCLogic:
             'resetError': False,
         })
 
-    def WaitUntilConnected(self, timeout: typing.Optional[float] = None) -> None:
-        """
-        Block until connection from MUJIN controller is detected.
-        """
-        if not self._controller.WaitUntilConnected(timeout=timeout):
-            raise PLCWaitTimeout()
-
     def IsError(self) -> bool:
         """
         Whether MUJIN controller is in error.
@@ -239,10 +363,76 @@ class PLCLogic:
         """
         Check if there is an error set by MUJIN controller in the current state. If so, raise a PLCError exception.
         """
-        if self.IsError():
-            errorCode = PLCErrorCode(self._controller.GetInteger('errorcode'))
-            errorDetail = self._controller.GetString('detailedErrorCode')
-            raise PLCError(errorCode, errorDetail)
+        keyvalues = self._controller.GetMultiple(self._errorKeys)
+        if keyvalues.get('isError') is True:
+            errorCode = keyvalues.get('errorcode', 0)
+            errorDetail = keyvalues.get('detailedErrorCode', '')
+            raise PLCError(PLCErrorCode(errorCode if isinstance(errorCode, int) else 0), errorDetail if isinstance(errorDetail, str) else '')
+
+    def GetOrderCycleStatus(self) -> PLCOrderCycleStatus:
+        """
+        Gather order cycle status information in the current state.
+        """
+        return self._orderCycleStatusReader.Read(self._controller) # type: ignore
+
+    def GetPreparationCycleStatus(self) -> PLCPreparationCycleStatus:
+        """
+        Gather preparation cycle status information in the current state.
+        """
+        return self._preparationCycleStatusReader.Read(self._controller) # type: ignore
+
+    def GetStartOrderCycleSignals(self, startOrderCycleParameters: PLCStartOrderCycleParameters) -> typing.Dict[str, plcmemory.PLCMemory.ValueType]:
+        """
+        Signals written to start an order cycle, including the startOrderCycle trigger.
+        """
+        return {
+            'orderUniqueId': startOrderCycleParameters.uniqueId,
+            'orderPartType': startOrderCycleParameters.partType,
+            'orderNumber': startOrderCycleParameters.orderNumber,
+            'orderRobotName': startOrderCycleParameters.robotName,
+            'orderPickLocation': startOrderCycleParameters.pickLocationIndex,
+            'orderPickContainerId': startOrderCycleParameters.pickContainerId,
+            'orderPickContainerType': startOrderCycleParameters.pickContainerType,
+            'orderPlaceLocation': startOrderCycleParameters.placeLocationIndex,
+            'orderPlaceContainerId': startOrderCycleParameters.placeContainerId,
+            'orderPlaceContainerType': startOrderCycleParameters.placeContainerType,
+            'startOrderCycle': True,
+        }
+
+    def GetStartPreparationCycleSignals(self, startPreparationCycleParameters: PLCStartPreparationCycleParameters) -> typing.Dict[str, plcmemory.PLCMemory.ValueType]:
+        """
+        Signals written to start a preparation cycle, including the startPreparation trigger.
+        """
+        return {
+            'preparationUniqueId': startPreparationCycleParameters.uniqueId,
+            'preparationPartType': startPreparationCycleParameters.partType,
+            'preparationOrderNumber': startPreparationCycleParameters.orderNumber,
+            'preparationRobotName': startPreparationCycleParameters.robotName,
+            'preparationPickLocation': startPreparationCycleParameters.pickLocationIndex,
+            'preparationPickContainerId': startPreparationCycleParameters.pickContainerId,
+            'preparationPickContainerType': startPreparationCycleParameters.pickContainerType,
+            'preparationPlaceLocation': startPreparationCycleParameters.placeLocationIndex,
+            'preparationPlaceContainerId': startPreparationCycleParameters.placeContainerId,
+            'preparationPlaceContainerType': startPreparationCycleParameters.placeContainerType,
+            'startPreparation': True,
+        }
+
+class PLCLogic(_PLCLogicBase):
+    """
+    MUJIN specific PLC logic implementation.
+    """
+
+    _controller = None # type: plccontroller.PLCController # an instance of PLCController
+
+    def __init__(self, controller: plccontroller.PLCController):
+        super(PLCLogic, self).__init__(controller)
+
+    def WaitUntilConnected(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        Block until connection from MUJIN controller is detected.
+        """
+        if not self._controller.WaitUntilConnected(timeout=timeout):
+            raise PLCWaitTimeout()
 
     def ResetError(self, timeout: typing.Optional[float] = None) -> None:
         """
@@ -259,15 +449,7 @@ class PLCLogic:
         """
         Block until MUJIN controller is ready to start order cycle.
         """
-        if not self._controller.WaitUntilAllOrAny({
-            'isRunningOrderCycle': False,
-            'isRobotMoving': False,
-            'isModeAuto': True,
-            'isSystemReady': True,
-            'isCycleReady': True,
-        }, {
-            'isError': True,
-        }, timeout=timeout):
+        if not self._controller.WaitUntilPredicate(self._orderCycleReadyPredicate, timeout=timeout):
             raise PLCWaitTimeout()
         self.CheckError()
 
@@ -275,42 +457,22 @@ class PLCLogic:
         """
         Start order cycle. Block until MUJIN controller acknowledge the start command.
         """
-        self._controller.SetMultiple({
-            'orderUniqueId': startOrderCycleParameters.uniqueId,
-            'orderPartType': startOrderCycleParameters.partType,
-            'orderNumber': startOrderCycleParameters.orderNumber,
-            'orderRobotName': startOrderCycleParameters.robotName,
-            'orderPickLocation': startOrderCycleParameters.pickLocationIndex,
-            'orderPickContainerId': startOrderCycleParameters.pickContainerId,
-            'orderPickContainerType': startOrderCycleParameters.pickContainerType,
-            'orderPlaceLocation': startOrderCycleParameters.placeLocationIndex,
-            'orderPlaceContainerId': startOrderCycleParameters.placeContainerId,
-            'orderPlaceContainerType': startOrderCycleParameters.placeContainerType,
-            'startOrderCycle': True,
-        })
+        self._controller.SetMultiple(self.GetStartOrderCycleSignals(startOrderCycleParameters))
         try:
-            if not self._controller.WaitUntilAllOrAny({
-                'isRunningOrderCycle': True,
-            }, {
-                'isError': True,
-            }, timeout=timeout):
+            if not self._controller.WaitUntilPredicate(self._orderCycleRunningPredicate, timeout=timeout):
                 raise PLCWaitTimeout()
         finally:
             self._controller.Set('startOrderCycle', False)
         self.CheckError()
         return self.GetOrderCycleStatus()
 
-    def GetOrderCycleStatus(self) -> PLCOrderCycleStatus:
+    def WaitUntilOrderCycleRunning(self, timeout: typing.Optional[float] = None) -> None:
         """
-        Gather order cycle status information in the current state.
+        Block until MUJIN controller acknowledges a start command by running the order cycle.
         """
-        return PLCOrderCycleStatus(
-            isRunningOrderCycle = self._controller.GetBoolean('isRunningOrderCycle'),
-            isRobotMoving = self._controller.GetBoolean('isRobotMoving'),
-            numLeftInOrder = self._controller.GetInteger('numLeftInOrder'),
-            numPutInDestination = self._controller.GetInteger('numPutInDestination'),
-            orderCycleFinishCode = PLCOrderCycleFinishCode(self._controller.GetInteger('orderCycleFinishCode')),
-        )
+        if not self._controller.WaitUntilPredicate(self._orderCycleRunningPredicate, timeout=timeout):
+            raise PLCWaitTimeout()
+        self.CheckError()
 
     def WaitForOrderCycleStatusChange(self, timeout: typing.Optional[float] = None) -> PLCOrderCycleStatus:
         """
@@ -333,11 +495,7 @@ class PLCLogic:
         """
         Block until MUJIN controller finishes the order cycle.
         """
-        if not self._controller.WaitUntilAllOrAny({
-            'isRunningOrderCycle': False,
-        }, {
-            'isError': True,
-        }, timeout=timeout):
+        if not self._controller.WaitUntilPredicate(self._orderCycleStoppedPredicate, timeout=timeout):
             raise PLCWaitTimeout()
         self.CheckError()
         return self.GetOrderCycleStatus()
@@ -348,11 +506,7 @@ class PLCLogic:
         """
         self._controller.Set('stopOrderCycle', True)
         try:
-            if not self._controller.WaitUntilAllOrAny({
-                'isRunningOrderCycle': False,
-            }, {
-                'isError': True,
-            }, timeout=timeout):
+            if not self._controller.WaitUntilPredicate(self._orderCycleStoppedPredicate, timeout=timeout):
                 raise PLCWaitTimeout()
         finally:
             self._controller.Set('stopOrderCycle', False)
@@ -365,12 +519,7 @@ class PLCLogic:
         """
         self._controller.Set('stopImmediately', True)
         try:
-            if not self._controller.WaitUntilAllOrAny({
-                'isRunningOrderCycle': False,
-                'isRobotMoving': False,
-            }, {
-                'isError': True,
-            }, timeout=timeout):
+            if not self._controller.WaitUntilPredicate(self._stoppedPredicate, timeout=timeout):
                 raise PLCWaitTimeout()
         finally:
             self._controller.Set('stopImmediately', False)
@@ -380,14 +529,7 @@ class PLCLogic:
         """
         Block until MUJIN controller is ready to move robot to home position.
         """
-        if not self._controller.WaitUntilAllOrAny({
-            'isRunningOrderCycle': False,
-            'isRobotMoving': False,
-            'isModeAuto': True,
-            'isSystemReady': True,
-        }, {
-            'isError': True,
-        }, timeout=timeout):
+        if not self._controller.WaitUntilPredicate(self._moveToHomeReadyPredicate, timeout=timeout):
             raise PLCWaitTimeout()
         self.CheckError()
 
@@ -397,11 +539,7 @@ class PLCLogic:
         """
         self._controller.Set('startMoveToHome', True)
         try:
-            if not self._controller.WaitUntilAllOrAny({
-                'isRobotMoving': True,
-            }, {
-                'isError': True,
-            }, timeout=timeout):
+            if not self._controller.WaitUntilPredicate(self._robotMovingPredicates[True], timeout=timeout):
                 raise PLCWaitTimeout()
         finally:
             self._controller.Set('startMoveToHome', False)
@@ -411,11 +549,7 @@ class PLCLogic:
         """
         Block until the robot moving state is expected.
         """
-        if not self._controller.WaitUntilAllOrAny({
-            'isRobotMoving': isRobotMoving,
-        }, {
-            'isError': True,
-        }, timeout=timeout):
+        if not self._controller.WaitUntilPredicate(self._robotMovingPredicates[isRobotMoving], timeout=timeout):
             raise PLCWaitTimeout()
         self.CheckError()
 
@@ -423,14 +557,7 @@ class PLCLogic:
         """
         Block until MUJIN controller is ready to start preparation cycle.
         """
-        if not self._controller.WaitUntilAllOrAny({
-            'isRunningPreparation': False,
-            'isModeAuto': True,
-            'isSystemReady': True,
-            'isCycleReady': True,
-        }, {
-            'isError': True,
-        }, timeout=timeout):
+        if not self._controller.WaitUntilPredicate(self._preparationCycleReadyPredicate, timeout=timeout):
             raise PLCWaitTimeout()
         self.CheckError()
 
@@ -438,40 +565,15 @@ class PLCLogic:
         """
         Start preparation cycle. Block until MUJIN controller acknowledge the start command.
         """
-        self._controller.SetMultiple({
-            'preparationUniqueId': startPreparationCycleParameters.uniqueId,
-            'preparationPartType': startPreparationCycleParameters.partType,
-            'preparationOrderNumber': startPreparationCycleParameters.orderNumber,
-            'preparationRobotName': startPreparationCycleParameters.robotName,
-            'preparationPickLocation': startPreparationCycleParameters.pickLocationIndex,
-            'preparationPickContainerId': startPreparationCycleParameters.pickContainerId,
-            'preparationPickContainerType': startPreparationCycleParameters.pickContainerType,
-            'preparationPlaceLocation': startPreparationCycleParameters.placeLocationIndex,
-            'preparationPlaceContainerId': startPreparationCycleParameters.placeContainerId,
-            'preparationPlaceContainerType': startPreparationCycleParameters.placeContainerType,
-            'startPreparation': True,
-        })
+        self._controller.SetMultiple(self.GetStartPreparationCycleSignals(startPreparationCycleParameters))
         try:
-            if not self._controller.WaitUntilAllOrAny({
-                'isRunningPreparation': True,
-            }, {
-                'isError': True,
-            }, timeout=timeout):
+            if not self._controller.WaitUntilPredicate(self._preparationCycleRunningPredicate, timeout=timeout):
                 raise PLCWaitTimeout()
         finally:
             self._controller.Set('startPreparation', False)
         self.CheckError()
         return self.GetPreparationCycleStatus()
 
-    def GetPreparationCycleStatus(self) -> PLCPreparationCycleStatus:
-        """
-        Gather preparation cycle status information in the current state.
-        """
-        return PLCPreparationCycleStatus(
-            isRunningPreparation = self._controller.GetBoolean('isRunningPreparation'),
-            preparationFinishCode = PLCOrderCycleFinishCode(self._controller.GetInteger('preparationFinishCode')),
-        )
-
     def WaitForPreparationCycleStatusChange(self, timeout: typing.Optional[float] = None) -> PLCPreparationCycleStatus:
         """
         Block until values in preparation cycle status changes.
@@ -490,11 +592,7 @@ class PLCLogic:
         """
         Block until MUJIN controller finishes the preparation cycle.
         """
-        if not self._controller.WaitUntilAllOrAny({
-            'isRunningPreparation': False,
-        }, {
-            'isError': True,
-        }, timeout=timeout):
+        if not self._controller.WaitUntilPredicate(self._preparationCycleStoppedPredicate, timeout=timeout):
             raise PLCWaitTimeout()
         self.CheckError()
         return self.GetPreparationCycleStatus()
@@ -505,11 +603,294 @@ class PLCLogic:
         """
         self._controller.Set('stopPreparation', True)
         try:
-            if not self._controller.WaitUntilAllOrAny({
-                'isRunningPreparation': False,
-            }, {
-                'isError': True,
-            }, timeout=timeout):
+            if not self._controller.WaitUntilPredicate(self._preparationCycleStoppedPredicate, timeout=timeout):
+                raise PLCWaitTimeout()
+        finally:
+            self._controller.Set('stopPreparation', False)
+        self.CheckError()
+        return self.GetPreparationCycleStatus()
+
+class PLCOrderCyclePipeline:
+    """
+    Runs consecutive order cycles back to back. While a cycle is running, the parameters of the next order are validated and its start signals prepared, so that the next start is written in a single batch as soon as MUJIN controller is ready again, instead of only after the caller has seen the previous cycle finish.
+
+    Example::
+
+        pipeline = PLCOrderCyclePipeline(logic)
+        for status in pipeline.Run(orders, timeout=60.0):
+            print(status)
+        print(pipeline.GetGapStats())
+
+    An order taken from the iterable stays staged until MUJIN controller acknowledges its start. If Run stops before that, because of a timeout, an error, or the caller no longer iterating, the start trigger is lowered and the order is left staged. Run refuses to start while an order is staged, so that it is never started behind the back of the caller: DiscardStagedOrder returns it, to be passed to Run again or dropped.
+
+    The gap between cycles is measured from the write that lowered isRunningOrderCycle to the write that raised it again for the next order.
+    """
+
+    _logic = None # type: PLCLogic # an instance of PLCLogic
+    _edgeController = None # type: plccontroller.PLCController # tracks the edges of isRunningOrderCycle, to time the gaps, its state is never read
+    _stagedOrder = None # type: typing.Optional[PLCStartOrderCycleParameters] # next order, taken from the iterable but not yet acknowledged
+    _stagedSignals = None # type: typing.Optional[typing.Dict[str, plcmemory.PLCMemory.ValueType]] # start signals of the staged order
+    _gaps = None # type: typing.List[float] # seconds between the end of a cycle and the start of the next one
+
+    def __init__(self, logic: PLCLogic):
+        self._logic = logic
+        # edges are detected before modifications are queued, so the queue that is never consumed is kept to a single batch
+        self._edgeController = plccontroller.PLCController(logic.GetController().GetMemory(), keys=[], edgeKeys=['isRunningOrderCycle'], maxQueueSize=1)
+        self._gaps = []
+
+    def _Stage(self, startOrderCycleParameters: typing.Optional[PLCStartOrderCycleParameters]) -> None:
+        """
+        Validate the parameters of an order and prepare its start signals.
+        """
+        if startOrderCycleParameters is None:
+            return
+        if not isinstance(startOrderCycleParameters, PLCStartOrderCycleParameters):
+            raise ValueError('order parameters are of type %r, expected %r' % (type(startOrderCycleParameters), PLCStartOrderCycleParameters))
+        for key in dir(PLCStartOrderCycleParameters):
+            if key.startswith('_'):
+                continue
+            value = getattr(startOrderCycleParameters, key)
+            if type(value) != type(getattr(PLCStartOrderCycleParameters, key)):
+                raise ValueError('attribute %s of order %r is of type %r' % (key, startOrderCycleParameters.uniqueId, type(value)))
+            if isinstance(value, int) and value < 0:
+                raise ValueError('attribute %s of order %r is negative: %d' % (key, startOrderCycleParameters.uniqueId, value))
+        self._stagedSignals = self._logic.GetStartOrderCycleSignals(startOrderCycleParameters)
+        self._stagedOrder = startOrderCycleParameters
+
+    def _GetEdgeTimestamp(self, rising: bool) -> typing.Optional[int]:
+        """
+        Timestamp of the newest edge of isRunningOrderCycle in the given direction since the last call, consuming all queued edges.
+        """
+        timestamp = None
+        for edge in self._edgeController.PopEdges('isRunningOrderCycle'):
+            if edge.rising == rising:
+                timestamp = edge.timestamp
+        return timestamp
+
+    def GetStagedOrder(self) -> typing.Optional[PLCStartOrderCycleParameters]:
+        """
+        Order taken from an iterable by Run whose start has not been acknowledged.
+        """
+        return self._stagedOrder
+
+    def DiscardStagedOrder(self) -> typing.Optional[PLCStartOrderCycleParameters]:
+        """
+        Drop the staged order, so that Run can be called again. To retry the order, pass it to Run again.
+
+        :return: The order that was staged, None if there was none.
+        """
+        startOrderCycleParameters = self._stagedOrder
+        self._stagedOrder = None
+        self._stagedSignals = None
+        return startOrderCycleParameters
+
+    def Run(self, orders: typing.Iterable[PLCStartOrderCycleParameters], timeout: typing.Optional[float] = None) -> typing.Iterator[PLCOrderCycleStatus]:
+        """
+        Run an order cycle for each order in turn. Orders are taken from the iterable one cycle ahead, so it can be fed while running.
+
+        :param timeout: Timeout of every wait for MUJIN controller.
+        :return: An iterator of the order cycle status at the end of each cycle. The next cycle is already started when a status is produced.
+        """
+        logic = self._logic
+        controller = logic.GetController()
+        orders = iter(orders)
+
+        if self._stagedOrder is not None:
+            raise ValueError('order %r taken by a previous run was never started, it has to be discarded with DiscardStagedOrder first' % self._stagedOrder.uniqueId)
+        self._Stage(next(orders, None))
+        if self._stagedOrder is None:
+            return
+        logic.WaitUntilOrderCycleReady(timeout=timeout)
+        self._GetEdgeTimestamp(False)
+        endTimestamp = None # type: typing.Optional[int]
+        try:
+            controller.SetMultiple(self._stagedSignals)
+            while True:
+                try:
+                    logic.WaitUntilOrderCycleRunning(timeout=timeout)
+                finally:
+                    controller.Set('startOrderCycle', False)
+                    if controller.GetBoolean('isRunningOrderCycle'):
+                        self._stagedOrder = None
+                        self._stagedSignals = None
+                startTimestamp = self._GetEdgeTimestamp(True)
+                if endTimestamp is not None and startTimestamp is not None:
+                    gap = (startTimestamp - endTimestamp) / 1000000000.0
+                    self._gaps.append(gap)
+                    log.debug('order cycle started %.03fms after the previous one finished', gap * 1000)
+
+                # prepare the next order while this one runs
+                self._Stage(next(orders, None))
+
+                status = logic.WaitUntilOrderCycleFinish(timeout=timeout)
+                endTimestamp = self._GetEdgeTimestamp(False)
+                if self._stagedOrder is not None:
+                    logic.WaitUntilOrderCycleReady(timeout=timeout)
+                    controller.SetMultiple(self._stagedSignals)
+                yield status
+                if self._stagedOrder is None:
+                    return
+        finally:
+            # lower a start that is not acknowledged, also when the caller stops iterating and the generator is closed
+            controller.Set('startOrderCycle', False)
+
+    def GetGaps(self) -> typing.List[float]:
+        """
+        Seconds between the end of each cycle and the start of the next one, for every pair of cycles run so far.
+        """
+        return list(self._gaps)
+
+    def GetGapStats(self) -> typing.Dict[str, float]:
+        """
+        :return: A dictionary containing the number of gaps between cycles, and their mean and maximum in seconds.
+        """
+        return {
+            'count': len(self._gaps),
+            'mean': sum(self._gaps) / len(self._gaps) if self._gaps else 0.0,
+            'max': max(self._gaps) if self._gaps else 0.0,
+        }
+
+class AsyncPLCLogic(_PLCLogicBase):
+    """
+    MUJIN specific PLC logic implementation for asyncio, on top of AsyncPLCController. Every handshake is a coroutine, so that many of them can run concurrently in one event loop thread.
+    """
+
+    _controller = None # type: plcasynccontroller.AsyncPLCController # an instance of AsyncPLCController
+
+    def __init__(self, controller: plcasynccontroller.AsyncPLCController):
+        super(AsyncPLCLogic, self).__init__(controller)
+
+    async def ResetError(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        Reset error on MUJIN controller. Wait until error is reset.
+        """
+        self._controller.Set('resetError', True)
+        try:
+            if not await self._controller.WaitUntil('isError', False, timeout=timeout):
+                raise PLCWaitTimeout()
+        finally:
+            self._controller.Set('resetError', False)
+
+    async def WaitUntilOrderCycleReady(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        Wait until MUJIN controller is ready to start order cycle.
+        """
+        if not await self._controller.WaitUntilPredicate(self._orderCycleReadyPredicate, timeout=timeout):
+            raise PLCWaitTimeout()
+        self.CheckError()
+
+    async def StartOrderCycle(self, startOrderCycleParameters: PLCStartOrderCycleParameters, timeout: typing.Optional[float] = None) -> PLCOrderCycleStatus:
+        """
+        Start order cycle. Wait until MUJIN controller acknowledge the start command.
+        """
+        self._controller.SetMultiple(self.GetStartOrderCycleSignals(startOrderCycleParameters))
+        try:
+            if not await self._controller.WaitUntilPredicate(self._orderCycleRunningPredicate, timeout=timeout):
+                raise PLCWaitTimeout()
+        finally:
+            self._controller.Set('startOrderCycle', False)
+        self.CheckError()
+        return self.GetOrderCycleStatus()
+
+    async def WaitUntilOrderCycleFinish(self, timeout: typing.Optional[float] = None) -> PLCOrderCycleStatus:
+        """
+        Wait until MUJIN controller finishes the order cycle.
+        """
+        if not await self._controller.WaitUntilPredicate(self._orderCycleStoppedPredicate, timeout=timeout):
+            raise PLCWaitTimeout()
+        self.CheckError()
+        return self.GetOrderCycleStatus()
+
+    async def StopOrderCycle(self, timeout: typing.Optional[float] = None) -> PLCOrderCycleStatus:
+        """
+        Signal MUJIN controller to stop order cycle and wait until it is stopped.
+        """
+        self._controller.Set('stopOrderCycle', True)
+        try:
+            if not await self._controller.WaitUntilPredicate(self._orderCycleStoppedPredicate, timeout=timeout):
+                raise PLCWaitTimeout()
+        finally:
+            self._controller.Set('stopOrderCycle', False)
+        self.CheckError()
+        return self.GetOrderCycleStatus()
+
+    async def StopImmediately(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        Stop the current operation on MUJIN controller immediately.
+        """
+        self._controller.Set('stopImmediately', True)
+        try:
+            if not await self._controller.WaitUntilPredicate(self._stoppedPredicate, timeout=timeout):
+                raise PLCWaitTimeout()
+        finally:
+            self._controller.Set('stopImmediately', False)
+        self.CheckError()
+
+    async def WaitUntilMoveToHomeReady(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        Wait until MUJIN controller is ready to move robot to home position.
+        """
+        if not await self._controller.WaitUntilPredicate(self._moveToHomeReadyPredicate, timeout=timeout):
+            raise PLCWaitTimeout()
+        self.CheckError()
+
+    async def StartMoveToHome(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        Signal MUJIN controller to move the robot to its home position. Wait until the robot starts moving.
+        """
+        self._controller.Set('startMoveToHome', True)
+        try:
+            if not await self._controller.WaitUntilPredicate(self._robotMovingPredicates[True], timeout=timeout):
+                raise PLCWaitTimeout()
+        finally:
+            self._controller.Set('startMoveToHome', False)
+        self.CheckError()
+
+    async def WaitUntilRobotMoving(self, isRobotMoving: bool = True, timeout: typing.Optional[float] = None) -> None:
+        """
+        Wait until the robot moving state is expected.
+        """
+        if not await self._controller.WaitUntilPredicate(self._robotMovingPredicates[isRobotMoving], timeout=timeout):
+            raise PLCWaitTimeout()
+        self.CheckError()
+
+    async def WaitUntilPreparationCycleReady(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        Wait until MUJIN controller is ready to start preparation cycle.
+        """
+        if not await self._controller.WaitUntilPredicate(self._preparationCycleReadyPredicate, timeout=timeout):
+            raise PLCWaitTimeout()
+        self.CheckError()
+
+    async def StartPreparationCycle(self, startPreparationCycleParameters: PLCStartPreparationCycleParameters, timeout: typing.Optional[float] = None) -> PLCPreparationCycleStatus:
+        """
+        Start preparation cycle. Wait until MUJIN controller acknowledge the start command.
+        """
+        self._controller.SetMultiple(self.GetStartPreparationCycleSignals(startPreparationCycleParameters))
+        try:
+            if not await self._controller.WaitUntilPredicate(self._preparationCycleRunningPredicate, timeout=timeout):
+                raise PLCWaitTimeout()
+        finally:
+            self._controller.Set('startPreparation', False)
+        self.CheckError()
+        return self.GetPreparationCycleStatus()
+
+    async def WaitUntilPreparationCycleFinish(self, timeout: typing.Optional[float] = None) -> PLCPreparationCycleStatus:
+        """
+        Wait until MUJIN controller finishes the preparation cycle.
+        """
+        if not await self._controller.WaitUntilPredicate(self._preparationCycleStoppedPredicate, timeout=timeout):
+            raise PLCWaitTimeout()
+        self.CheckError()
+        return self.GetPreparationCycleStatus()
+
+    async def StopPreparationCycle(self, timeout: typing.Optional[float] = None) -> PLCPreparationCycleStatus:
+        """
+        Signal MUJIN controller to stop preparation cycle and wait until it is stopped.
+        """
+        self._controller.Set('stopPreparation', True)
+        try:
+            if not await self._controller.WaitUntilPredicate(self._preparationCycleStoppedPredicate, timeout=timeout):
                 raise PLCWaitTimeout()
         finally:
             self._controller.Set('stopPreparation', False)
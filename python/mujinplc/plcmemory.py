@@ -1,27 +1,352 @@
 # -*- coding: utf-8 -*-
 
+import time
+import bisect
 import threading
 import weakref
+import collections
+import collections.abc
 import typing # noqa: F401 # used in type check
 
+from . import plcstorage, plcderivedsignal, plcmemorystats
+
 import logging
 log = logging.getLogger(__name__)
 
+class PLCModifications(dict):
+    """
+    A batch of modifications made to PLCMemory by one write. Behaves as a regular dictionary mapping keys to their new values.
+    """
+
+    __slots__ = ('version', 'timestamp', 'writer', 'namespace', 'snapshot')
+
+    def __init__(self, keyvalues: typing.Mapping[str, typing.Any], version: int = 0, timestamp: int = 0, writer: str = '', namespace: str = '', snapshot: typing.Optional['PLCStateSnapshot'] = None):
+        super(PLCModifications, self).__init__(keyvalues)
+        self.version = version # type: int # sequence number of the batch, monotonically increasing for each memory
+        self.timestamp = timestamp # type: int # monotonic time in nanoseconds when the batch was written
+        self.writer = writer # type: str # name of the thread that wrote the batch
+        self.namespace = namespace # type: str # namespace of the memory in a PLCMemoryArena, empty for standalone memories
+        self.snapshot = snapshot # type: typing.Optional[PLCStateSnapshot] # state of the whole memory right after the batch, None unless snapshots are published
+
+    def CreateEmpty(self) -> 'PLCModifications':
+        """
+        Create an empty batch with the same version, timestamp, writer, namespace and snapshot, to be filled with a subset of these modifications.
+        """
+        return PLCModifications({}, version=self.version, timestamp=self.timestamp, writer=self.writer, namespace=self.namespace, snapshot=self.snapshot)
+
+class PLCStateSnapshot(collections.abc.Mapping):
+    """
+    An immutable snapshot of the whole PLCMemory at one version, published by the memory and shared by every reader, so that readers only have to keep a reference to the version they are at instead of their own copy of the state.
+
+    Values are stored in a hash trie: each level picks one of 32 children by five bits of the hash of the key, down to small leaf dictionaries. A new version copies only the path from the root to the leaves of the modified keys and shares everything else with the previous version, so publishing a batch costs time proportional to the batch and the depth of the trie, not to the number of signals, and a lookup visits a few nodes.
+    """
+
+    __slots__ = ('version', '_root', '_size')
+
+    _maxLeafSize = 8 # type: int # number of keys above which a leaf is split into a node
+    _maxShift = 60 # type: int # leaves this deep are never split, their keys share all hash bits
+
+    def __init__(self, version: int, keyvalues: typing.Optional[typing.Mapping[str, typing.Any]] = None):
+        self.version = version # type: int # version of the memory this snapshot is of
+        self._root = [None] * 32 # type: typing.List[typing.Any] # children are None, a leaf dictionary or a node list
+        self._size = 0 # type: int
+        if keyvalues:
+            owned = set([id(self._root)])
+            for key, value in keyvalues.items():
+                self._size += self._Insert(self._root, owned, hash(key), 0, key, value)
+
+    def Apply(self, version: int, modifications: typing.Mapping[str, typing.Any]) -> 'PLCStateSnapshot':
+        """
+        Create the snapshot following this one. This snapshot is left untouched.
+        """
+        snapshot = PLCStateSnapshot(version)
+        snapshot._root = list(self._root)
+        snapshot._size = self._size
+        owned = set([id(snapshot._root)]) # nodes and leaves copied for the new snapshot, which can be modified in place
+        for key, value in modifications.items():
+            snapshot._size += self._Insert(snapshot._root, owned, hash(key), 0, key, value)
+        return snapshot
+
+    @classmethod
+    def _Insert(cls, node: typing.List[typing.Any], owned: typing.Set[int], keyHash: int, shift: int, key: str, value: typing.Any) -> int:
+        """
+        Set a key below a node owned by the new snapshot, copying shared nodes and leaves on the way.
+
+        :return: 1 if the key was added, 0 if it was replaced.
+        """
+        while True:
+            index = (keyHash >> shift) & 31
+            child = node[index]
+            if child is None:
+                child = node[index] = {key: value}
+                owned.add(id(child))
+                return 1
+            if id(child) not in owned:
+                child = node[index] = child.copy()
+                owned.add(id(child))
+            if type(child) is dict:
+                added = key not in child
+                child[key] = value
+                if added and len(child) > cls._maxLeafSize and shift < cls._maxShift:
+                    subnode = node[index] = [None] * 32
+                    owned.add(id(subnode))
+                    for leafKey, leafValue in child.items():
+                        cls._Insert(subnode, owned, hash(leafKey), shift + 5, leafKey, leafValue)
+                return int(added)
+            node = child
+            shift += 5
+
+    def _FindLeaf(self, key: typing.Any) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        keyHash = hash(key)
+        node = self._root
+        shift = 0
+        while True:
+            child = node[(keyHash >> shift) & 31]
+            if child is None or type(child) is dict:
+                return child
+            node = child
+            shift += 5
+
+    def CountUnsharedNodes(self, previous: 'PLCStateSnapshot') -> int:
+        """
+        Number of nodes and leaves of this snapshot that are not shared with a previous snapshot, to check how much publishing a version copied.
+        """
+        count = 0
+        pairs = [(self._root, previous._root)] # type: typing.List[typing.Tuple[typing.Any, typing.Any]]
+        while pairs:
+            node, previousNode = pairs.pop()
+            if node is previousNode or node is None:
+                continue
+            count += 1
+            if type(node) is list and type(previousNode) is list:
+                pairs.extend(zip(node, previousNode))
+            elif type(node) is list:
+                pairs.extend((child, None) for child in node)
+        return count
+
+    def ToDict(self) -> typing.Dict[str, typing.Any]:
+        """
+        Copy the snapshot into a regular dictionary.
+        """
+        keyvalues = {} # type: typing.Dict[str, typing.Any]
+        nodes = [self._root]
+        while nodes:
+            for child in nodes.pop():
+                if child is None:
+                    continue
+                if type(child) is dict:
+                    keyvalues.update(child)
+                else:
+                    nodes.append(child)
+        return keyvalues
+
+    def __getitem__(self, key: str) -> typing.Any:
+        leaf = self._FindLeaf(key)
+        if leaf is None:
+            raise KeyError(key)
+        return leaf[key]
+
+    def __contains__(self, key: typing.Any) -> bool:
+        leaf = self._FindLeaf(key)
+        return leaf is not None and key in leaf
+
+    def get(self, key: str, default: typing.Any = None) -> typing.Any:
+        leaf = self._FindLeaf(key)
+        if leaf is None:
+            return default
+        return leaf.get(key, default)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.ToDict())
+
+    def __len__(self) -> int:
+        return self._size
+
+def GetMonotonicTimestamp() -> int:
+    """
+    Monotonic time in nanoseconds, as used for PLCModifications timestamps.
+    """
+    return int(time.monotonic() * 1000000000)
+
+class PLCMemoryDispatcher:
+    """
+    PLCMemoryDispatcher delivers modification batches to observers after the PLCMemory lock is released. Batches are queued under the memory lock, so every observer still sees them in the order they were written.
+
+    Whichever writer thread gets hold of the dispatch lock delivers all queued batches, so Write still returns only after its own batch is delivered, but readers and other writers are no longer blocked by slow observers.
+    """
+
+    _pending = None # type: typing.Deque[typing.List[typing.Tuple[typing.Any, PLCModifications]]] # queued notifications, in version order
+    _dispatchLock = None # type: threading.Lock # held while delivering notifications
+    _dispatchingThread = None # type: typing.Optional[int] # ident of the thread currently delivering notifications
+
+    def __init__(self):
+        self._pending = collections.deque()
+        self._dispatchLock = threading.Lock()
+
+    def Enqueue(self, notifications: typing.List[typing.Tuple[typing.Any, PLCModifications]]) -> None:
+        """
+        Queue notifications for delivery. Has to be called under the memory lock to preserve ordering.
+        """
+        if notifications:
+            self._pending.append(notifications)
+
+    def Dispatch(self) -> None:
+        """
+        Deliver all queued notifications. Has to be called without holding the memory lock.
+        """
+        if self._dispatchingThread == threading.get_ident():
+            # an observer wrote to the memory while being notified, the outer loop will deliver the new batch in order
+            return
+
+        with self._dispatchLock:
+            self._dispatchingThread = threading.get_ident()
+            try:
+                while True:
+                    try:
+                        notifications = self._pending.popleft()
+                    except IndexError:
+                        break
+                    for observer, modifications in notifications:
+                        try:
+                            observer.MemoryModified(modifications)
+                        except Exception as e:
+                            log.exception('caught exception when notifying observer %r: %s', observer, e)
+            finally:
+                self._dispatchingThread = None
+
+class PLCMemoryTransaction:
+    """
+    PLCMemoryTransaction collects writes and applies them to PLCMemory as a single modification batch, with a single notification per observer. When the same key is written more than once, the last value wins.
+
+    A value that only lives within the transaction, such as a trigger set and reset again, is never seen by observers. Transactions created with coalesce set to False keep such pulses instead: writing a different value to a key that is already collected first commits what was collected so far, so observers see every value the key takes, in order, at the cost of more batches.
+
+    Used as a context manager, the writes are committed when the with block exits normally and discarded when it raises. Batches already committed because of a pulse stay written.
+    """
+
+    _memory = None # type: PLCMemory
+    _keyvalues = None # type: typing.Dict[str, PLCMemory.ValueType] # writes not yet committed
+    _coalesce = True # type: bool # whether a key written twice only keeps its last value
+
+    def __init__(self, memory: 'PLCMemory', coalesce: bool = True):
+        self._memory = memory
+        self._keyvalues = {}
+        self._coalesce = coalesce
+
+    def __enter__(self) -> 'PLCMemoryTransaction':
+        return self
+
+    def __exit__(self, exceptionType: typing.Any, exceptionValue: typing.Any, traceback: typing.Any) -> None:
+        if exceptionType is None:
+            self.Commit()
+        else:
+            self.Discard()
+
+    def Read(self, keys: typing.Iterable[str]) -> typing.Mapping[str, 'PLCMemory.ValueType']:
+        """
+        Read PLC memory, as it would be after this transaction is committed.
+        """
+        keys = list(keys)
+        keyvalues = dict(self._memory.Read(key for key in keys if key not in self._keyvalues))
+        for key in keys:
+            if key in self._keyvalues:
+                keyvalues[key] = self._keyvalues[key]
+        return keyvalues
+
+    def Write(self, keyvalues: typing.Mapping[str, 'PLCMemory.ValueType']) -> None:
+        """
+        Add writes to the transaction. Nothing is written to PLC memory until Commit, unless the transaction does not coalesce and a collected key changes value.
+        """
+        if not self._coalesce and any(key in self._keyvalues and self._keyvalues[key] != value for key, value in keyvalues.items()):
+            self.Commit()
+        self._keyvalues.update(keyvalues)
+
+    def Commit(self) -> None:
+        """
+        Write everything collected so far to PLC memory in one batch.
+        """
+        keyvalues = self._keyvalues
+        self._keyvalues = {}
+        if keyvalues:
+            self._memory.Write(keyvalues)
+
+    def Discard(self) -> None:
+        """
+        Drop everything collected so far.
+        """
+        self._keyvalues = {}
+
+class _PLCGroupCommit:
+    """
+    Writes from concurrent writers that are committed together by group commit.
+    """
+
+    __slots__ = ('keyvalues', 'committed', 'error')
+
+    def __init__(self):
+        self.keyvalues = {} # type: typing.Dict[str, PLCMemory.ValueType] # merged writes, the last value wins
+        self.committed = False # type: bool # whether the group has been written to the memory
+        self.error = None # type: typing.Optional[Exception] # error raised while writing the group, reported to every writer
+
 class PLCMemory:
     """
     PLCMemory is a key-value store that supports locked PLC memory read write operations.
+
+    Writers are serialized by a lock. Readers never take the lock, they use a sequence lock instead and retry if a write happened while they were reading, so heavy read traffic does not serialize against writers.
     """
 
     ValueType = typing.Optional[typing.Union[str, int, bool]]
 
+    _namespace = '' # type: str # namespace of the memory in a PLCMemoryArena
     _lock = None # type: threading.Lock
-    _entries = None # type: typing.Dict
-    _observers = None # type: typing.Set[typing.Any]
+    _entries = None # type: typing.MutableMapping[str, PLCMemory.ValueType] # storage engine, a dictionary or a PLCCompactStorage
+    _sequence = 0 # type: int # sequence lock, odd while the storage is being modified
+    _maxReadRetries = 100 # type: int # after this many retries, readers fall back to taking the lock
+    _version = 0 # type: int # version of the last modification batch
+    _changeLog = None # type: typing.Deque[PLCModifications] # ring buffer of the most recent modification batches
+    _dispatcher = None # type: typing.Optional[PLCMemoryDispatcher] # if set, observers are notified outside of the lock
+    _observers = None # type: typing.Set[typing.Any] # all observers, regardless of their subscription
+    _unfilteredObservers = None # type: typing.Set[typing.Any] # observers interested in every key
+    _keyObservers = None # type: typing.Dict[str, typing.Set[typing.Any]] # index from key to observers interested in that key
+    _prefixObservers = None # type: typing.Dict[str, typing.Set[typing.Any]] # index from key prefix to observers interested in keys with that prefix
+    _prefixLengths = None # type: typing.List[int] # distinct lengths of the prefixes in _prefixObservers, sorted
+    _sortedKeys = None # type: typing.List[str] # every key in the memory, sorted, so that keys sharing a prefix are contiguous, modified only while the sequence is odd
+    _indexedKeys = None # type: typing.Set[str] # keys already in _sortedKeys
+    _groupCommitWindow = 0.0 # type: float # seconds a group commit waits for concurrent writers, 0 to disable group commit
+    _groupCondition = None # type: threading.Condition # protects the open group commit
+    _groupCommit = None # type: typing.Optional[_PLCGroupCommit] # group commit currently collecting writes
+    _derivedSignals = None # type: typing.Optional[plcderivedsignal.PLCDerivedSignals] # derived signals, created when the first one is added
+    _instrumentation = None # type: typing.Optional[plcmemorystats.PLCMemoryInstrumentation] # hot path statistics, None unless instrumentation is enabled
+    _snapshot = None # type: typing.Optional[PLCStateSnapshot] # snapshot of the current version, None until GetSnapshot is first called
 
-    def __init__(self):
+    def __init__(self, dispatcher: typing.Optional[PLCMemoryDispatcher] = None, changeLogSize: int = 1024, storage: typing.Optional[typing.MutableMapping[str, ValueType]] = None, groupCommitWindow: float = 0.0, namespace: str = '', instrumentation: bool = False):
+        """
+        :param dispatcher: If given, observers are notified through the dispatcher after the lock is released, instead of under the lock. The dispatcher can be shared between memories.
+        :param changeLogSize: Number of recent modification batches kept for ReadSince.
+        :param storage: Storage engine to keep the values in, such as a PLCCompactStorage. By default values are kept in a dictionary.
+        :param groupCommitWindow: If positive, Write waits this many seconds, for example 0.0002, for concurrent writers and commits all their writes as one modification batch.
+        :param namespace: Namespace of the memory, set on every modification batch. Used by PLCMemoryArena.
+        :param instrumentation: If True, record lock wait and hold times, per key write counts, batch sizes and per observer notification latency, returned by GetStats. Off by default, as it slows down every write.
+        """
+        self._namespace = namespace
         self._lock = threading.Lock()
-        self._entries = {}
+        if instrumentation:
+            self._instrumentation = plcmemorystats.PLCMemoryInstrumentation()
+            self._lock = plcmemorystats.PLCInstrumentedLock(self._lock, self._instrumentation) # type: ignore
+        self._entries = storage if storage is not None else {}
+        self._sequence = 0
+        self._version = 0
+        self._changeLog = collections.deque(maxlen=changeLogSize)
+        self._dispatcher = dispatcher
         self._observers = weakref.WeakSet()
+        self._unfilteredObservers = weakref.WeakSet()
+        self._keyObservers = {}
+        self._prefixObservers = {}
+        self._prefixLengths = []
+        self._sortedKeys = sorted(self._entries)
+        self._indexedKeys = set(self._sortedKeys)
+        self._groupCommitWindow = groupCommitWindow
+        self._groupCondition = threading.Condition()
+        self._groupCommit = None
 
     def Read(self, keys: typing.Iterable[str]) -> typing.Mapping[str, ValueType]:
         """
@@ -30,39 +355,468 @@ class PLCMemory:
         :param keys: An array of strings representing the named memory addresses.\
         :return: A dictionary containing the mapping between requested memory addresses and their stored values. If a requested address does not exist in the memory, it will be omitted here.
         """
+        keys = list(keys)
+        entries = self._entries
+        for retry in range(self._maxReadRetries):
+            sequence = self._GetSequence()
+            if sequence % 2 == 0:
+                keyvalues = {}
+                try:
+                    for key in keys:
+                        if key in entries:
+                            keyvalues[key] = entries[key]
+                except Exception:
+                    # failed on a value being written, see _ReadConsistent
+                    if self._GetSequence() == sequence:
+                        raise
+                    time.sleep(0)
+                    continue
+                if self._GetSequence() == sequence:
+                    return keyvalues
+            # let the writer finish
+            time.sleep(0)
+
+        # writer keeps getting in the way, read under lock instead
         keyvalues = {}
         with self._lock:
             for key in keys:
-                if key in self._entries:
-                    keyvalues[key] = self._entries[key]
+                if key in entries:
+                    keyvalues[key] = entries[key]
         return keyvalues
 
+    def ReadAll(self) -> typing.Mapping[str, ValueType]:
+        """
+        Atomically read the whole PLC memory, without blocking writers.
+
+        :return: A dictionary containing all memory addresses and their stored values.
+        """
+        return self._ReadConsistent(lambda: dict(self._entries)) # type: ignore
+
+    def _GetSequence(self) -> int:
+        return self._sequence
+
+    def _ReadConsistent(self, reader: typing.Callable[[], typing.Any]) -> typing.Any:
+        """
+        Run reader without taking the lock, retrying until no write happened while it was running. Falls back to taking the lock after too many retries.
+
+        A reader racing a write can see a partially written value and fail, for example on a string slot of PLCSharedMemory that another process is writing. Such a failure is retried like any other torn read. It is only raised if no write happened while the reader was running.
+        """
+        for retry in range(self._maxReadRetries):
+            sequence = self._GetSequence()
+            if sequence % 2 == 0:
+                try:
+                    result = reader()
+                except Exception:
+                    if self._GetSequence() == sequence:
+                        raise
+                    # failed on a value being written
+                    time.sleep(0)
+                    continue
+                if self._GetSequence() == sequence:
+                    return result
+            # let the writer finish
+            time.sleep(0)
+        with self._lock:
+            return reader()
+
     def Write(self, keyvalues: typing.Mapping[str, ValueType]) -> None:
         """
         Atomically write PLC memory.
 
         :param keyvalues: A dictionary containing the mapping between named memory addresses and their desired values.
         """
+        if self._groupCommitWindow > 0:
+            self._WriteGroup(keyvalues)
+            return
+        self._Commit(keyvalues)
+
+    def WriteIf(self, conditions: typing.Mapping[str, ValueType], keyvalues: typing.Mapping[str, ValueType]) -> bool:
+        """
+        Atomically write PLC memory, only if all conditions hold at the time of the write.
+
+        :param conditions: A dictionary containing the mapping between named memory addresses and the values they are expected to have. An address that does not exist in the memory is considered to be None.
+        :param keyvalues: A dictionary containing the mapping between named memory addresses and their desired values.
+        :return: True if the conditions held and the values were written.
+        """
+        return self._Commit(keyvalues, conditions=conditions)
+
+    def CompareAndSet(self, key: str, expectedValue: ValueType, value: ValueType) -> bool:
+        """
+        Atomically set a key in PLC memory, only if it currently has the expected value.
+
+        :return: True if the key had the expected value and was set.
+        """
+        return self._Commit({key: value}, conditions={key: expectedValue})
+
+    def _Commit(self, keyvalues: typing.Mapping[str, ValueType], conditions: typing.Optional[typing.Mapping[str, ValueType]] = None) -> bool:
+        """
+        Apply writes to the storage as one modification batch and notify observers.
+
+        :param conditions: If given, nothing is written unless every key currently has the given value.
+        :return: False if the conditions did not hold.
+        """
         with self._lock:
+            if conditions:
+                for key, value in conditions.items():
+                    if self._entries.get(key) != value:
+                        return False
+            if self._derivedSignals is not None:
+                self._derivedSignals.CheckWritable(keyvalues)
             modifications = {}
             for key, value in keyvalues.items():
                 if key in self._entries and value == self._entries[key]:
                     continue
                 modifications[key] = value
-            self._entries.update(modifications)
+            if not modifications:
+                return True
+            self._sequence += 1
+            try:
+                self._IndexKeys(modifications)
+                self._entries.update(modifications)
+                if self._derivedSignals is not None:
+                    self._UpdateDerivedSignals(modifications)
+            finally:
+                self._sequence += 1
+            if not self._NotifyModified(modifications):
+                return True
+
+        self._dispatcher.Dispatch()
+        return True
 
-            # notify observers of the modifications
-            # have to do it under lock to guarantee ordering
-            if modifications:
-                for observer in self._observers:
-                    observer.MemoryModified(modifications)
+    def _WriteGroup(self, keyvalues: typing.Mapping[str, ValueType]) -> None:
+        """
+        Group commit. The first writer opens a group and waits for the group commit window, writers arriving in the meantime add their writes to the group and wait for it to be committed. Every writer returns only after its writes are in the memory.
+        """
+        with self._groupCondition:
+            group = self._groupCommit
+            if group is not None:
+                group.keyvalues.update(keyvalues)
+                while not group.committed:
+                    self._groupCondition.wait()
+                if group.error is not None:
+                    raise group.error
+                return
+            group = self._groupCommit = _PLCGroupCommit()
+            group.keyvalues.update(keyvalues)
+
+        time.sleep(self._groupCommitWindow)
+
+        with self._groupCondition:
+            # close the group, later writers open a new one
+            self._groupCommit = None
+        try:
+            self._Commit(group.keyvalues)
+        except Exception as e:
+            group.error = e
+            raise
+        finally:
+            with self._groupCondition:
+                group.committed = True
+                self._groupCondition.notify_all()
+
+    def AddDerivedSignal(self, key: str, expression: plcderivedsignal.PLCExpression) -> None:
+        """
+        Register a derived signal, a boolean signal computed from other signals. Whenever one of its inputs is written, the derived signal is updated incrementally in the same modification batch, so it can be read and observed like any other signal. Derived signals cannot be written directly.
+
+        Example::
 
-    def AddObserver(self, observer: typing.Any) -> None:
+            memory.AddDerivedSignal('isOrderCycleReady', plcderivedsignal.PLCAnd({
+                'isRunningOrderCycle': False,
+                'isModeAuto': True,
+            }))
+
+        :param key: Name of the derived signal.
+        :param expression: Expression built from PLCEquals, PLCAnd, PLCOr and PLCNot. Inputs can be other derived signals.
+        """
+        with self._lock:
+            if self._derivedSignals is None:
+                self._derivedSignals = plcderivedsignal.PLCDerivedSignals()
+            value = self._derivedSignals.Add(key, expression, self._entries)
+            if key in self._entries and self._entries[key] == value:
+                return
+            modifications = {key: value} # type: typing.Dict[str, PLCMemory.ValueType]
+            self._sequence += 1
+            try:
+                self._IndexKeys(modifications)
+                self._entries.update(modifications)
+            finally:
+                self._sequence += 1
+            if not self._NotifyModified(modifications):
+                return
+
+        self._dispatcher.Dispatch() # type: ignore
+
+    def _UpdateDerivedSignals(self, modifications: typing.Dict[str, ValueType]) -> None:
+        """
+        Propagate modifications that were just stored to the derived signals, and store and add the changed derived signals to the modifications. Has to be called under lock while the sequence is odd.
+        """
+        derivedModifications = self._derivedSignals.Update(modifications) # type: ignore
+        if derivedModifications:
+            self._IndexKeys(derivedModifications)
+            self._entries.update(derivedModifications)
+            modifications.update(derivedModifications)
+
+    def _IndexKeys(self, keys: typing.Iterable[str]) -> None:
+        """
+        Add keys not seen before to the sorted key index. Has to be called under lock while the sequence is odd, so that lock free readers of the index retry.
+        """
+        for key in keys:
+            if key not in self._indexedKeys:
+                self._indexedKeys.add(key)
+                bisect.insort(self._sortedKeys, key)
+
+    def Transaction(self, coalesce: bool = True) -> PLCMemoryTransaction:
+        """
+        Start a transaction to collect multiple writes into a single modification batch.
+
+        :param coalesce: If False, a key written again with a different value is published in a new batch instead of replacing the collected value, see PLCMemoryTransaction.
+
+        Example::
+
+            with memory.Transaction() as transaction:
+                transaction.Write({'startOrderCycle': True})
+                transaction.Write({'stopOrderCycle': False})
+        """
+        return PLCMemoryTransaction(self, coalesce=coalesce)
+
+    def _NotifyModified(self, modifications: typing.Dict[str, ValueType]) -> bool:
+        """
+        Record a modification batch that has been applied to the storage and notify observers. Has to be called under lock.
+
+        :return: True if notifications are queued on the dispatcher, in which case Dispatch has to be called after the lock is released.
+        """
+        self._version += 1
+        batch = PLCModifications(modifications, version=self._version, timestamp=GetMonotonicTimestamp(), writer=threading.current_thread().name, namespace=self._namespace)
+        if self._snapshot is not None:
+            self._snapshot = batch.snapshot = self._snapshot.Apply(self._version, modifications)
+        self._changeLog.append(batch)
+        notifications = self._CollectNotifications(batch)
+        if self._instrumentation is not None:
+            self._instrumentation.RecordBatch(modifications)
+            notifications = self._instrumentation.WrapNotifications(notifications)
+
+        # notify observers of the modifications
+        # without a dispatcher, have to do it under lock to guarantee ordering
+        if self._dispatcher is None:
+            for observer, observerModifications in notifications:
+                observer.MemoryModified(observerModifications)
+            return False
+        self._dispatcher.Enqueue(notifications)
+        return True
+
+    def _GetCompactStorage(self) -> plcstorage.PLCCompactStorage:
+        if not isinstance(self._entries, plcstorage.PLCCompactStorage):
+            raise ValueError('memory is not backed by a PLCCompactStorage')
+        return self._entries
+
+    def GetSlots(self, keys: typing.Iterable[str]) -> typing.List[int]:
+        """
+        Look up the slots of named memory addresses once, to be used with ReadSlots and WriteSlots. Only available when the memory is backed by a PLCCompactStorage.
+        """
+        return self._GetCompactStorage().GetSchema().GetSlots(keys)
+
+    def ReadSlots(self, slots: typing.Iterable[int]) -> typing.Mapping[int, ValueType]:
+        """
+        Atomically read PLC memory by slot. Only available when the memory is backed by a PLCCompactStorage.
+
+        :return: A dictionary containing the mapping between requested slots and their stored values. Slots without a value are omitted.
+        """
+        storage = self._GetCompactStorage()
+        slots = list(slots)
+        return self._ReadConsistent(lambda: storage.ReadSlotValues(slots)) # type: ignore
+
+    def WriteSlots(self, slotvalues: typing.Mapping[int, ValueType]) -> None:
+        """
+        Atomically write PLC memory by slot. Observers are still notified with named memory addresses. Only available when the memory is backed by a PLCCompactStorage.
+        """
+        storage = self._GetCompactStorage()
+        schema = storage.GetSchema()
+        for slot, value in slotvalues.items():
+            storage.CheckSlotValue(slot, value)
+        with self._lock:
+            if self._derivedSignals is not None:
+                self._derivedSignals.CheckWritable(schema.GetName(slot) for slot in slotvalues)
+            currentSlotValues = storage.ReadSlotValues(slotvalues.keys())
+            modifications = {}
+            self._sequence += 1
+            try:
+                for slot, value in slotvalues.items():
+                    if slot in currentSlotValues and value == currentSlotValues[slot]:
+                        continue
+                    storage.SetSlotValue(slot, value)
+                    modifications[schema.GetName(slot)] = value
+                self._IndexKeys(modifications)
+                if modifications and self._derivedSignals is not None:
+                    self._UpdateDerivedSignals(modifications)
+            finally:
+                self._sequence += 1
+            if not modifications:
+                return
+            if not self._NotifyModified(modifications):
+                return
+
+        self._dispatcher.Dispatch()
+
+    def ReadSince(self, version: int) -> typing.Tuple[int, typing.Mapping[str, ValueType], bool]:
+        """
+        Atomically read everything modified after the given version.
+
+        :param version: Version previously returned by ReadSince or GetVersion, or 0 to read everything.
+        :return: A tuple of the current version, the merged modifications since the given version, and whether the modifications are instead a full snapshot of the memory because the given version is no longer in the change log.
+        """
+        with self._lock:
+            if version == self._version:
+                return self._version, {}, False
+
+            if self._changeLog and self._changeLog[0].version - 1 <= version < self._version:
+                # walk back from the newest batch so that only the latest value of each key is taken
+                keyvalues = {} # type: typing.Dict[str, PLCMemory.ValueType]
+                for batch in reversed(self._changeLog):
+                    if batch.version <= version:
+                        break
+                    for key, value in batch.items():
+                        keyvalues.setdefault(key, value)
+                return self._version, keyvalues, False
+
+            return self._version, dict(self._entries), True
+
+    def ReadPrefix(self, prefix: str) -> typing.Mapping[str, ValueType]:
+        """
+        Atomically read all keys starting with a prefix, without blocking writers. Takes time proportional to the number of matching keys, not to the size of the memory.
+
+        :return: A dictionary containing the mapping between matching memory addresses and their stored values.
+        """
+        entries = self._entries
+        return self._ReadConsistent(lambda: {key: entries[key] for key in self._GetPrefixKeys(prefix) if key in entries}) # type: ignore
+
+    def ReadRange(self, startKey: str, endKey: str) -> typing.Mapping[str, ValueType]:
+        """
+        Atomically read all keys sorted between startKey inclusive and endKey exclusive, without blocking writers.
+
+        :return: A dictionary containing the mapping between matching memory addresses and their stored values.
+        """
+        entries = self._entries
+        return self._ReadConsistent(lambda: {key: entries[key] for key in self._GetRangeKeys(startKey, endKey) if key in entries}) # type: ignore
+
+    def _GetPrefixKeys(self, prefix: str) -> typing.List[str]:
+        """
+        Keys starting with the prefix, in sorted order. Has to be called under lock, or within _ReadConsistent, since the index can be modified while it is being searched.
+
+        Keys in the index may not have a value, such as absent slots of a PLCSharedMemory.
+        """
+        sortedKeys = self._sortedKeys
+        start = bisect.bisect_left(sortedKeys, prefix)
+        end = start
+        while end < len(sortedKeys) and sortedKeys[end].startswith(prefix):
+            end += 1
+        return sortedKeys[start:end]
+
+    def _GetRangeKeys(self, startKey: str, endKey: str) -> typing.List[str]:
+        """
+        Keys sorted between startKey inclusive and endKey exclusive. Same rules as _GetPrefixKeys.
+        """
+        sortedKeys = self._sortedKeys
+        start = bisect.bisect_left(sortedKeys, startKey)
+        end = bisect.bisect_left(sortedKeys, endKey, start)
+        return sortedKeys[start:end]
+
+    def GetNamespace(self) -> str:
+        return self._namespace
+
+    def GetStats(self) -> typing.Dict[str, typing.Any]:
+        """
+        Statistics about the memory, for monitoring.
+
+        :return: A dictionary containing the current version, the number of keys and the number of observers. If instrumentation is enabled, also contains the statistics returned by PLCMemoryInstrumentation.GetStats under instrumentation.
+        """
+        stats = {
+            'version': self._version,
+            'keys': len(self._sortedKeys),
+            'observers': len(self._observers),
+        } # type: typing.Dict[str, typing.Any]
+        if self._instrumentation is not None:
+            with self._lock:
+                stats['instrumentation'] = self._instrumentation.GetStats()
+        return stats
+
+    def GetVersion(self) -> int:
+        """
+        Version of the last modification batch written to the memory.
+        """
+        return self._version
+
+    def GetSnapshot(self) -> PLCStateSnapshot:
+        """
+        Immutable snapshot of the whole memory at the current version. The first call turns on snapshot publishing: from then on every modification batch carries the snapshot of the memory right after it, shared by all observers.
+        """
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = PLCStateSnapshot(self._version, self._entries)
+            return self._snapshot
+
+    def _CollectNotifications(self, modifications: PLCModifications) -> typing.List[typing.Tuple[typing.Any, PLCModifications]]:
+        """
+        Figure out which observers are interested in the modifications, and the subset of modifications each of them should receive. Has to be called under lock.
+        """
+        notifications = [(observer, modifications) for observer in self._unfilteredObservers]
+        if not self._keyObservers and not self._prefixObservers:
+            return notifications
+
+        filteredModifications = {} # type: typing.Dict[typing.Any, PLCModifications]
+        for key, value in modifications.items():
+            for observer in self._keyObservers.get(key, ()):
+                filteredModifications.setdefault(observer, modifications.CreateEmpty())[key] = value
+            # only prefixes of the key can match, look each of them up instead of testing every subscribed prefix
+            for length in self._prefixLengths:
+                if length > len(key):
+                    break
+                for observer in self._prefixObservers.get(key[:length], ()):
+                    filteredModifications.setdefault(observer, modifications.CreateEmpty())[key] = value
+        notifications.extend(filteredModifications.items())
+        return notifications
+
+    def AddObserver(self, observer: typing.Any, keys: typing.Optional[typing.Iterable[str]] = None, prefixes: typing.Optional[typing.Iterable[str]] = None) -> None:
+        """
+        Register an observer whose MemoryModified method is called with every subsequent modification. The observer is immediately notified of the current state.
+
+        :param keys: If given, the observer is only notified of modifications to these keys.
+        :param prefixes: If given, the observer is only notified of modifications to keys starting with one of these prefixes.
+        """
         with self._lock:
             self._observers.add(observer)
 
+            if keys is None and prefixes is None:
+                self._unfilteredObservers.add(observer)
+
+                # current state
+                keyvalues = PLCModifications(self._entries, version=self._version, timestamp=GetMonotonicTimestamp(), namespace=self._namespace, snapshot=self._snapshot)
+            else:
+                keys = list(keys or [])
+                prefixes = list(prefixes or [])
+                for key in keys:
+                    self._keyObservers.setdefault(key, weakref.WeakSet()).add(observer)
+                for prefix in prefixes:
+                    self._prefixObservers.setdefault(prefix, weakref.WeakSet()).add(observer)
+                    if len(prefix) not in self._prefixLengths:
+                        bisect.insort(self._prefixLengths, len(prefix))
+
+                # current state of the keys observer is interested in
+                keyvalues = PLCModifications({}, version=self._version, timestamp=GetMonotonicTimestamp(), namespace=self._namespace, snapshot=self._snapshot)
+                for key in keys:
+                    if key in self._entries:
+                        keyvalues[key] = self._entries[key]
+                for prefix in prefixes:
+                    for key in self._GetPrefixKeys(prefix):
+                        if key in self._entries:
+                            keyvalues[key] = self._entries[key]
+
             # notify observer of the current state
-            observer.MemoryModified(dict(self._entries))
+            if self._dispatcher is None:
+                observer.MemoryModified(keyvalues)
+                return
+            self._dispatcher.Enqueue([(observer, keyvalues)])
+
+        self._dispatcher.Dispatch()
 
 class PLCMemoryLogger:
 
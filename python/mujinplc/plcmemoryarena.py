@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import weakref
+import typing # noqa: F401 # used in type check
+
+from . import plcmemory
+
+import logging
+log = logging.getLogger(__name__)
+
+class PLCMemoryArena:
+    """
+    PLCMemoryArena hosts many namespaced PLCMemory instances in one process, typically one per MUJIN controller. Every memory keeps its own lock, while the arena provides the shared infrastructure: a single dispatcher delivering notifications for all memories, observers such as a PLCMemoryJournal attached to every memory, and one place to collect statistics.
+
+    PLCZMQServer and PLCUDPServer accept an arena in place of a memory, and route every request to the namespace it names, so a single server thread serves all controllers. Requests without a namespace go to the default memory, whose namespace is empty and which every arena has from the start.
+    """
+
+    _dispatcher = None # type: typing.Optional[plcmemory.PLCMemoryDispatcher] # shared by all memories in the arena
+    _memoryOptions = None # type: typing.Dict[str, typing.Any] # keyword arguments used to create every memory
+    _lock = None # type: threading.Lock # protects _memories and _observers
+    _memories = None # type: typing.Dict[str, plcmemory.PLCMemory] # memories by namespace
+    _observers = None # type: typing.Set[typing.Any] # observers attached to every memory, including those created later
+
+    def __init__(self, dispatcher: typing.Optional[plcmemory.PLCMemoryDispatcher] = None, **memoryOptions: typing.Any):
+        """
+        :param dispatcher: Dispatcher shared by all memories. By default the arena creates one, so that no memory notifies its observers under its lock.
+        :param memoryOptions: Additional keyword arguments passed to PLCMemory when creating memories, such as changeLogSize.
+        """
+        self._dispatcher = dispatcher if dispatcher is not None else plcmemory.PLCMemoryDispatcher()
+        self._memoryOptions = memoryOptions
+        self._lock = threading.Lock()
+        self._memories = {}
+        self._observers = weakref.WeakSet()
+        self.CreateMemory('')
+
+    def CreateMemory(self, namespace: str) -> plcmemory.PLCMemory:
+        """
+        Create the memory of a namespace. Observers added to the arena are attached to it.
+        """
+        with self._lock:
+            if namespace in self._memories:
+                raise ValueError('namespace %s already exists' % namespace)
+            memory = plcmemory.PLCMemory(dispatcher=self._dispatcher, namespace=namespace, **self._memoryOptions)
+            self._memories[namespace] = memory
+            observers = list(self._observers)
+        for observer in observers:
+            memory.AddObserver(observer)
+        return memory
+
+    def GetMemory(self, namespace: str) -> plcmemory.PLCMemory:
+        """
+        Memory of a namespace. Raises KeyError if the namespace does not exist.
+        """
+        return self._memories[namespace]
+
+    def GetDefaultMemory(self) -> plcmemory.PLCMemory:
+        """
+        Memory of the empty namespace, used for requests without a namespace.
+        """
+        return self._memories['']
+
+    def GetNamespaces(self) -> typing.List[str]:
+        with self._lock:
+            return sorted(self._memories)
+
+    def AddObserver(self, observer: typing.Any, keys: typing.Optional[typing.Iterable[str]] = None, prefixes: typing.Optional[typing.Iterable[str]] = None) -> None:
+        """
+        Register an observer on every memory in the arena, including memories created later. The namespace of each notification is in its namespace attribute.
+
+        :param keys: If given, the observer is only notified of modifications to these keys.
+        :param prefixes: If given, the observer is only notified of modifications to keys starting with one of these prefixes.
+        """
+        if keys is not None or prefixes is not None:
+            raise ValueError('arena observers cannot be filtered, add filtered observers to individual memories instead')
+        with self._lock:
+            self._observers.add(observer)
+            memories = list(self._memories.values())
+        for memory in memories:
+            memory.AddObserver(observer)
+
+    def GetStats(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """
+        Statistics of every memory in the arena.
+
+        :return: A dictionary mapping namespaces to the statistics returned by PLCMemory.GetStats.
+        """
+        with self._lock:
+            memories = dict(self._memories)
+        return {namespace: memory.GetStats() for namespace, memory in memories.items()}
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import typing # noqa: F401 # used in type check
+
+import logging
+log = logging.getLogger(__name__)
+
+def _GetMonotonicTimestamp() -> int:
+    return int(time.monotonic() * 1000000000)
+
+class PLCHistogram:
+    """
+    Histogram with power of two buckets, cheap enough to be updated on every write. Bucket i counts the values v with 2**(i-1) <= v < 2**i.
+    """
+
+    _buckets = None # type: typing.List[int]
+    _count = 0 # type: int
+    _total = 0 # type: int
+    _maximum = 0 # type: int
+
+    def __init__(self):
+        self._buckets = [0] * 65
+        self._count = 0
+        self._total = 0
+        self._maximum = 0
+
+    def Record(self, value: int) -> None:
+        self._buckets[min(max(value, 0).bit_length(), 64)] += 1
+        self._count += 1
+        self._total += value
+        if value > self._maximum:
+            self._maximum = value
+
+    def GetPercentile(self, percentile: float) -> int:
+        """
+        Upper bound of the bucket containing the given percentile, 0 if nothing was recorded.
+
+        :param percentile: Percentile between 0 and 100.
+        """
+        remaining = self._count * percentile / 100.0
+        for index, count in enumerate(self._buckets):
+            remaining -= count
+            if count and remaining <= 0:
+                return min(1 << index, self._maximum)
+        return self._maximum
+
+    def GetStats(self) -> typing.Dict[str, typing.Any]:
+        """
+        :return: A dictionary containing the count, total, mean, maximum, and approximate 50th and 99th percentiles of the recorded values.
+        """
+        return {
+            'count': self._count,
+            'total': self._total,
+            'mean': self._total / self._count if self._count else 0.0,
+            'max': self._maximum,
+            'p50': self.GetPercentile(50),
+            'p99': self.GetPercentile(99),
+        }
+
+class PLCMemoryInstrumentation:
+    """
+    PLCMemoryInstrumentation records where time goes in a PLCMemory: how long writers wait for and hold the memory lock, how often each key is written, how large modification batches are, and how long each observer takes to be notified. All times are in nanoseconds.
+
+    Created by PLCMemory when constructed with instrumentation=True. Everything except notification latency is recorded under the memory lock, and notifications are delivered one at a time, either under the memory lock or by the dispatcher, so no additional locking is needed.
+    """
+
+    _startTimestamp = 0 # type: int # when recording started
+    _lockWait = None # type: PLCHistogram # time spent waiting for the memory lock
+    _lockHold = None # type: PLCHistogram # time the memory lock was held
+    _batchSize = None # type: PLCHistogram # number of modifications per batch
+    _keyWrites = None # type: typing.Dict[str, int] # number of batches modifying each key
+    _observerLatency = None # type: typing.Dict[str, PLCHistogram] # time spent in MemoryModified by observer class
+
+    def __init__(self):
+        self._startTimestamp = _GetMonotonicTimestamp()
+        self._lockWait = PLCHistogram()
+        self._lockHold = PLCHistogram()
+        self._batchSize = PLCHistogram()
+        self._keyWrites = {}
+        self._observerLatency = {}
+
+    def RecordLock(self, waitDuration: int, holdDuration: int) -> None:
+        if waitDuration >= 0:
+            self._lockWait.Record(waitDuration)
+        if holdDuration >= 0:
+            self._lockHold.Record(holdDuration)
+
+    def RecordBatch(self, modifications: typing.Iterable[str]) -> None:
+        keyWrites = self._keyWrites
+        count = 0
+        for key in modifications:
+            keyWrites[key] = keyWrites.get(key, 0) + 1
+            count += 1
+        self._batchSize.Record(count)
+
+    def RecordNotification(self, observer: typing.Any, duration: int) -> None:
+        name = GetObserverName(observer)
+        histogram = self._observerLatency.get(name)
+        if histogram is None:
+            histogram = self._observerLatency[name] = PLCHistogram()
+        histogram.Record(duration)
+
+    def WrapNotifications(self, notifications: typing.List[typing.Tuple[typing.Any, typing.Any]]) -> typing.List[typing.Tuple[typing.Any, typing.Any]]:
+        """
+        Wrap observers so that the time spent notifying them is recorded, wherever the notification is delivered.
+        """
+        return [(_PLCTimedObserver(observer, self), modifications) for observer, modifications in notifications]
+
+    def GetStats(self) -> typing.Dict[str, typing.Any]:
+        """
+        :return: A dictionary containing the lock wait, lock hold and batch size histograms, the number of writes and writes per second of every key, and the notification latency histogram of every observer class.
+        """
+        elapsed = max(_GetMonotonicTimestamp() - self._startTimestamp, 1) / 1e9
+        return {
+            'elapsed': elapsed,
+            'lockWait': self._lockWait.GetStats(),
+            'lockHold': self._lockHold.GetStats(),
+            'batchSize': self._batchSize.GetStats(),
+            'keyWrites': {key: {'count': count, 'rate': count / elapsed} for key, count in list(self._keyWrites.items())},
+            'observerLatency': {name: histogram.GetStats() for name, histogram in list(self._observerLatency.items())},
+        }
+
+def GetObserverName(observer: typing.Any) -> str:
+    """
+    Name under which an observer is recorded in statistics. Observers of the same class share one entry, so that short lived observers such as a PLCController per order do not add an entry each, and the statistics stay bounded.
+    """
+    return observer.__class__.__name__
+
+class _PLCTimedObserver:
+    """
+    Forwards a notification to an observer and records how long it took.
+    """
+
+    __slots__ = ('observer', 'instrumentation')
+
+    def __init__(self, observer: typing.Any, instrumentation: PLCMemoryInstrumentation):
+        self.observer = observer
+        self.instrumentation = instrumentation
+
+    def MemoryModified(self, modifications: typing.Any) -> None:
+        start = _GetMonotonicTimestamp()
+        try:
+            self.observer.MemoryModified(modifications)
+        finally:
+            self.instrumentation.RecordNotification(self.observer, _GetMonotonicTimestamp() - start)
+
+class PLCInstrumentedLock:
+    """
+    Wraps the lock of a PLCMemory to record how long it is waited for and held.
+    """
+
+    _lock = None # type: typing.Any # wrapped lock
+    _instrumentation = None # type: PLCMemoryInstrumentation
+    _waitDuration = 0 # type: int # how long the current holder waited for the lock
+    _acquiredTimestamp = 0 # type: int # when the current holder acquired the lock
+
+    def __init__(self, lock: typing.Any, instrumentation: PLCMemoryInstrumentation):
+        self._lock = lock
+        self._instrumentation = instrumentation
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        start = _GetMonotonicTimestamp()
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            self._acquiredTimestamp = _GetMonotonicTimestamp()
+            self._waitDuration = self._acquiredTimestamp - start
+        return acquired
+
+    def release(self) -> None:
+        self._instrumentation.RecordLock(self._waitDuration, _GetMonotonicTimestamp() - self._acquiredTimestamp)
+        self._lock.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, exceptionType: typing.Any, exceptionValue: typing.Any, traceback: typing.Any) -> None:
+        self.release()
+
+def GetHotspots(stats: typing.Mapping[str, typing.Any], previousStats: typing.Optional[typing.Mapping[str, typing.Any]] = None) -> typing.Dict[str, typing.Any]:
+    """
+    Find the contention hotspots in instrumentation statistics returned by PLCMemoryInstrumentation.GetStats.
+
+    :param previousStats: If given, statistics from an earlier call, so that hotspots are computed over the time in between instead of since recording started.
+    :return: A dictionary containing the most written key and its writes per second, and the observer that took the most time to notify and its total time in nanoseconds. Values are None when there is nothing to report.
+    """
+    elapsed = stats['elapsed']
+    keyWrites = {key: value['count'] for key, value in stats['keyWrites'].items()}
+    observerTotals = {name: value['total'] for name, value in stats['observerLatency'].items()}
+    if previousStats is not None:
+        elapsed -= previousStats['elapsed']
+        for key, value in previousStats['keyWrites'].items():
+            if key in keyWrites:
+                keyWrites[key] -= value['count']
+        for name, value in previousStats['observerLatency'].items():
+            if name in observerTotals:
+                observerTotals[name] -= value['total']
+
+    hotspots = {
+        'key': None,
+        'keyRate': None,
+        'observer': None,
+        'observerTotal': None,
+    } # type: typing.Dict[str, typing.Any]
+    if keyWrites:
+        key = max(keyWrites, key=lambda key: keyWrites[key])
+        if keyWrites[key] > 0:
+            hotspots['key'] = key
+            hotspots['keyRate'] = keyWrites[key] / max(elapsed, 1e-9)
+    if observerTotals:
+        name = max(observerTotals, key=lambda name: observerTotals[name])
+        if observerTotals[name] > 0:
+            hotspots['observer'] = name
+            hotspots['observerTotal'] = observerTotals[name]
+    return hotspots
+
+class PLCMemoryStatsDumper:
+    """
+    PLCMemoryStatsDumper periodically logs the instrumentation statistics of an instrumented PLCMemory, or of every instrumented memory in a PLCMemoryArena, and flags the most written key and the slowest observer over the last interval.
+    """
+
+    _target = None # type: typing.Any # PLCMemory or PLCMemoryArena
+    _interval = 10.0 # type: float # seconds between dumps
+    _thread = None # type: typing.Optional[threading.Thread] # dump thread
+    _isok = False # type: bool # signal that the dump thread should continue to run
+    _condition = None # type: threading.Condition # wakes up the dump thread when stopping
+    _previousStats = None # type: typing.Dict[str, typing.Any] # statistics of the previous dump by namespace
+
+    def __init__(self, target: typing.Any, interval: float = 10.0):
+        """
+        :param target: PLCMemory or PLCMemoryArena constructed with instrumentation=True.
+        :param interval: Seconds between dumps.
+        """
+        self._target = target
+        self._interval = interval
+        self._isok = False
+        self._condition = threading.Condition()
+        self._previousStats = {}
+
+    def __del__(self):
+        self.Stop()
+
+    def Start(self) -> None:
+        """
+        Start dumping statistics on a background thread.
+        """
+        self.Stop()
+
+        self._isok = True
+        self._thread = threading.Thread(target=self._RunThread, name='plcmemorystats')
+        self._thread.start()
+
+    def IsRunning(self) -> bool:
+        return self._isok
+
+    def SetStop(self) -> None:
+        with self._condition:
+            self._isok = False
+            self._condition.notify_all()
+
+    def Stop(self) -> None:
+        """
+        Stop dumping statistics. Will block until the background thread terminates.
+        """
+        self.SetStop()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def Dump(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """
+        Log the statistics now.
+
+        :return: Hotspots since the previous dump by namespace, as returned by GetHotspots.
+        """
+        stats = self._target.GetStats()
+        if 'version' in stats:
+            # a single memory rather than an arena
+            stats = {self._target.GetNamespace(): stats}
+
+        allHotspots = {}
+        for namespace, memoryStats in sorted(stats.items()):
+            instrumentationStats = memoryStats.get('instrumentation')
+            if instrumentationStats is None:
+                continue
+            hotspots = GetHotspots(instrumentationStats, self._previousStats.get(namespace))
+            self._previousStats[namespace] = instrumentationStats
+            allHotspots[namespace] = hotspots
+
+            log.info('memory %r: version %d, lock wait p99 %dns max %dns, lock hold p99 %dns max %dns, %.1f modifications per batch',
+                     namespace, memoryStats['version'],
+                     instrumentationStats['lockWait']['p99'], instrumentationStats['lockWait']['max'],
+                     instrumentationStats['lockHold']['p99'], instrumentationStats['lockHold']['max'],
+                     instrumentationStats['batchSize']['mean'])
+            if hotspots['key'] is not None:
+                log.info('memory %r: hottest key %s written %.1f times per second', namespace, hotspots['key'], hotspots['keyRate'])
+            if hotspots['observer'] is not None:
+                log.info('memory %r: slowest observer %s took %.3fms in total', namespace, hotspots['observer'], hotspots['observerTotal'] / 1e6)
+        return allHotspots
+
+    def _RunThread(self) -> None:
+        deadline = time.monotonic() + self._interval
+        while self._isok:
+            with self._condition:
+                while self._isok and time.monotonic() < deadline:
+                    self._condition.wait(deadline - time.monotonic())
+                if not self._isok:
+                    return
+            deadline += self._interval
+            try:
+                self.Dump()
+            except Exception as e:
+                log.exception('failed to dump memory statistics: %s', e)
@@ -44,7 +44,7 @@ class PLCPickWorkerBackend:
         if not self._clearStatePerformed:
             log.error('%srunning order cycle without first clearing state', self._logPrefix)
 
-        controller = plccontroller.PLCController(self._memory)
+        controller = plccontroller.PLCController(self._memory, keys=['stopOrderCycle'], prefixes=['location'])
 
         isPrepared = False
         if self._preparedOrder is not None and \
@@ -113,7 +113,7 @@ class PLCPickWorkerBackend:
         if not self._clearStatePerformed:
             log.error('%srunning preparation without first clearing state', self._logPrefix)
 
-        controller = plccontroller.PLCController(self._memory)
+        controller = plccontroller.PLCController(self._memory, keys=['stopPreparation'], prefixes=['location'])
 
         self._preparedOrder = None
 
@@ -199,7 +199,7 @@ class PLCPickWorkerSimulator:
                 self._threads[trigger] = None
 
     def _RunThread(self) -> None:
-        controller = plccontroller.PLCController(self._memory)
+        controller = plccontroller.PLCController(self._memory, keys=self._threads.keys())
 
         controller.SetMultiple({
             'isModeAuto': True,
@@ -220,7 +220,8 @@ class PLCPickWorkerSimulator:
                 time.sleep(0.1)
                 continue
 
-            if not controller.WaitUntilAny(triggerSignals, timeout=0.1):
+            firedSignals = controller.Select(triggerSignals, timeout=0.1)
+            if not firedSignals:
                 # nothing need to be triggered
                 continue
 
@@ -231,7 +232,7 @@ class PLCPickWorkerSimulator:
                 'startPreparation': self._RunPreparationCycleThread,
             }
             for triggerSignal, target in triggerMapping.items():
-                if triggerSignal in triggerSignals and controller.GetBoolean(triggerSignal):
+                if triggerSignal in firedSignals:
                     log.debug('%sstarting a thread to handle: %s', self._logPrefix, triggerSignal)
                     thread = threading.Thread(target=target, name=triggerSignal)
                     thread.start()
@@ -245,7 +246,7 @@ class PLCPickWorkerSimulator:
 
     def _RunResetErrorThread(self) -> None:
         loop = asyncio.new_event_loop()
-        controller = plccontroller.PLCController(self._memory)
+        controller = plccontroller.PLCController(self._memory, keys=['resetError'])
         try:
             if not controller.SyncAndGetBoolean('resetError'):
                 # trigger no longer alive
@@ -272,7 +273,7 @@ class PLCPickWorkerSimulator:
 
     def _RunClearStateThread(self) -> None:
         loop = asyncio.new_event_loop()
-        controller = plccontroller.PLCController(self._memory)
+        controller = plccontroller.PLCController(self._memory, keys=['clearState'])
         try:
             if not controller.SyncAndGetBoolean('clearState'):
                 # trigger no longer alive
@@ -295,7 +296,7 @@ class PLCPickWorkerSimulator:
 
     def _RunOrderCycleThread(self) -> None:
         loop = asyncio.new_event_loop()
-        controller = plccontroller.PLCController(self._memory)
+        controller = plccontroller.PLCController(self._memory, keys=['startOrderCycle'], prefixes=['order'])
         status = PLCOrderCycleStatus()
         try:
             if not controller.SyncAndGetBoolean('startOrderCycle'):
@@ -356,7 +357,7 @@ class PLCPickWorkerSimulator:
 
     def _RunPreparationCycleThread(self) -> None:
         loop = asyncio.new_event_loop()
-        controller = plccontroller.PLCController(self._memory)
+        controller = plccontroller.PLCController(self._memory, keys=['startPreparation', 'startOrderCycle'], prefixes=['preparation'])
         status = PLCPreparationCycleStatus()
         try:
             if not controller.SyncAndGetBoolean('startPreparation'):
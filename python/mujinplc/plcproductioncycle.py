@@ -176,12 +176,15 @@ class PLCProductionCycle:
         while self._isok:
             controller.Wait(timeout=0.1)
 
-            self._RunStateMachine(controller)
-            self._RunOrderCycleStateMachine(controller)
-            self._RunPreparationCycleStateMachine(controller)
-            self._RunQueueOrderStateMachine(controller)
-            for locationIndex in self._locationIndices:
-                self._RunLocationStateMachine(controller, locationIndex)
+            # publish what the state machines set in this tick in as few modification batches as possible
+            # a state machine can pass through several states in one tick, and signals set and reset on the way, such as stopOrderCycle or clearState, still have to be seen by observers
+            with controller.Transaction(coalesce=False):
+                self._RunStateMachine(controller)
+                self._RunOrderCycleStateMachine(controller)
+                self._RunPreparationCycleStateMachine(controller)
+                self._RunQueueOrderStateMachine(controller)
+                for locationIndex in self._locationIndices:
+                    self._RunLocationStateMachine(controller, locationIndex)
 
     #
     # Main Production Cycle State Machine
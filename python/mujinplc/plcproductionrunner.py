@@ -6,7 +6,7 @@ import asyncio
 import typing # noqa: F401 # used in type check
 import enum
 
-from . import plcmemory, plclogic, plccontroller
+from . import plcmemory, plclogic, plccontroller, plcsignaldispatcher
 from . import PLCDataObject
 
 import logging
@@ -108,6 +108,7 @@ class PLCProductionRunner:
     """
 
     _memory = None # type: plcmemory.PLCMemory # an instance of PLCMemory
+    _signalDispatcher = None # type: plcsignaldispatcher.PLCSignalDispatcher # shared by QueueOrder callers, so they do not need a controller each
     _materialHandler = None # type: PLCMaterialHandler # an instance of PLCMaterialHandler, supplied by customer
     _locationIndices = None # type: typing.List[int]
     _logPrefix = '' # type: str
@@ -119,6 +120,7 @@ class PLCProductionRunner:
 
     def __init__(self, memory: plcmemory.PLCMemory, materialHandler: PLCMaterialHandler, maxLocationIndex: int = 4, logPrefix: str = ''):
         self._memory = memory
+        self._signalDispatcher = plcsignaldispatcher.PLCSignalDispatcher(memory, keys=['isRunningQueueOrder', 'queueOrderFinishCode'])
         self._materialHandler = materialHandler
         assert(maxLocationIndex > 0)
         self._locationIndices = list(range(1, maxLocationIndex + 1))
@@ -156,10 +158,16 @@ class PLCProductionRunner:
         self._moveLocationThreads = {}
 
     def QueueOrder(self, orderUniqueId: str, queueOrderParameters: PLCQueueOrderParameters) -> None:
-        controller = plccontroller.PLCController(self._memory)
-        if not controller.WaitUntil('isRunningQueueOrder', False, timeout=1.0):
+        signalDispatcher = self._signalDispatcher
+        if not signalDispatcher.Wait(signalDispatcher.WaitUntil('isRunningQueueOrder', False), timeout=1.0):
             raise Exception('QueueOrder is already running on server side')
-        controller.SetMultiple({
+
+        # claim the trigger and write the parameters atomically, so that concurrent callers cannot overwrite each other's parameters
+        startQueueOrder = self._memory.Read(['startQueueOrder']).get('startQueueOrder')
+        if startQueueOrder or not self._memory.WriteIf({
+            'isRunningQueueOrder': False,
+            'startQueueOrder': startQueueOrder,
+        }, {
             'queueOrderUniqueId': orderUniqueId,
             'queueOrderPartType': queueOrderParameters.partType,
             'queueOrderPartSizeX': queueOrderParameters.partSizeX,
@@ -179,24 +187,28 @@ class PLCProductionRunner:
             'queueOrderPackFormationComputationName': queueOrderParameters.packFormationComputationName,
             'queueOrderIgnoreFinishPosition': queueOrderParameters.ignoreFinishPosition,
             'startQueueOrder': True,
-        })
+        }):
+            raise Exception('QueueOrder is already running')
         try:
             # TODO: later, we need timeout handling
-            controller.WaitUntil('isRunningQueueOrder', True)
-            controller.Set('startQueueOrder', False)
-            controller.WaitUntil('isRunningQueueOrder', False)
-            finishCode = PLCQueueOrderFinishCode(controller.GetInteger('queueOrderFinishCode'))
+            signalDispatcher.Wait(signalDispatcher.WaitUntil('isRunningQueueOrder', True))
+            self._memory.Write({'startQueueOrder': False})
+            signalDispatcher.Wait(signalDispatcher.WaitUntil('isRunningQueueOrder', False))
+            finishCode = PLCQueueOrderFinishCode(signalDispatcher.GetInteger('queueOrderFinishCode'))
             if finishCode != PLCQueueOrderFinishCode.Success:
                 raise Exception('QueueOrder failed with finish code: %r' % finishCode)
             log.warn('%ssuccessfully queued order: %s: %r', self._logPrefix, orderUniqueId, queueOrderParameters)
         finally:
-            controller.Set('startQueueOrder', False)
+            self._memory.Write({'startQueueOrder': False})
 
     def _RunThread(self) -> None:
         productionCycleStarted = False
 
         # monitor startMoveLocationX and startFinishOrder, then spin threads to handle them
-        controller = plccontroller.PLCController(self._memory)
+        triggerKeys = ['isRunningProductionCycle', 'startFinishOrder']
+        for locationIndex in self._locationIndices:
+            triggerKeys.append('startMoveLocation%d' % locationIndex)
+        controller = plccontroller.PLCController(self._memory, keys=triggerKeys)
 
         # clear signals
         signalsToClear = {
@@ -242,15 +254,14 @@ class PLCProductionRunner:
                     time.sleep(0.1)
                     continue
 
-                if not controller.WaitUntilAny(triggerSignals, timeout=0.1):
+                firedSignals = controller.Select(triggerSignals, timeout=0.1)
+                if not firedSignals:
                     # nothing need to be triggered
                     continue
 
                 for locationIndex in self._locationIndices:
                     triggerSignal = 'startMoveLocation%d' % locationIndex
-                    if triggerSignal not in triggerSignals:
-                        continue
-                    if not controller.GetBoolean(triggerSignal):
+                    if triggerSignal not in firedSignals:
                         continue
                     log.debug('%sstarting a thread to handle %s', self._logPrefix, triggerSignal)
                     thread = threading.Thread(target=self._RunMoveLocationThread, args=(locationIndex,), name='moveLocation%d' % locationIndex)
@@ -258,7 +269,7 @@ class PLCProductionRunner:
                     self._moveLocationThreads[locationIndex] = thread
 
                 triggerSignal = 'startFinishOrder'
-                if triggerSignal in triggerSignals and controller.GetBoolean(triggerSignal):
+                if triggerSignal in firedSignals:
                     log.debug('%sstarting a thread to handle %s', self._logPrefix, triggerSignal)
                     thread = threading.Thread(target=self._RunFinishOrderThread, name='finishOrder')
                     thread.start()
@@ -270,7 +281,12 @@ class PLCProductionRunner:
 
     def _RunMoveLocationThread(self, locationIndex: int) -> None:
         loop = asyncio.new_event_loop()
-        controller = plccontroller.PLCController(self._memory)
+        controller = plccontroller.PLCController(self._memory, keys=[
+            'startMoveLocation%d' % locationIndex,
+            'moveLocation%dExpectedContainerId' % locationIndex,
+            'moveLocation%dExpectedContainerType' % locationIndex,
+            'moveLocation%dOrderUniqueId' % locationIndex,
+        ])
         finishCode = PLCMoveLocationFinishCode.GenericError
         actualContainerId = '?' # use ? to indicate location without container, because empty means feature disabled
         actualContainerType = '?' # use ? to indicate location without container, because empty means feature disabled
@@ -316,7 +332,12 @@ class PLCProductionRunner:
 
     def _RunFinishOrderThread(self) -> None:
         loop = asyncio.new_event_loop()
-        controller = plccontroller.PLCController(self._memory)
+        controller = plccontroller.PLCController(self._memory, keys=[
+            'startFinishOrder',
+            'finishOrderOrderUniqueId',
+            'finishOrderOrderCycleFinishCode',
+            'finishOrderNumPutInDestination',
+        ])
         finishCode = PLCFinishOrderFinishCode.GenericError
         try:
             if not controller.SyncAndGetBoolean('startFinishOrder'):
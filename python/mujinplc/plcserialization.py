@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import typing # noqa: F401 # used in type check
+
+import logging
+log = logging.getLogger(__name__)
+
+ValueType = typing.Optional[typing.Union[str, int, bool]]
+
+# every value is tagged with one byte describing its type
+_tagNone = b'n'[0]
+_tagTrue = b't'[0]
+_tagFalse = b'f'[0]
+_tagInteger = b'i'[0]
+_tagString = b's'[0]
+
+def EncodeKeyValues(keyvalues: typing.Mapping[str, ValueType]) -> bytes:
+    """
+    Encode PLC memory key values into a compact binary form.
+
+    The encoding is a 32-bit count followed by, for each entry, a 16-bit key length, the UTF-8 key, a one byte type tag, and the value: nothing for None and booleans, a 64-bit integer for integers, or a 32-bit length and UTF-8 bytes for strings. All integers are little-endian.
+    """
+    chunks = [struct.pack('<I', len(keyvalues))]
+    for key, value in keyvalues.items():
+        encodedKey = key.encode('utf-8')
+        chunks.append(struct.pack('<H', len(encodedKey)))
+        chunks.append(encodedKey)
+        if value is None:
+            chunks.append(bytes([_tagNone]))
+        elif value is True:
+            chunks.append(bytes([_tagTrue]))
+        elif value is False:
+            chunks.append(bytes([_tagFalse]))
+        elif isinstance(value, int):
+            chunks.append(struct.pack('<Bq', _tagInteger, value))
+        elif isinstance(value, str):
+            encodedValue = value.encode('utf-8')
+            chunks.append(struct.pack('<BI', _tagString, len(encodedValue)))
+            chunks.append(encodedValue)
+        else:
+            raise ValueError('value of %s is of unsupported type %r' % (key, type(value)))
+    return b''.join(chunks)
+
+def DecodeKeyValues(buffer: typing.Any, offset: int = 0) -> typing.Tuple[typing.Dict[str, ValueType], int]:
+    """
+    Decode PLC memory key values encoded with EncodeKeyValues. The buffer can be anything supporting the buffer protocol, such as bytes or an mmap.
+
+    :return: A tuple of the decoded key values and the offset right after them.
+    """
+    keyvalues = {} # type: typing.Dict[str, ValueType]
+    count, = struct.unpack_from('<I', buffer, offset)
+    offset += 4
+    for index in range(count):
+        keyLength, = struct.unpack_from('<H', buffer, offset)
+        offset += 2
+        key = bytes(buffer[offset:offset + keyLength]).decode('utf-8')
+        offset += keyLength
+        tag = buffer[offset]
+        offset += 1
+        if tag == _tagNone:
+            keyvalues[key] = None
+        elif tag == _tagTrue:
+            keyvalues[key] = True
+        elif tag == _tagFalse:
+            keyvalues[key] = False
+        elif tag == _tagInteger:
+            keyvalues[key], = struct.unpack_from('<q', buffer, offset)
+            offset += 8
+        elif tag == _tagString:
+            valueLength, = struct.unpack_from('<I', buffer, offset)
+            offset += 4
+            keyvalues[key] = bytes(buffer[offset:offset + valueLength]).decode('utf-8')
+            offset += valueLength
+        else:
+            raise ValueError('unknown value tag %r for %s at offset %d' % (tag, key, offset - 1))
+    return keyvalues, offset
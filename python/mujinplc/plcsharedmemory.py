@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import mmap
+import time
+import fcntl
+import socket
+import struct
+import threading
+import zlib
+import weakref
+import collections.abc
+import typing # noqa: F401 # used in type check
+
+from . import plcmemory, plcstorage, plcderivedsignal
+
+import logging
+log = logging.getLogger(__name__)
+
+class PLCSharedStorage(collections.abc.MutableMapping):
+    """
+    PLCSharedStorage lays out the signals of a PLCSignalSchema in a memory mapped file, so that multiple processes can attach to the same values. Used internally by PLCSharedMemory.
+
+    Every slot is stored as one state byte (absent, value or None) followed by the value: one byte for booleans, a 64-bit integer for integers, and a 16-bit length followed by at most maxStringLength bytes of UTF-8 for strings.
+    """
+
+    _stateAbsent = 0
+    _stateValue = 1
+    _stateNull = 2
+
+    _schema = None # type: plcstorage.PLCSignalSchema
+    _buffer = None # type: typing.Any # memory mapped buffer
+    _baseOffset = 0 # type: int # offset of the first slot in the buffer
+    _maxStringLength = 0 # type: int
+    _slotOffsets = None # type: typing.List[int] # offset of each slot in the buffer
+    _size = 0 # type: int # total size of all slots in bytes
+
+    def __init__(self, schema: plcstorage.PLCSignalSchema, buffer: typing.Any, baseOffset: int, maxStringLength: int):
+        self._schema = schema
+        self._buffer = buffer
+        self._baseOffset = baseOffset
+        self._maxStringLength = maxStringLength
+        self._slotOffsets = []
+        offset = baseOffset
+        for slot in range(len(schema)):
+            self._slotOffsets.append(offset)
+            offset += 1 + self.GetValueSize(schema.GetType(slot), maxStringLength)
+        self._size = offset - baseOffset
+
+    @staticmethod
+    def GetValueSize(signalType: type, maxStringLength: int) -> int:
+        if signalType is bool:
+            return 1
+        if signalType is int:
+            return 8
+        return 2 + maxStringLength
+
+    def GetSize(self) -> int:
+        return self._size
+
+    def GetSchema(self) -> plcstorage.PLCSignalSchema:
+        return self._schema
+
+    def EncodeSlotValue(self, slot: int, value: plcmemory.PLCMemory.ValueType) -> bytes:
+        """
+        Encode a value of a slot into its state byte followed by the value. Raises ValueError if the value cannot be stored in the slot.
+        """
+        if value is None:
+            return bytes([self._stateNull])
+        signalType = self._schema.GetType(slot)
+        if signalType is bool and isinstance(value, bool):
+            return bytes([self._stateValue, 1 if value else 0])
+        if signalType is int and isinstance(value, int) and not isinstance(value, bool) and -(1 << 63) <= value < (1 << 63):
+            return bytes([self._stateValue]) + struct.pack('<q', value)
+        if signalType is str and isinstance(value, str):
+            encoded = value.encode('utf-8')
+            if len(encoded) > self._maxStringLength:
+                raise ValueError('signal %s is limited to %d bytes, but passed in value is %d bytes' % (self._schema.GetName(slot), self._maxStringLength, len(encoded)))
+            return bytes([self._stateValue]) + struct.pack('<H', len(encoded)) + encoded
+        raise ValueError('signal %s is of type %r, but passed in value is of type %r' % (self._schema.GetName(slot), signalType, type(value)))
+
+    def DecodeSlotValue(self, slot: int, buffer: typing.Any, offset: int) -> typing.Tuple[bool, plcmemory.PLCMemory.ValueType]:
+        """
+        Decode a value of a slot previously encoded with EncodeSlotValue.
+
+        :return: A tuple of whether the slot has a value, and the value.
+        """
+        state = buffer[offset]
+        if state == self._stateAbsent:
+            return False, None
+        if state == self._stateNull:
+            return True, None
+        signalType = self._schema.GetType(slot)
+        if signalType is bool:
+            return True, buffer[offset + 1] != 0
+        if signalType is int:
+            return True, struct.unpack_from('<q', buffer, offset + 1)[0]
+        length = struct.unpack_from('<H', buffer, offset + 1)[0]
+        return True, bytes(buffer[offset + 3:offset + 3 + length]).decode('utf-8')
+
+    def HasSlot(self, slot: int) -> bool:
+        return self._buffer[self._slotOffsets[slot]] != self._stateAbsent
+
+    def GetSlotValue(self, slot: int) -> plcmemory.PLCMemory.ValueType:
+        return self.DecodeSlotValue(slot, self._buffer, self._slotOffsets[slot])[1]
+
+    def SetSlotValue(self, slot: int, value: plcmemory.PLCMemory.ValueType) -> None:
+        self.SetEncodedSlotValue(slot, self.EncodeSlotValue(slot, value))
+
+    def SetEncodedSlotValue(self, slot: int, encoded: bytes) -> None:
+        offset = self._slotOffsets[slot]
+        self._buffer[offset:offset + len(encoded)] = encoded
+
+    def ReadSlotValues(self, slots: typing.Iterable[int]) -> typing.Dict[int, plcmemory.PLCMemory.ValueType]:
+        slotvalues = {}
+        for slot in slots:
+            present, value = self.DecodeSlotValue(slot, self._buffer, self._slotOffsets[slot])
+            if present:
+                slotvalues[slot] = value
+        return slotvalues
+
+    def Clear(self) -> None:
+        for slot in range(len(self._schema)):
+            self._buffer[self._slotOffsets[slot]] = self._stateAbsent
+
+    def __getitem__(self, key: str) -> plcmemory.PLCMemory.ValueType:
+        if key not in self._schema:
+            raise KeyError(key)
+        present, value = self.DecodeSlotValue(self._schema.GetSlot(key), self._buffer, self._slotOffsets[self._schema.GetSlot(key)])
+        if not present:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: plcmemory.PLCMemory.ValueType) -> None:
+        if key not in self._schema:
+            raise ValueError('signal %s is not part of the shared memory schema' % key)
+        self.SetSlotValue(self._schema.GetSlot(key), value)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._buffer[self._slotOffsets[self._schema.GetSlot(key)]] = self._stateAbsent
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._schema and self.HasSlot(self._schema.GetSlot(key)) # type: ignore
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for slot in range(len(self._schema)):
+            if self.HasSlot(slot):
+                yield self._schema.GetName(slot)
+
+    def __len__(self) -> int:
+        return sum(1 for slot in range(len(self._schema)) if self.HasSlot(slot))
+
+class PLCSharedLock:
+    """
+    A lock that excludes both other threads in this process and other processes attached to the same file. Used internally by PLCSharedMemory.
+    """
+
+    _lock = None # type: threading.Lock
+    _fileno = None # type: int
+
+    def __init__(self, fileno: int):
+        self._lock = threading.Lock()
+        self._fileno = fileno
+
+    def __enter__(self) -> 'PLCSharedLock':
+        self._lock.acquire()
+        try:
+            fcntl.flock(self._fileno, fcntl.LOCK_EX)
+        except Exception:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        try:
+            fcntl.flock(self._fileno, fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+class PLCSharedMemory(plcmemory.PLCMemory):
+    """
+    PLCSharedMemory is a PLCMemory backed by a memory mapped file, so that the network server, the production cycle and customer code can each run in their own process and attach to the same memory.
+
+    Writers are serialized across processes with a file lock. Readers never take the lock, the sequence lock is kept in the file so that they retry if a write happened in any process while they were reading. Every write is also appended to a ring of change records in the file, and other processes are woken up through unix datagram sockets next to the file, so observers in every process are notified of every modification, in order.
+
+    All signals have to be described by a PLCSignalSchema, which has to be identical in every process.
+    """
+
+    _magic = b'MJPLCSHM'
+    _headerFormat = '<8sIIIIQQQQ' # magic, layout version, slot count, max string length, ring size, schema checksum, sequence lock, version, ring head
+    _headerSize = 64
+    _sequenceOffset = 32
+    _versionOffset = 40
+    _ringHeadOffset = 48
+    _recordHeaderFormat = '<QI' # version, slot
+    _layoutVersion = 1
+
+    _path = None # type: str
+    _file = None # type: typing.Any # open backing file
+    _buffer = None # type: typing.Any # memory mapped backing file
+    _storage = None # type: PLCSharedStorage
+    _ringSize = 0 # type: int # number of change records in the ring
+    _ringOffset = 0 # type: int # offset of the ring in the file
+    _recordSize = 0 # type: int # size of one change record
+    _ringPosition = 0 # type: int # number of change records this process has consumed
+
+    _notificationPath = None # type: str # path of the socket this process is woken up on
+    _notificationSocket = None # type: typing.Optional[socket.socket]
+    _isok = False # type: bool
+    _thread = None # type: typing.Optional[threading.Thread] # watches for changes made by other processes
+    _peerPaths = None # type: typing.Optional[typing.List[str]] # notification sockets of other processes, None until looked up
+    _peerRefreshTime = 0.0 # type: float # monotonic time of the last lookup of _peerPaths
+    _peerRefreshInterval = 1.0 # type: float # seconds after which _peerPaths is looked up again, so that processes attached since are notified
+
+    def __init__(self, path: str, schema: plcstorage.PLCSignalSchema, create: bool = False, maxStringLength: int = 64, ringSize: int = 4096, dispatcher: typing.Optional[plcmemory.PLCMemoryDispatcher] = None, changeLogSize: int = 1024):
+        """
+        :param path: Path of the backing file, typically on a tmpfs such as /dev/shm.
+        :param schema: Signals stored in the memory, has to be identical in every process.
+        :param create: Whether to create and clear the backing file. Exactly one process should create the memory before others attach to it.
+        :param maxStringLength: Maximum length of string values in bytes, only used when creating.
+        :param ringSize: Number of change records kept for other processes to catch up on, only used when creating.
+        """
+        self._path = path
+        checksum = zlib.crc32('\n'.join('%s:%s' % (schema.GetName(slot), schema.GetType(slot).__name__) for slot in range(len(schema))).encode('utf-8'))
+
+        if create:
+            storageSize = PLCSharedStorage(schema, bytearray(0), 0, maxStringLength).GetSize()
+            recordSize = struct.calcsize(self._recordHeaderFormat) + 1 + max(8, 2 + maxStringLength)
+            with open(path, 'wb') as f:
+                f.write(struct.pack(self._headerFormat, self._magic, self._layoutVersion, len(schema), maxStringLength, ringSize, checksum, 0, 0, 0).ljust(self._headerSize, b'\0'))
+                f.write(bytes(storageSize + ringSize * recordSize))
+
+        self._file = open(path, 'r+b')
+        self._buffer = mmap.mmap(self._file.fileno(), 0)
+        magic, layoutVersion, numSlots, maxStringLength, ringSize, fileChecksum, _, _, ringHead = struct.unpack_from(self._headerFormat, self._buffer, 0)
+        if magic != self._magic or layoutVersion != self._layoutVersion:
+            raise ValueError('%s is not a shared plc memory file' % path)
+        if numSlots != len(schema) or fileChecksum != checksum:
+            raise ValueError('schema of shared plc memory %s does not match' % path)
+
+        self._storage = PLCSharedStorage(schema, self._buffer, self._headerSize, maxStringLength)
+        self._ringSize = ringSize
+        self._ringOffset = self._headerSize + self._storage.GetSize()
+        self._recordSize = struct.calcsize(self._recordHeaderFormat) + 1 + max(8, 2 + maxStringLength)
+
+        super(PLCSharedMemory, self).__init__(dispatcher=dispatcher, changeLogSize=changeLogSize, storage=self._storage)
+        self._lock = PLCSharedLock(self._file.fileno()) # type: ignore
+        # values written by other processes show up without going through this process, so every signal of the schema is indexed up front
+        self._sortedKeys = sorted(schema.GetName(slot) for slot in range(len(schema)))
+        self._indexedKeys = set(self._sortedKeys)
+        self._version = struct.unpack_from('<Q', self._buffer, self._versionOffset)[0]
+        self._ringPosition = ringHead
+
+        # start listening to changes made by other processes
+        self._notificationPath = '%s.%d.%d.notify' % (path, os.getpid(), id(self))
+        self._notificationSocket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._notificationSocket.bind(self._notificationPath)
+        self._notificationSocket.settimeout(0.1)
+        self._isok = True
+        # the thread only holds a weak reference and is a daemon, so that neither keeps the memory or the interpreter alive when Close is not called
+        self._thread = threading.Thread(target=PLCSharedMemory._RunThread, args=(weakref.ref(self),), name='plcsharedmemory', daemon=True)
+        self._thread.start()
+
+    def __del__(self):
+        self.Close()
+
+    def Close(self) -> None:
+        """
+        Stop watching for changes made by other processes and detach from the backing file. Will block until the background thread terminates. Using the memory afterwards raises ValueError.
+        """
+        self._isok = False
+        if self._thread is not None:
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+        if self._notificationSocket is not None:
+            self._notificationSocket.close()
+            self._notificationSocket = None
+            try:
+                os.unlink(self._notificationPath)
+            except OSError:
+                pass
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _CheckOpen(self) -> None:
+        if self._buffer is None:
+            raise ValueError('shared plc memory %s is closed' % self._path)
+
+    @staticmethod
+    def _RunThread(memoryRef: 'weakref.ReferenceType[PLCSharedMemory]') -> None:
+        while True:
+            memory = memoryRef()
+            if memory is None or not memory._isok:
+                return
+            notificationSocket = memory._notificationSocket
+            del memory # do not keep the memory alive while waiting
+
+            try:
+                notificationSocket.recv(16) # type: ignore
+            except socket.timeout:
+                pass
+            except Exception as e:
+                log.exception('caught exception while waiting for shared memory notification: %s', e)
+                time.sleep(0.1)
+
+            memory = memoryRef()
+            if memory is None or not memory._isok:
+                return
+            try:
+                if struct.unpack_from('<Q', memory._buffer, memory._ringHeadOffset)[0] != memory._ringPosition:
+                    memory._CatchUpAndDispatch()
+            except Exception as e:
+                log.exception('caught exception while catching up with shared memory: %s', e)
+            del memory
+
+    def _CatchUp(self) -> bool:
+        """
+        Notify observers in this process of modifications written by other processes. Has to be called under lock.
+
+        :return: True if notifications are queued on the dispatcher, in which case Dispatch has to be called after the lock is released.
+        """
+        ringHead = struct.unpack_from('<Q', self._buffer, self._ringHeadOffset)[0]
+        if ringHead == self._ringPosition:
+            return False
+
+        dispatch = False
+        schema = self._storage.GetSchema()
+        if ringHead - self._ringPosition > self._ringSize:
+            # fell too far behind, notify observers of the whole state instead
+            log.warn('fell behind on shared memory %s by %d changes, notifying the whole state', self._path, ringHead - self._ringPosition)
+            self._version = struct.unpack_from('<Q', self._buffer, self._versionOffset)[0] - 1
+            dispatch = self._NotifyModified(dict(self._storage))
+            self._ringPosition = ringHead
+            return dispatch
+
+        modifications = {} # type: typing.Dict[str, plcmemory.PLCMemory.ValueType]
+        batchVersion = None
+        for position in range(self._ringPosition, ringHead):
+            offset = self._ringOffset + (position % self._ringSize) * self._recordSize
+            version, slot = struct.unpack_from(self._recordHeaderFormat, self._buffer, offset)
+            if batchVersion is not None and version != batchVersion and modifications:
+                self._version = batchVersion - 1
+                dispatch = self._NotifyModified(modifications) or dispatch
+                modifications = {}
+            batchVersion = version
+            _, value = self._storage.DecodeSlotValue(slot, self._buffer, offset + struct.calcsize(self._recordHeaderFormat))
+            modifications[schema.GetName(slot)] = value
+        if modifications:
+            self._version = batchVersion - 1 # type: ignore
+            dispatch = self._NotifyModified(modifications) or dispatch
+        self._ringPosition = ringHead
+        return dispatch
+
+    def _WriteEncodedSlots(self, encodedSlotValues: typing.Mapping[int, bytes]) -> bool:
+        """
+        Write already encoded slot values, append them to the change ring and notify observers. Has to be called under lock, after catching up.
+
+        :return: True if notifications are queued on the dispatcher, in which case Dispatch has to be called after the lock is released.
+        """
+        schema = self._storage.GetSchema()
+        currentSlotValues = self._storage.ReadSlotValues(encodedSlotValues.keys())
+        modifications = {} # type: typing.Dict[str, plcmemory.PLCMemory.ValueType]
+        modifiedSlots = [] # type: typing.List[typing.Tuple[int, bytes]]
+        for slot, encoded in encodedSlotValues.items():
+            _, value = self._storage.DecodeSlotValue(slot, encoded, 0)
+            if slot in currentSlotValues and value == currentSlotValues[slot]:
+                continue
+            modifications[schema.GetName(slot)] = value
+            modifiedSlots.append((slot, encoded))
+        if not modifications:
+            return False
+
+        version = self._version + 1
+        ringHead = struct.unpack_from('<Q', self._buffer, self._ringHeadOffset)[0]
+
+        # odd sequence tells readers a write is in progress
+        sequence = struct.unpack_from('<Q', self._buffer, self._sequenceOffset)[0]
+        struct.pack_into('<Q', self._buffer, self._sequenceOffset, sequence + 1)
+        for slot, encoded in modifiedSlots:
+            self._storage.SetEncodedSlotValue(slot, encoded)
+            offset = self._ringOffset + (ringHead % self._ringSize) * self._recordSize
+            struct.pack_into(self._recordHeaderFormat, self._buffer, offset, version, slot)
+            offset += struct.calcsize(self._recordHeaderFormat)
+            self._buffer[offset:offset + len(encoded)] = encoded
+            ringHead += 1
+        struct.pack_into('<QQ', self._buffer, self._versionOffset, version, ringHead)
+        struct.pack_into('<Q', self._buffer, self._sequenceOffset, sequence + 2)
+
+        self._ringPosition = ringHead
+        return self._NotifyModified(modifications)
+
+    def _GetPeerPaths(self) -> typing.List[str]:
+        """
+        Notification sockets of other processes attached to the same file, looked up again every _peerRefreshInterval seconds. A process that attached since the last lookup still catches up within the receive timeout of its thread.
+        """
+        now = time.monotonic()
+        if self._peerPaths is None or now - self._peerRefreshTime >= self._peerRefreshInterval:
+            self._peerPaths = [notificationPath for notificationPath in glob.glob(glob.escape(self._path) + '.*.notify') if notificationPath != self._notificationPath]
+            self._peerRefreshTime = now
+        return self._peerPaths
+
+    def _NotifyOtherProcesses(self) -> None:
+        for notificationPath in self._GetPeerPaths():
+            try:
+                self._notificationSocket.sendto(b'\0', notificationPath) # type: ignore
+            except (ConnectionRefusedError, FileNotFoundError):
+                # process went away, look the peers up again next time
+                self._peerPaths = None
+                try:
+                    os.unlink(notificationPath)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                # receiver already has pending notifications
+                pass
+            except Exception as e:
+                log.exception('caught exception when notifying %s: %s', notificationPath, e)
+
+    def _GetSequence(self) -> int:
+        self._CheckOpen()
+        return struct.unpack_from('<Q', self._buffer, self._sequenceOffset)[0] # type: ignore
+
+    def _GetSchemaSlots(self, keyvalues: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> typing.Dict[int, plcmemory.PLCMemory.ValueType]:
+        schema = self._storage.GetSchema()
+        for key in keyvalues:
+            if key not in schema:
+                raise ValueError('signal %s is not part of the shared memory schema' % key)
+        return {schema.GetSlot(key): value for key, value in keyvalues.items()}
+
+    def Write(self, keyvalues: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
+        """
+        Atomically write PLC memory. All keys have to be part of the schema.
+        """
+        self.WriteSlots(self._GetSchemaSlots(keyvalues))
+
+    def WriteIf(self, conditions: typing.Mapping[str, plcmemory.PLCMemory.ValueType], keyvalues: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> bool:
+        """
+        Atomically write PLC memory, only if all conditions hold at the time of the write. The conditions are checked under the lock shared by all processes. All keys have to be part of the schema.
+        """
+        return self._WriteSlotsIf(self._GetSchemaSlots(conditions), self._GetSchemaSlots(keyvalues))
+
+    def CompareAndSet(self, key: str, expectedValue: plcmemory.PLCMemory.ValueType, value: plcmemory.PLCMemory.ValueType) -> bool:
+        return self.WriteIf({key: expectedValue}, {key: value})
+
+    def AddDerivedSignal(self, key: str, expression: plcderivedsignal.PLCExpression) -> None:
+        """
+        Not supported, derived signals would have to be kept up to date by every process sharing the memory.
+        """
+        raise ValueError('derived signals are not supported by shared memory')
+
+    def GetSlots(self, keys: typing.Iterable[str]) -> typing.List[int]:
+        return self._storage.GetSchema().GetSlots(keys)
+
+    def ReadSlots(self, slots: typing.Iterable[int]) -> typing.Mapping[int, plcmemory.PLCMemory.ValueType]:
+        slots = list(slots)
+        return self._ReadConsistent(lambda: self._storage.ReadSlotValues(slots)) # type: ignore
+
+    def WriteSlots(self, slotvalues: typing.Mapping[int, plcmemory.PLCMemory.ValueType]) -> None:
+        self._WriteSlotsIf({}, slotvalues)
+
+    def _WriteSlotsIf(self, conditionSlotValues: typing.Mapping[int, plcmemory.PLCMemory.ValueType], slotvalues: typing.Mapping[int, plcmemory.PLCMemory.ValueType]) -> bool:
+        self._CheckOpen()
+        encodedSlotValues = {slot: self._storage.EncodeSlotValue(slot, value) for slot, value in slotvalues.items()}
+        with self._lock:
+            dispatch = self._CatchUp()
+            currentSlotValues = self._storage.ReadSlotValues(conditionSlotValues.keys())
+            met = all(currentSlotValues.get(slot) == value for slot, value in conditionSlotValues.items())
+            written = self._ringPosition
+            if met:
+                dispatch = self._WriteEncodedSlots(encodedSlotValues) or dispatch
+            written = self._ringPosition != written
+        if written:
+            self._NotifyOtherProcesses()
+        if dispatch:
+            self._dispatcher.Dispatch() # type: ignore
+        return met
+
+    def ReadSince(self, version: int) -> typing.Tuple[int, typing.Mapping[str, plcmemory.PLCMemory.ValueType], bool]:
+        self._CatchUpAndDispatch()
+        return super(PLCSharedMemory, self).ReadSince(version)
+
+    def GetVersion(self) -> int:
+        """
+        Version of the last modification batch written to the memory by any process. Catches up with other processes first, so that the version is never older than the values returned by Read.
+        """
+        self._CatchUpAndDispatch()
+        return super(PLCSharedMemory, self).GetVersion()
+
+    def AddObserver(self, observer: typing.Any, keys: typing.Optional[typing.Iterable[str]] = None, prefixes: typing.Optional[typing.Iterable[str]] = None) -> None:
+        self._CatchUpAndDispatch()
+        super(PLCSharedMemory, self).AddObserver(observer, keys=keys, prefixes=prefixes)
+
+    def _CatchUpAndDispatch(self) -> None:
+        self._CheckOpen()
+        with self._lock:
+            dispatch = self._CatchUp()
+        if dispatch:
+            self._dispatcher.Dispatch() # type: ignore
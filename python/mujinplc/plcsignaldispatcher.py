@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import concurrent.futures
+import typing # noqa: F401 # used in type check
+
+from . import plcmemory, plccontroller
+
+import logging
+log = logging.getLogger(__name__)
+
+class _PLCSignalWaiter:
+    """
+    An outstanding wait registered on PLCSignalDispatcher.
+    """
+
+    __slots__ = ('predicate', 'unsatisfied', 'keys', 'future')
+
+    def __init__(self, predicate: plccontroller.PLCWaitPredicate, unsatisfied: typing.Set[str], future: concurrent.futures.Future):
+        self.predicate = predicate
+        self.unsatisfied = unsatisfied # type: typing.Set[str] # expectation keys not yet at their expected value
+        self.keys = predicate.GetKeys() # type: typing.Set[str]
+        self.future = future
+
+class PLCSignalDispatcher:
+    """
+    PLCSignalDispatcher observes a PLCMemory once and keeps a single state snapshot, and resolves any number of outstanding waits from any number of threads or coroutines. Each wait is returned as a future, instead of every waiter creating its own PLCController with its own queue and its own copy of the state.
+
+    Example::
+
+        dispatcher = PLCSignalDispatcher(memory)
+        future = dispatcher.WaitUntil('isRunningOrderCycle', False)
+        if not dispatcher.Wait(future, timeout=1.0):
+            raise Exception('order cycle did not stop')
+
+    In a coroutine::
+
+        await dispatcher.WaitUntilAsync('isRunningOrderCycle', False)
+
+    Futures are resolved by the thread that wrote the memory, so their done callbacks run there. Unless the memory has a PLCMemoryDispatcher, that happens under the memory lock, and done callbacks must not write to the memory.
+    """
+
+    _memory = None # type: plcmemory.PLCMemory # an instance of PLCMemory
+    _lock = None # type: threading.Lock # protects _state and the waiters
+    _state = None # type: typing.Dict[str, plcmemory.PLCMemory.ValueType] # current state of the observed keys
+    _waiters = None # type: typing.Dict[str, typing.Set[_PLCSignalWaiter]] # outstanding waiters by the keys they depend on
+
+    def __init__(self, memory: plcmemory.PLCMemory, keys: typing.Optional[typing.Iterable[str]] = None, prefixes: typing.Optional[typing.Iterable[str]] = None):
+        """
+        :param keys: If given, only modifications to these keys are tracked, waits on other keys will never resolve.
+        :param prefixes: If given, only modifications to keys starting with one of these prefixes are tracked.
+        """
+        self._memory = memory
+        self._lock = threading.Lock()
+        self._state = {}
+        self._waiters = {}
+        memory.AddObserver(self, keys=keys, prefixes=prefixes)
+
+    def MemoryModified(self, modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
+        resolved = [] # type: typing.List[_PLCSignalWaiter]
+        with self._lock:
+            self._state.update(modifications)
+            if not self._waiters:
+                return
+
+            # only waiters depending on a modified key have to be looked at
+            candidates = set() # type: typing.Set[_PLCSignalWaiter]
+            for key in modifications:
+                waiters = self._waiters.get(key)
+                if waiters:
+                    candidates.update(waiters)
+            for waiter in candidates:
+                if waiter.predicate.Update(waiter.unsatisfied, modifications):
+                    self._RemoveWaiter(waiter)
+                    resolved.append(waiter)
+
+        # resolve outside of the lock, done callbacks may wait again
+        for waiter in resolved:
+            if waiter.future.set_running_or_notify_cancel():
+                waiter.future.set_result(True)
+
+    def WaitUntilPredicate(self, predicate: plccontroller.PLCWaitPredicate) -> concurrent.futures.Future:
+        """
+        Wait until a compiled predicate is true.
+
+        :return: A future that resolves to True once the predicate is true, immediately if it is already true. Cancel the future to stop waiting.
+        """
+        future = concurrent.futures.Future() # type: concurrent.futures.Future
+        with self._lock:
+            unsatisfied = None if predicate.IsEmpty() else predicate.Start(self._state)
+            if unsatisfied is not None:
+                waiter = _PLCSignalWaiter(predicate, unsatisfied, future)
+                for key in waiter.keys:
+                    self._waiters.setdefault(key, set()).add(waiter)
+        if unsatisfied is None:
+            future.set_running_or_notify_cancel()
+            future.set_result(True)
+            return future
+
+        future.add_done_callback(lambda future: self._CancelWaiter(waiter))
+        return future
+
+    def WaitUntilAllOrAny(self, expectations: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] = None, exceptions: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] = None) -> concurrent.futures.Future:
+        """
+        Wait until multiple keys are ALL at their expected value, OR ANY one key is at its exceptional value.
+
+        :return: A future that resolves to True once the condition holds.
+        """
+        return self.WaitUntilPredicate(plccontroller.PLCWaitPredicate(expectations, exceptions))
+
+    def WaitUntil(self, key: str, value: plcmemory.PLCMemory.ValueType) -> concurrent.futures.Future:
+        """
+        Wait until a key is at the expected value.
+
+        :return: A future that resolves to True once the key is at the expected value.
+        """
+        return self.WaitUntilPredicate(plccontroller.PLCWaitPredicate({key: value}))
+
+    def WaitUntilPredicateAsync(self, predicate: plccontroller.PLCWaitPredicate) -> asyncio.Future:
+        """
+        Same as WaitUntilPredicate, but returns an asyncio future of the current event loop. Cancelling it stops waiting.
+        """
+        return asyncio.wrap_future(self.WaitUntilPredicate(predicate))
+
+    def WaitUntilAllOrAnyAsync(self, expectations: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] = None, exceptions: typing.Optional[typing.Mapping[str, plcmemory.PLCMemory.ValueType]] = None) -> asyncio.Future:
+        return self.WaitUntilPredicateAsync(plccontroller.PLCWaitPredicate(expectations, exceptions))
+
+    def WaitUntilAsync(self, key: str, value: plcmemory.PLCMemory.ValueType) -> asyncio.Future:
+        return self.WaitUntilPredicateAsync(plccontroller.PLCWaitPredicate({key: value}))
+
+    def Wait(self, future: concurrent.futures.Future, timeout: typing.Optional[float] = None) -> bool:
+        """
+        Block until a future returned by one of the wait methods resolves, and stop waiting on timeout.
+
+        :return: True if successfully waited, False if timed out.
+        """
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            if future.cancel():
+                return False
+            # resolved right at the timeout
+            return future.result()
+
+    def Get(self, key: str, defaultValue: plcmemory.PLCMemory.ValueType = None) -> plcmemory.PLCMemory.ValueType:
+        """
+        Get value of a key in the current state snapshot.
+        """
+        with self._lock:
+            return self._state.get(key, defaultValue)
+
+    def GetMultiple(self, keys: typing.Iterable[str]) -> typing.Mapping[str, plcmemory.PLCMemory.ValueType]:
+        """
+        Get values of multiple keys in the current state snapshot, consistently.
+        """
+        with self._lock:
+            return {key: self._state[key] for key in keys if key in self._state}
+
+    def GetInteger(self, key: str, defaultValue: int = 0) -> int:
+        value = self.Get(key, defaultValue=defaultValue)
+        if not isinstance(value, int):
+            return defaultValue
+        return value
+
+    def GetWaiterCount(self) -> int:
+        """
+        Number of outstanding waits.
+        """
+        with self._lock:
+            waiters = set() # type: typing.Set[_PLCSignalWaiter]
+            for keyWaiters in self._waiters.values():
+                waiters.update(keyWaiters)
+            return len(waiters)
+
+    def _CancelWaiter(self, waiter: _PLCSignalWaiter) -> None:
+        """
+        Done callback of every pending future, unregisters the waiter when the future was cancelled.
+        """
+        if not waiter.future.cancelled():
+            return
+        with self._lock:
+            self._RemoveWaiter(waiter)
+
+    def _RemoveWaiter(self, waiter: _PLCSignalWaiter) -> None:
+        """
+        Has to be called under lock.
+        """
+        for key in waiter.keys:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[key]
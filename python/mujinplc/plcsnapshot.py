@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import time
+import struct
+import threading
+import typing # noqa: F401 # used in type check
+
+from . import plcmemory, plcserialization
+
+import logging
+log = logging.getLogger(__name__)
+
+_snapshotMagic = b'MJPLCSNP'
+_snapshotHeaderFormat = '<8sIQQ' # magic, format version, memory version, wall clock timestamp in nanoseconds
+_snapshotFormatVersion = 1
+
+def SaveSnapshot(path: str, keyvalues: typing.Mapping[str, plcmemory.PLCMemory.ValueType], version: int = 0) -> None:
+    """
+    Save PLC memory key values to a compact binary snapshot file. The file is replaced atomically, so a crash while saving leaves the previous snapshot intact.
+    """
+    data = struct.pack(_snapshotHeaderFormat, _snapshotMagic, _snapshotFormatVersion, version, int(time.time() * 1e9)) + plcserialization.EncodeKeyValues(keyvalues)
+    temporaryPath = '%s.tmp' % path
+    with open(temporaryPath, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporaryPath, path)
+
+def LoadSnapshot(path: str) -> typing.Dict[str, plcmemory.PLCMemory.ValueType]:
+    """
+    Load PLC memory key values from a snapshot file saved by SaveSnapshot. The file is memory mapped and decoded in place.
+    """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            magic, formatVersion, version, timestamp = struct.unpack_from(_snapshotHeaderFormat, buffer, 0)
+            if magic != _snapshotMagic or formatVersion != _snapshotFormatVersion:
+                raise ValueError('%s is not a plc memory snapshot' % path)
+            keyvalues, _ = plcserialization.DecodeKeyValues(buffer, struct.calcsize(_snapshotHeaderFormat))
+            return keyvalues
+
+def RestoreSnapshot(memory: plcmemory.PLCMemory, path: str) -> bool:
+    """
+    Restore PLC memory from a snapshot file, typically at startup before the network servers are started.
+
+    :return: True if the snapshot was restored, False if there is no snapshot file.
+    """
+    if not os.path.exists(path):
+        return False
+    start = time.monotonic()
+    keyvalues = LoadSnapshot(path)
+    memory.Write(keyvalues)
+    log.info('restored %d signals from %s in %.03fms', len(keyvalues), path, (time.monotonic() - start) * 1000)
+    return True
+
+class PLCMemorySnapshotter:
+    """
+    PLCMemorySnapshotter periodically saves PLC memory to a snapshot file on a background thread, and once more when stopped, so that the memory can be restored quickly with RestoreSnapshot after a restart.
+
+    The memory is read without taking its lock, so snapshotting adds no latency to Write.
+    """
+
+    _memory = None # type: plcmemory.PLCMemory # an instance of PLCMemory
+    _path = None # type: str # path of the snapshot file
+    _interval = 1.0 # type: float # seconds between snapshots
+    _thread = None # type: typing.Optional[threading.Thread] # snapshot thread
+    _isok = False # type: bool # signal that the snapshot thread should continue to run
+    _condition = None # type: threading.Condition # wakes up the snapshot thread when stopping
+    _lastVersion = None # type: typing.Optional[int] # memory version of the last saved snapshot
+
+    def __init__(self, memory: plcmemory.PLCMemory, path: str, interval: float = 1.0):
+        self._memory = memory
+        self._path = path
+        self._interval = interval
+        self._isok = False
+        self._condition = threading.Condition()
+
+    def __del__(self):
+        self.Stop()
+
+    def Start(self) -> None:
+        """
+        Start saving snapshots on a background thread.
+        """
+        self.Stop()
+
+        self._isok = True
+        self._thread = threading.Thread(target=self._RunThread, name='plcsnapshot')
+        self._thread.start()
+
+    def IsRunning(self) -> bool:
+        return self._isok
+
+    def SetStop(self) -> None:
+        with self._condition:
+            self._isok = False
+            self._condition.notify_all()
+
+    def Stop(self) -> None:
+        """
+        Stop the snapshot thread and save a final snapshot. Will block until the background thread terminates.
+        """
+        self.SetStop()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def Snapshot(self) -> bool:
+        """
+        Save a snapshot now, if memory has changed since the last one.
+
+        :return: True if a snapshot was saved.
+        """
+        version = self._memory.GetVersion()
+        if version == self._lastVersion:
+            return False
+        keyvalues = self._memory.ReadAll()
+        SaveSnapshot(self._path, keyvalues, version=version)
+        self._lastVersion = version
+        return True
+
+    def _RunThread(self) -> None:
+        while self._isok:
+            with self._condition:
+                if self._isok:
+                    self._condition.wait(self._interval)
+            try:
+                self.Snapshot()
+            except Exception as e:
+                log.exception('caught exception when saving snapshot to %s: %s', self._path, e)
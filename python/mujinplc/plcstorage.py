@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+import array
+import collections.abc
+import typing # noqa: F401 # used in type check
+
+import logging
+log = logging.getLogger(__name__)
+
+ValueType = typing.Optional[typing.Union[str, int, bool]]
+
+class PLCSignalSchema:
+    """
+    PLCSignalSchema describes the signals stored in a PLCCompactStorage. Every signal name is interned to an integer slot once, so that hot paths can address signals without hashing strings.
+    """
+
+    _slots = None # type: typing.Dict[str, int] # mapping from signal name to slot
+    _names = None # type: typing.List[str] # signal name of each slot
+    _types = None # type: typing.List[type] # value type of each slot, one of bool, int or str
+    _offsets = None # type: typing.List[int] # index of each slot in the storage of its type
+    _counts = None # type: typing.Dict[type, int] # number of signals of each type
+
+    def __init__(self, signals: typing.Mapping[str, type]):
+        """
+        :param signals: A dictionary containing the mapping between signal names and their value types. Supported types are bool, int and str.
+        """
+        self._slots = {}
+        self._names = []
+        self._types = []
+        self._offsets = []
+        self._counts = {bool: 0, int: 0, str: 0}
+        for name, signalType in signals.items():
+            if signalType not in self._counts:
+                raise ValueError('signal %s is of unsupported type %r' % (name, signalType))
+            self._slots[name] = len(self._names)
+            self._names.append(name)
+            self._types.append(signalType)
+            self._offsets.append(self._counts[signalType])
+            self._counts[signalType] += 1
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._slots
+
+    def GetSlot(self, name: str) -> int:
+        """
+        Slot of a signal. Raises KeyError if the signal is not part of the schema.
+        """
+        return self._slots[name]
+
+    def GetSlots(self, names: typing.Iterable[str]) -> typing.List[int]:
+        """
+        Slots of multiple signals, in the same order.
+        """
+        return [self._slots[name] for name in names]
+
+    def GetName(self, slot: int) -> str:
+        return self._names[slot]
+
+    def GetType(self, slot: int) -> type:
+        return self._types[slot]
+
+    def GetOffset(self, slot: int) -> int:
+        return self._offsets[slot]
+
+    def GetNames(self) -> typing.Sequence[str]:
+        """
+        Signal name of every slot, indexed by slot. Must not be modified.
+        """
+        return self._names
+
+    def GetTypes(self) -> typing.Sequence[type]:
+        """
+        Value type of every slot, indexed by slot, for hot paths looking up many slots. Must not be modified.
+        """
+        return self._types
+
+    def GetOffsets(self) -> typing.Sequence[int]:
+        """
+        Index of every slot in the storage of its type, indexed by slot, for hot paths looking up many slots. Must not be modified.
+        """
+        return self._offsets
+
+    def GetCount(self, signalType: type) -> int:
+        """
+        Number of signals of the given type.
+        """
+        return self._counts[signalType]
+
+class PLCCompactStorage(collections.abc.MutableMapping):
+    """
+    PLCCompactStorage is a storage engine for PLCMemory backed by a PLCSignalSchema. Booleans are kept in a bitset, integers in an array of 64-bit integers and strings in a string table, all indexed by slot.
+
+    Signals not described by the schema are kept in a regular dictionary, so the storage can be used anywhere a dictionary is expected.
+    """
+
+    _schema = None # type: PLCSignalSchema
+    _slots = None # type: typing.Dict[str, int] # mapping from signal name to slot
+    _types = None # type: typing.Sequence[type] # value type of each slot, from the schema
+    _offsets = None # type: typing.Sequence[int] # index of each slot in the storage of its type, from the schema
+    _present = None # type: bytearray # bitset over slots, whether the signal has a value
+    _null = None # type: bytearray # bitset over slots, whether the value of the signal is None
+    _booleans = None # type: bytearray # bitset over boolean signals
+    _integers = None # type: array.array # values of integer signals
+    _strings = None # type: typing.List[str] # values of string signals
+    _overflow = None # type: typing.Dict[str, ValueType] # signals not described by the schema
+
+    def __init__(self, schema: PLCSignalSchema):
+        self._schema = schema
+        self._slots = {name: slot for slot, name in enumerate(schema.GetNames())}
+        self._types = schema.GetTypes()
+        self._offsets = schema.GetOffsets()
+        self._present = bytearray((len(schema) + 7) // 8)
+        self._null = bytearray((len(schema) + 7) // 8)
+        self._booleans = bytearray((schema.GetCount(bool) + 7) // 8)
+        self._integers = array.array('q', bytes(8 * schema.GetCount(int)))
+        self._strings = [''] * schema.GetCount(str)
+        self._overflow = {}
+
+    def GetSchema(self) -> PLCSignalSchema:
+        return self._schema
+
+    def HasSlot(self, slot: int) -> bool:
+        """
+        Whether the signal in the slot has a value.
+        """
+        return bool(self._present[slot >> 3] & (1 << (slot & 7)))
+
+    def GetSlotValue(self, slot: int) -> ValueType:
+        """
+        Value of the signal in the slot. The signal has to have a value.
+        """
+        if self._null[slot >> 3] & (1 << (slot & 7)):
+            return None
+        signalType = self._types[slot]
+        offset = self._offsets[slot]
+        if signalType is bool:
+            return bool(self._booleans[offset >> 3] & (1 << (offset & 7)))
+        if signalType is int:
+            return self._integers[offset]
+        return self._strings[offset]
+
+    def CheckSlotValue(self, slot: int, value: ValueType) -> None:
+        """
+        Raise ValueError if the value cannot be stored in the slot.
+        """
+        if value is None:
+            return
+        signalType = self._types[slot]
+        if signalType is bool:
+            if isinstance(value, bool):
+                return
+        elif signalType is int:
+            if isinstance(value, int) and not isinstance(value, bool) and -(1 << 63) <= value < (1 << 63):
+                return
+        elif isinstance(value, str):
+            return
+        raise ValueError('signal %s is of type %r, but passed in value is of type %r' % (self._schema.GetName(slot), signalType, type(value)))
+
+    def SetSlotValue(self, slot: int, value: ValueType) -> None:
+        """
+        Store a value in the slot. The value has to be checked with CheckSlotValue first.
+        """
+        byte, bit = slot >> 3, 1 << (slot & 7)
+        self._present[byte] |= bit
+        if value is None:
+            self._null[byte] |= bit
+            return
+        self._null[byte] &= ~bit
+        signalType = self._types[slot]
+        offset = self._offsets[slot]
+        if signalType is bool:
+            if value:
+                self._booleans[offset >> 3] |= 1 << (offset & 7)
+            else:
+                self._booleans[offset >> 3] &= ~(1 << (offset & 7))
+        elif signalType is int:
+            self._integers[offset] = value # type: ignore
+        else:
+            self._strings[offset] = value # type: ignore
+
+    def ReadSlotValues(self, slots: typing.Iterable[int]) -> typing.Dict[int, ValueType]:
+        """
+        Values of multiple slots. Slots without a value are omitted.
+        """
+        present, null, booleans, integers, strings = self._present, self._null, self._booleans, self._integers, self._strings
+        types, offsets = self._types, self._offsets
+        slotvalues = {} # type: typing.Dict[int, ValueType]
+        for slot in slots:
+            byte, bit = slot >> 3, 1 << (slot & 7)
+            if not present[byte] & bit:
+                continue
+            if null[byte] & bit:
+                slotvalues[slot] = None
+                continue
+            signalType = types[slot]
+            offset = offsets[slot]
+            if signalType is bool:
+                slotvalues[slot] = bool(booleans[offset >> 3] & (1 << (offset & 7)))
+            elif signalType is int:
+                slotvalues[slot] = integers[offset]
+            else:
+                slotvalues[slot] = strings[offset]
+        return slotvalues
+
+    def __getitem__(self, key: str) -> ValueType:
+        slot = self._slots.get(key)
+        if slot is None:
+            return self._overflow[key]
+        if not self.HasSlot(slot):
+            raise KeyError(key)
+        return self.GetSlotValue(slot)
+
+    def __setitem__(self, key: str, value: ValueType) -> None:
+        slot = self._slots.get(key)
+        if slot is None:
+            self._overflow[key] = value
+            return
+        self.CheckSlotValue(slot, value)
+        self.SetSlotValue(slot, value)
+
+    def __delitem__(self, key: str) -> None:
+        slot = self._slots.get(key)
+        if slot is None:
+            del self._overflow[key]
+            return
+        if not self.HasSlot(slot):
+            raise KeyError(key)
+        self._present[slot >> 3] &= ~(1 << (slot & 7))
+
+    def __contains__(self, key: object) -> bool:
+        slot = self._slots.get(key) # type: ignore
+        if slot is None:
+            return key in self._overflow
+        return self.HasSlot(slot)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for slot, name in enumerate(self._schema.GetNames()):
+            if self.HasSlot(slot):
+                yield name
+        yield from list(self._overflow)
+
+    def __len__(self) -> int:
+        count = len(self._overflow)
+        for byte in self._present:
+            count += bin(byte).count('1')
+        return count
+
+    def update(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        """
+        Update multiple signals at once. All values are checked before anything is stored, so a bad value leaves the storage untouched.
+        """
+        keyvalues = dict(*args, **kwargs)
+        for key, value in keyvalues.items():
+            slot = self._slots.get(key)
+            if slot is not None:
+                self.CheckSlotValue(slot, value)
+        for key, value in keyvalues.items():
+            slot = self._slots.get(key)
+            if slot is None:
+                self._overflow[key] = value
+            else:
+                self.SetSlotValue(slot, value)
@@ -49,17 +49,17 @@ class PLCUDPServerSocket:
 
 class PLCUDPServer:
     """
-    A UDP server that hosts the PLC controller.
+    A UDP server that hosts the PLC controller. Given a PLCMemoryArena instead of a memory, it serves every memory of the arena, routing each request by its namespace field, and notifies each namespace to the address that last sent a request for it.
     """
 
-    _memory = None # type: plcmemory.PLCMemory # an instance of PLCMemory
+    _memory = None # type: typing.Any # an instance of PLCMemory or PLCMemoryArena
     _port = None # type: int # listening port to bind to
     _thread = None # type: typing.Optional[threading.Thread] # server thread
     _isok = False # type: bool # signal that the server thread should continue to run
     _lock = None # type: threading.Lock # protects _modifications
-    _modifications = None # type: typing.Dict[str, plcmemory.PLCMemory.ValueType] # accumulatd changes to notify remote
+    _modifications = None # type: typing.Dict[str, typing.Dict[str, plcmemory.PLCMemory.ValueType]] # accumulatd changes to notify remote, by namespace
 
-    def __init__(self, memory: plcmemory.PLCMemory, port: int):
+    def __init__(self, memory: typing.Any, port: int):
         self._memory = memory
         self._port = port
         self._isok = False
@@ -103,10 +103,18 @@ class PLCUDPServer:
     def _GetTimestamp(self) -> int:
         return int(time.monotonic() * 1e9)
 
+    def _GetMemory(self, namespace: str) -> plcmemory.PLCMemory:
+        """
+        Memory of the namespace a request is addressed to.
+        """
+        if isinstance(self._memory, plcmemory.PLCMemory):
+            return self._memory
+        return self._memory.GetMemory(namespace)
+
     def _RunThread(self) -> None:
         socket = None # zmq socket for use in this thread
         notificationSocket = None # zmq socket for use in this thread
-        address = None # remote address
+        addresses = {} # type: typing.Dict[str, typing.Any] # remote address by namespace
 
         while self._isok:
             try:
@@ -124,11 +132,17 @@ class PLCUDPServer:
                         self._modifications = {}
 
                 # send notification
-                if modifications and address:
-                    notificationSocket.Send({
+                for namespace, changevalues in (modifications or {}).items():
+                    address = addresses.get(namespace)
+                    if address is None:
+                        continue
+                    notification = {
                         'timestamp': self._GetTimestamp(),
-                        'changevalues': modifications,
-                    }, (address[0], address[1] + 1))
+                        'changevalues': changevalues,
+                    } # type: typing.Dict[str, typing.Any]
+                    if namespace:
+                        notification['namespace'] = namespace
+                    notificationSocket.Send(notification, (address[0], address[1] + 1))
 
                 if not socket.Poll(timeout=2):
                     continue
@@ -139,10 +153,15 @@ class PLCUDPServer:
                 try:
                     response['seqid'] = request['seqid']
                     response['timestamp'] = self._GetTimestamp()
-                    if 'writevalues' in request:
-                        self._memory.Write(request['writevalues'])
+                    namespace = request.get('namespace', '')
+                    memory = self._GetMemory(namespace)
+                    addresses[namespace] = address
+                    if 'writeconditions' in request:
+                        response['writesuccess'] = memory.WriteIf(request['writeconditions'], request.get('writevalues', {}))
+                    elif 'writevalues' in request:
+                        memory.Write(request['writevalues'])
                     if 'read' in request:
-                        response['readvalues'] = self._memory.Read(request['read'])
+                        response['readvalues'] = memory.Read(request['read'])
                 except Exception as e:
                     log.exception('failed to handle request: %s: %r', e, request)
 
@@ -169,6 +188,6 @@ class PLCUDPServer:
             notificationSocket.Destroy()
             notificationSocket = None
 
-    def MemoryModified(self, modifications: typing.Mapping[str, plcmemory.PLCMemory.ValueType]) -> None:
+    def MemoryModified(self, modifications: plcmemory.PLCModifications) -> None:
         with self._lock:
-            self._modifications.update(modifications)
+            self._modifications.setdefault(modifications.namespace, {}).update(modifications)
@@ -57,16 +57,16 @@ class PLCZMQServerSocket:
 
 class PLCZMQServer:
     """
-    A ZMQ server that hosts the PLC controller.
+    A ZMQ server that hosts the PLC controller. Given a PLCMemoryArena instead of a memory, it serves every memory of the arena, routing each request by its namespace field.
     """
 
-    _memory = None # type: plcmemory.PLCMemory # an instance of PLCMemory
+    _memory = None # type: typing.Any # an instance of PLCMemory or PLCMemoryArena
     _endpoint = None # type: str # listening endpoint to bind to
     _ctx = None # type: typing.Optional[zmq.Context] # zmq context
     _thread = None # type: typing.Optional[threading.Thread] # server thread
     _isok = False # type: bool # signal that the server thread should continue to run
 
-    def __init__(self, memory: plcmemory.PLCMemory, endpoint: str, ctx: typing.Optional[zmq.Context] = None):
+    def __init__(self, memory: typing.Any, endpoint: str, ctx: typing.Optional[zmq.Context] = None):
         self._memory = memory
         self._endpoint = endpoint
         self._ctx = ctx
@@ -103,6 +103,14 @@ class PLCZMQServer:
             self._thread.join()
             self._thread = None
 
+    def _GetMemory(self, request: typing.Mapping[str, typing.Any]) -> plcmemory.PLCMemory:
+        """
+        Memory a request is addressed to.
+        """
+        if isinstance(self._memory, plcmemory.PLCMemory):
+            return self._memory
+        return self._memory.GetMemory(request.get('namespace', ''))
+
     def _RunThread(self) -> None:
         socket = None # zmq socket for use in this thread
 
@@ -118,10 +126,17 @@ class PLCZMQServer:
                 request = socket.Receive()
 
                 try:
+                    memory = self._GetMemory(request)
                     if request['command'] == 'read':
-                        response['keyvalues'] = self._memory.Read(request['keys'])
+                        response['keyvalues'] = memory.Read(request['keys'])
                     elif request['command'] == 'write':
-                        self._memory.Write(request['keyvalues'])
+                        memory.Write(request['keyvalues'])
+                    elif request['command'] == 'readsince':
+                        response['version'], response['keyvalues'], response['snapshot'] = memory.ReadSince(request.get('version', 0))
+                    elif request['command'] == 'compareandset':
+                        response['success'] = memory.CompareAndSet(request['key'], request.get('expectedvalue'), request.get('value'))
+                    elif request['command'] == 'writeif':
+                        response['success'] = memory.WriteIf(request['conditions'], request['keyvalues'])
                 except Exception as e:
                     log.exception('failed to handle request: %s: %r', e, request)
 
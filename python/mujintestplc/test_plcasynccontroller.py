@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import pytest
+
+from mujinplc import plcmemory, plcsignaldispatcher, plcasynccontroller, plclogic
+
+def RunAsync(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+def test_AsyncControllerWaits():
+    memory = plcmemory.PLCMemory()
+    signalDispatcher = plcsignaldispatcher.PLCSignalDispatcher(memory)
+    controllers = [plcasynccontroller.AsyncPLCController(memory, signalDispatcher=signalDispatcher) for index in range(100)]
+
+    async def WaitAsync():
+        assert not await controllers[0].WaitUntil('isCycleReady', True, timeout=0.01)
+        waits = asyncio.gather(*[controller.WaitUntilAllOrAny({'location%dReady' % (index % 4): True}, {'isError': True}, timeout=5.0) for index, controller in enumerate(controllers)])
+        asyncio.get_event_loop().call_soon(controllers[0].SetMultiple, {'location%dReady' % index: True for index in range(4)})
+        return await waits
+
+    assert RunAsync(WaitAsync()) == [True] * 100
+    assert signalDispatcher.GetWaiterCount() == 0
+
+def test_AsyncLogicStartOrderCycle():
+    memory = plcmemory.PLCMemory()
+    logic = plclogic.AsyncPLCLogic(plcasynccontroller.AsyncPLCController(memory))
+
+    async def StartAsync():
+        # acknowledge the start command like MUJIN controller would
+        asyncio.get_event_loop().call_later(0.01, memory.Write, {'isRunningOrderCycle': True, 'numLeftInOrder': 5})
+        status = await logic.StartOrderCycle(plclogic.PLCStartOrderCycleParameters(uniqueId='order1', orderNumber=5), timeout=5.0)
+        assert memory.Read(['orderUniqueId', 'startOrderCycle']) == {'orderUniqueId': 'order1', 'startOrderCycle': False}
+        return status
+
+    status = RunAsync(StartAsync())
+    assert status.isRunningOrderCycle
+    assert status.numLeftInOrder == 5
+
+    memory.Write({'isError': True, 'errorcode': plclogic.PLCErrorCode.GenericError.value})
+    with pytest.raises(plclogic.PLCError):
+        RunAsync(logic.WaitUntilOrderCycleFinish(timeout=5.0))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+from mujinplc import plcmemory, plccontroller
+
+class RecordingObserver:
+
+    def __init__(self):
+        self.modifications = []
+
+    def MemoryModified(self, modifications):
+        self.modifications.append(dict(modifications))
+
+def test_ControllerTransaction():
+    memory = plcmemory.PLCMemory()
+    observer = RecordingObserver()
+    memory.AddObserver(observer)
+    controller = plccontroller.PLCController(memory)
+
+    with controller.Transaction():
+        controller.Set('isRunningOrderCycle', False)
+        with controller.Transaction():
+            controller.SetMultiple({'isRunningOrderCycle': True, 'orderCycleFinishCode': 0})
+    assert observer.modifications == [{}, {'isRunningOrderCycle': True, 'orderCycleFinishCode': 0}]
+
+    # pulses within the block are dropped, unless the transaction does not coalesce
+    with controller.Transaction():
+        controller.SetMultiple({'stopOrderCycle': True, 'orderNumber': 1})
+        controller.Set('stopOrderCycle', False)
+    assert observer.modifications[-1] == {'stopOrderCycle': False, 'orderNumber': 1}
+    del observer.modifications[:]
+    with controller.Transaction(coalesce=False):
+        controller.SetMultiple({'stopOrderCycle': True, 'orderNumber': 2})
+        controller.Set('orderNumber', 2)
+        controller.SetMultiple({'stopOrderCycle': False, 'isRunningOrderCycle': False})
+        controller.Set('clearState', True)
+    assert observer.modifications == [{'stopOrderCycle': True, 'orderNumber': 2}, {'stopOrderCycle': False, 'isRunningOrderCycle': False, 'clearState': True}]
+
+def test_ControllerQueueCoalescing():
+    memory = plcmemory.PLCMemory()
+    controller = plccontroller.PLCController(memory, maxQueueSize=4)
+    for index in range(10):
+        memory.Write({'orderNumber': index, 'startOrderCycle': index % 2 == 0})
+    memory.Write({'stopOrderCycle': True})
+
+    stats = controller.GetQueueStats()
+    assert stats['queued'] <= 4
+    assert stats['coalesceCount'] > 0
+    assert stats['queued'] + stats['coalescedBatches'] == 11
+
+    # the latest value of every key survives coalescing
+    controller.Sync()
+    assert controller.GetMultiple(['orderNumber', 'startOrderCycle', 'stopOrderCycle']) == {'orderNumber': 9, 'startOrderCycle': False, 'stopOrderCycle': True}
+    assert controller.GetQueueStats()['queued'] == 0
+
+def test_ControllerWaitDeadline():
+    memory = plcmemory.PLCMemory()
+    controller = plccontroller.PLCController(memory, maxHeartbeatInterval=0.5, heartbeatSignal='heartbeat')
+    assert not controller.Wait(timeout=1.0)
+
+    # the wait is bounded by the timeout when it comes before the heartbeat expiry
+    memory.Write({'heartbeat': 1})
+    controller.Sync()
+    assert controller.IsConnected()
+    start = time.monotonic()
+    assert not controller.Wait(timeout=0.02)
+    assert 0.02 <= time.monotonic() - start < 1.0
+
+    # and by the heartbeat expiry otherwise, long before the timeout
+    memory.Write({'heartbeat': 2})
+    controller.Sync()
+    assert controller.IsConnected()
+    start = time.monotonic()
+    assert not controller.Wait(timeout=5.0)
+    assert time.monotonic() - start < 4.0
+    assert not controller.IsConnected()
+
+def test_WaitPredicate():
+    predicate = plccontroller.PLCWaitPredicate({'isRunningOrderCycle': False, 'isCycleReady': True}, {'isError': True})
+    assert predicate.Start({'isRunningOrderCycle': False, 'isCycleReady': True}) is None
+    assert predicate.Start({'isError': True}) is None
+
+    unsatisfied = predicate.Start({'isRunningOrderCycle': True})
+    assert unsatisfied == {'isRunningOrderCycle', 'isCycleReady'}
+    assert not predicate.Update(unsatisfied, {'isCycleReady': True, 'numLeftInOrder': 3})
+    assert not predicate.Update(unsatisfied, {'isCycleReady': False, 'isRunningOrderCycle': False})
+    assert unsatisfied == {'isCycleReady'}
+    assert predicate.Update(unsatisfied, {'isCycleReady': True})
+    assert predicate.Update(predicate.Start({}), {'isError': True})
+
+    # the same predicate can be reused by controllers
+    memory = plcmemory.PLCMemory()
+    controller = plccontroller.PLCController(memory)
+    assert not controller.WaitUntilPredicate(predicate, timeout=0.01)
+    memory.Write({'isRunningOrderCycle': False, 'isCycleReady': True})
+    assert controller.WaitUntilPredicate(predicate, timeout=0.01)
+
+def test_ControllerEdges():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'startOrderCycle': True})
+    controller = plccontroller.PLCController(memory, keys=['isRunningOrderCycle'], edgeKeys=['startOrderCycle'], maxQueueSize=2)
+    risingEdges = []
+    controller.OnRisingEdge('startOrderCycle', risingEdges.append)
+
+    # the initial state is not an edge
+    assert controller.WaitForEdge('startOrderCycle', timeout=0.01) is None
+
+    # short pulses survive coalescing of the queue
+    for index in range(3):
+        memory.Write({'startOrderCycle': False})
+        memory.Write({'startOrderCycle': True})
+    assert controller.GetQueueStats()['coalesceCount'] > 0
+    edges = controller.PopEdges('startOrderCycle')
+    assert [edge.rising for edge in edges] == [False, True] * 3
+    assert [edge.version for edge in edges] == sorted(edge.version for edge in edges)
+    assert all(edges[index].timestamp <= edges[index + 1].timestamp for index in range(len(edges) - 1))
+    assert risingEdges == edges[1::2]
+
+    memory.Write({'startOrderCycle': False})
+    memory.Write({'startOrderCycle': True})
+    edge = controller.WaitForEdge('startOrderCycle', rising=True, timeout=1.0)
+    assert edge is not None and edge.rising and edge.value is True
+    assert controller.PopEdges('startOrderCycle') == []
+
+    controller.Sync()
+    assert controller.Get('startOrderCycle') is True
+    assert controller.GetStateVersion() == memory.GetVersion()
+    assert controller.GetStateTimestamp() == edge.timestamp
+
+def test_SharedStateSnapshots():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'orderNumber': 0})
+    controller1 = plccontroller.PLCController(memory, sharedState=True)
+    controller2 = plccontroller.PLCController(memory, keys=['startOrderCycle'], sharedState=True, maxQueueSize=4)
+    for index in range(1, 40):
+        memory.Write({'orderNumber': index, 'startOrderCycle': index % 2 == 0})
+
+    # each controller stays at the version it has consumed
+    assert controller1.Get('orderNumber') == 0
+    assert controller1.WaitUntil('orderNumber', 39, timeout=1.0)
+    assert controller1.GetStateVersion() == 40
+
+    # both end up reading the very same snapshot
+    controller2.Sync()
+    assert controller1.GetMultiple(['orderNumber', 'startOrderCycle']) == {'orderNumber': 39, 'startOrderCycle': False}
+    assert controller2.Get('orderNumber') == 39
+    assert controller1.GetStateVersion() == controller2.GetStateVersion() == memory.GetSnapshot().version == 40
+    assert dict(memory.GetSnapshot()) == memory.ReadAll()
+
+def test_ControllerSelect():
+    memory = plcmemory.PLCMemory()
+    controller = plccontroller.PLCController(memory)
+    triggers = {'startOrderCycle': True, 'startPreparation': True, 'resetError': True}
+    assert controller.Select(triggers, timeout=0.01) == {}
+
+    # reports every condition true in the same state
+    memory.Write({'startOrderCycle': True, 'resetError': True, 'orderNumber': 1})
+    assert controller.Select(triggers, timeout=1.0) == {'startOrderCycle': True, 'resetError': True}
+
+    # wakes up on the first batch firing a condition
+    memory.Write({'startOrderCycle': False, 'resetError': False})
+    thread = threading.Timer(0.01, memory.Write, args=({'startPreparation': True},))
+    thread.start()
+    assert controller.Select(triggers, timeout=5.0) == {'startPreparation': True}
+    thread.join()
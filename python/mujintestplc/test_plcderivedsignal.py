@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from mujinplc import plcmemory, plcstorage
+from mujinplc.plcderivedsignal import PLCAnd, PLCOr, PLCNot, PLCEquals
+
+class RecordingObserver:
+
+    def __init__(self):
+        self.modifications = []
+
+    def MemoryModified(self, modifications):
+        self.modifications.append(dict(modifications))
+
+def test_DerivedSignal():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'isRunningOrderCycle': False, 'isModeAuto': True})
+    memory.AddDerivedSignal('isOrderCycleReady', PLCAnd({
+        'isRunningOrderCycle': False,
+        'isRobotMoving': None,
+        'isModeAuto': True,
+        'isSystemReady': True,
+    }))
+    assert memory.Read(['isOrderCycleReady']) == {'isOrderCycleReady': False}
+
+    observer = RecordingObserver()
+    memory.AddObserver(observer, keys=['isOrderCycleReady'])
+    memory.Write({'isSystemReady': True})
+    memory.Write({'isModeAuto': True, 'isRunningOrderCycle': True})
+    memory.Write({'isRunningOrderCycle': False, 'isRobotMoving': None})
+    assert observer.modifications == [
+        {'isOrderCycleReady': False},
+        {'isOrderCycleReady': True},
+        {'isOrderCycleReady': False},
+        {'isOrderCycleReady': True},
+    ]
+
+    with pytest.raises(ValueError):
+        memory.Write({'isOrderCycleReady': False})
+
+def test_DerivedSignalExpressions():
+    memory = plcmemory.PLCMemory(storage=plcstorage.PLCCompactStorage(plcstorage.PLCSignalSchema({'isError': bool})))
+    memory.AddDerivedSignal('isStopped', PLCOr(PLCEquals('isError', True), PLCNot(PLCEquals('isRunning', True))))
+    memory.AddDerivedSignal('isHealthy', PLCNot(PLCEquals('isStopped', True)))
+    assert memory.Read(['isStopped', 'isHealthy']) == {'isStopped': True, 'isHealthy': False}
+
+    memory.Write({'isRunning': True})
+    assert memory.Read(['isStopped', 'isHealthy']) == {'isStopped': False, 'isHealthy': True}
+    memory.WriteSlots({memory.GetSlots(['isError'])[0]: True})
+    assert memory.Read(['isStopped', 'isHealthy']) == {'isStopped': True, 'isHealthy': False}
+
+    with pytest.raises(ValueError):
+        memory.AddDerivedSignal('isRunning', PLCEquals('isError', False))
+
+def test_DerivedSignalChangedBack():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'isModeAuto': True, 'isModeManual': False})
+    memory.AddDerivedSignal('isModeKnown', PLCOr({'isModeAuto': True, 'isModeManual': True}))
+    memory.AddDerivedSignal('isModeUnknown', PLCNot(PLCEquals('isModeKnown', True)))
+
+    observer = RecordingObserver()
+    memory.AddObserver(observer, keys=['isModeKnown', 'isModeUnknown'])
+
+    # isModeKnown turns false and true again while the batch is propagated
+    memory.Write({'isModeAuto': False, 'isModeManual': True})
+    memory.Write({'isModeManual': False})
+    assert observer.modifications == [
+        {'isModeKnown': True, 'isModeUnknown': False},
+        {'isModeKnown': False, 'isModeUnknown': True},
+    ]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from mujinplc import plcmemory, plccontroller, plcheartbeat
+
+def test_HeartbeatWatchdog():
+    memory = plcmemory.PLCMemory()
+    watchdog = plcheartbeat.PLCHeartbeatWatchdog(memory)
+    transitions = []
+    watchdog.OnConnectionChanged(lambda heartbeatSignal, connected: transitions.append((heartbeatSignal, connected)))
+    # heartbeats are written far more often than they expire, so that a slow scheduler does not disconnect in between
+    watchdog.Watch('heartbeat', 0.5, connectedSignal='isConnected')
+    watchdog.Start()
+    try:
+        controller = plccontroller.PLCController(memory, keys=['isRunningOrderCycle'], connectedSignal='isConnected')
+        assert not controller.IsConnected()
+
+        # connected as soon as the heartbeat changes
+        for index in range(5):
+            memory.Write({'heartbeat': index})
+            time.sleep(0.01)
+        assert controller.WaitUntilConnected(timeout=1.0)
+        assert watchdog.IsConnected('heartbeat')
+        assert memory.Read(['isConnected']) == {'isConnected': True}
+
+        # waits end when the watchdog publishes the disconnect, well before their timeout
+        start = time.monotonic()
+        assert not controller.WaitUntil('isRunningOrderCycle', True, timeout=10.0)
+        assert time.monotonic() - start < 5.0
+        assert not controller.IsConnected()
+        assert not watchdog.IsConnected('heartbeat')
+        assert transitions == [('heartbeat', False), ('heartbeat', True), ('heartbeat', False)]
+
+        stats = watchdog.GetHeartbeatStats('heartbeat')
+        assert stats['count'] == 4
+        assert stats['maxGap'] >= 10000000
+        assert stats['jitter'] >= 0.0
+        assert stats['disconnectCount'] == 1
+    finally:
+        watchdog.Stop()
+
+def test_HeartbeatWatchdogAnyModification():
+    memory = plcmemory.PLCMemory()
+    watchdog = plcheartbeat.PLCHeartbeatWatchdog(memory)
+    watchdog.Watch(None, 0.5, connectedSignal='isConnected')
+    watchdog.Start()
+    try:
+        memory.Write({'numLeftInOrder': 1})
+        controller = plccontroller.PLCController(memory, connectedSignal='isConnected')
+        assert controller.WaitUntilConnected(timeout=1.0)
+
+        # writes of the connected signal itself do not keep the connection alive
+        start = time.monotonic()
+        assert not controller.WaitUntil('numLeftInOrder', 0, timeout=10.0)
+        assert time.monotonic() - start < 5.0
+        assert not watchdog.IsConnected()
+    finally:
+        watchdog.Stop()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import pytest
+
+from mujinplc import plcmemory, plcjournal
+
+@pytest.fixture
+def journalDirectory(tmp_path):
+    return str(tmp_path / 'journal')
+
+class TimestampObserver:
+
+    def __init__(self):
+        self.timestamps = []
+
+    def MemoryModified(self, modifications):
+        self.timestamps.append(modifications.timestamp)
+
+def RecordJournal(journalDirectory, count):
+    memory = plcmemory.PLCMemory()
+    memory.Write({'orderUniqueId': 'order0'})
+    journal = plcjournal.PLCMemoryJournal(memory, journalDirectory, segmentSize=512, indexInterval=128)
+    observer = TimestampObserver()
+    memory.AddObserver(observer, keys=['orderNumber'])
+    for index in range(count):
+        memory.Write({'orderNumber': index, 'isRunningOrderCycle': index % 2 == 0})
+    journal.Close()
+    return memory, observer.timestamps[1:]
+
+def test_JournalRecords(journalDirectory):
+    memory = plcmemory.PLCMemory()
+    journal = plcjournal.PLCMemoryJournal(memory, journalDirectory)
+    thread = threading.Thread(target=memory.Write, args=({'orderNumber': 1},), name='orderCycle')
+    thread.start()
+    thread.join()
+    journal.Close()
+
+    records = list(plcjournal.PLCJournalReader(journalDirectory).ReadRecords())
+    assert [(record.isSnapshot, record.writer, record.keyvalues) for record in records] == [
+        (True, '', {}),
+        (False, 'orderCycle', {'orderNumber': 1}),
+    ]
+    assert records[0].timestamp <= records[1].timestamp
+
+def test_JournalWrittenByThread(journalDirectory, monkeypatch):
+    memory = plcmemory.PLCMemory()
+    journal = plcjournal.PLCMemoryJournal(memory, journalDirectory)
+    try:
+        journal.Flush()
+        released = threading.Event()
+        appendRecord = journal._AppendRecord
+
+        def AppendRecordSlowly(*args):
+            released.wait(5.0)
+            appendRecord(*args)
+
+        monkeypatch.setattr(journal, '_AppendRecord', AppendRecordSlowly)
+
+        # writers are not held up by file I/O, even though observers are notified under the memory lock
+        start = time.monotonic()
+        for index in range(3):
+            memory.Write({'orderNumber': index})
+        assert time.monotonic() - start < 2.5
+        released.set()
+
+        # flush waits for the queued batches
+        journal.Flush()
+        records = list(plcjournal.PLCJournalReader(journalDirectory).ReadRecords())
+        assert [record.keyvalues for record in records] == [{}, {'orderNumber': 0}, {'orderNumber': 1}, {'orderNumber': 2}]
+    finally:
+        journal.Close()
+
+def test_JournalSeekAndReplay(journalDirectory):
+    memory, timestamps = RecordJournal(journalDirectory, 100)
+    reader = plcjournal.PLCJournalReader(journalDirectory)
+    assert reader.GetSegmentCount() > 1
+    assert reader.GetTimeRange()[1] == timestamps[-1]
+
+    # seek to the middle of the journal
+    records = [record for record in reader.ReadRecords(start=timestamps[50], end=timestamps[60]) if not record.isSnapshot]
+    assert [record.keyvalues['orderNumber'] for record in records] == list(range(50, 61))
+
+    # replay everything
+    replayed = plcmemory.PLCMemory()
+    reader.Replay(replayed, speed=None)
+    assert replayed.ReadAll() == memory.ReadAll()
+
+    # replay from the middle restores the state at that point first
+    replayed = plcmemory.PLCMemory()
+    reader.Replay(replayed, start=timestamps[70], end=timestamps[70], speed=None)
+    assert replayed.ReadAll() == {'orderUniqueId': 'order0', 'orderNumber': 70, 'isRunningOrderCycle': True}
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import pytest
+
+from mujinplc import plcmemory, plccontroller, plclogic
+
+def test_StatusReaders():
+    memory = plcmemory.PLCMemory()
+    controller = plccontroller.PLCController(memory)
+    logic = plclogic.PLCLogic(controller)
+
+    status = logic.GetOrderCycleStatus()
+    assert status.isRunningOrderCycle is False
+    assert status.orderCycleFinishCode == plclogic.PLCOrderCycleFinishCode.FinishedNotAvailable
+
+    memory.Write({
+        'isRunningOrderCycle': True,
+        'numLeftInOrder': 3,
+        'numPutInDestination': 'invalid',
+        'orderCycleFinishCode': int(plclogic.PLCOrderCycleFinishCode.FinishedOrderComplete),
+        'isRunningPreparation': True,
+        'preparationFinishCode': int(plclogic.PLCPreparationFinishCode.PreparationFinishedSuccess),
+    })
+
+    # values are only seen after syncing
+    assert logic.GetOrderCycleStatus().numLeftInOrder == 0
+    controller.Sync()
+    status = logic.GetOrderCycleStatus()
+    assert isinstance(status, plclogic.PLCOrderCycleStatus)
+    assert status.isRunningOrderCycle is True
+    assert status.isRobotMoving is False
+    assert status.numLeftInOrder == 3
+    assert status.numPutInDestination == 0
+    assert status.orderCycleFinishCode is plclogic.PLCOrderCycleFinishCode.FinishedOrderComplete
+
+    status = logic.GetPreparationCycleStatus()
+    assert status.isRunningPreparation is True
+    assert status.preparationFinishCode is plclogic.PLCPreparationFinishCode.PreparationFinishedSuccess
+
+    logic.CheckError()
+    memory.Write({'isError': True, 'errorcode': int(plclogic.PLCErrorCode.RobotError), 'detailedErrorCode': 'collision'})
+    controller.Sync()
+    with pytest.raises(plclogic.PLCError) as e:
+        logic.CheckError()
+    assert e.value.GetErrorCode() == plclogic.PLCErrorCode.RobotError
+    assert e.value.GetErrorDetail() == 'collision'
+
+def test_OrderCyclePipeline():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'isModeAuto': True, 'isSystemReady': True, 'isCycleReady': True, 'isRunningOrderCycle': False, 'isRobotMoving': False})
+    startedOrders = []
+    transitions = []
+    observer = type('TransitionObserver', (), {'MemoryModified': lambda self, modifications: transitions.append((modifications['isRunningOrderCycle'], modifications.timestamp))})()
+    memory.AddObserver(observer, keys=['isRunningOrderCycle'])
+
+    def RunRobot():
+        # acknowledge each start, then finish the cycle
+        controller = plccontroller.PLCController(memory)
+        for index in range(3):
+            assert controller.WaitUntil('startOrderCycle', True, timeout=5.0)
+            startedOrders.append(controller.GetString('orderUniqueId'))
+            time.sleep(0.01)
+            memory.Write({'isRunningOrderCycle': True, 'numLeftInOrder': controller.GetInteger('orderNumber')})
+            assert controller.WaitUntil('startOrderCycle', False, timeout=5.0)
+            time.sleep(0.01)
+            memory.Write({'isRunningOrderCycle': False, 'numLeftInOrder': 0, 'orderCycleFinishCode': int(plclogic.PLCOrderCycleFinishCode.FinishedOrderComplete)})
+
+    thread = threading.Thread(target=RunRobot)
+    thread.start()
+    logic = plclogic.PLCLogic(plccontroller.PLCController(memory))
+    pipeline = plclogic.PLCOrderCyclePipeline(logic)
+    orders = [plclogic.PLCStartOrderCycleParameters(uniqueId='order%d' % index, orderNumber=index + 1) for index in range(3)]
+    statuses = list(pipeline.Run(orders, timeout=5.0))
+    thread.join()
+
+    assert startedOrders == ['order0', 'order1', 'order2']
+    assert [status.orderCycleFinishCode for status in statuses] == [plclogic.PLCOrderCycleFinishCode.FinishedOrderComplete] * 3
+    stats = pipeline.GetGapStats()
+    assert stats['count'] == 2
+
+    # gaps are timed from the writes lowering and raising isRunningOrderCycle
+    falling = [timestamp for value, timestamp in transitions[1:] if not value]
+    rising = [timestamp for value, timestamp in transitions[1:] if value]
+    assert pipeline.GetGaps() == [(rising[index + 1] - falling[index]) / 1000000000.0 for index in range(2)]
+    assert min(pipeline.GetGaps()) >= 0.01
+
+    # invalid orders are rejected before anything is started
+    with pytest.raises(ValueError):
+        list(pipeline.Run([plclogic.PLCStartOrderCycleParameters(orderNumber=-1)]))
+
+def test_OrderCyclePipelineClosed():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'isModeAuto': True, 'isSystemReady': True, 'isCycleReady': True, 'isRunningOrderCycle': False, 'isRobotMoving': False})
+
+    def RunRobot():
+        # only runs the first order
+        controller = plccontroller.PLCController(memory)
+        assert controller.WaitUntil('startOrderCycle', True, timeout=5.0)
+        memory.Write({'isRunningOrderCycle': True})
+        assert controller.WaitUntil('startOrderCycle', False, timeout=5.0)
+        memory.Write({'isRunningOrderCycle': False})
+
+    thread = threading.Thread(target=RunRobot)
+    thread.start()
+    pipeline = plclogic.PLCOrderCyclePipeline(plclogic.PLCLogic(plccontroller.PLCController(memory)))
+    orders = [plclogic.PLCStartOrderCycleParameters(uniqueId='order%d' % index) for index in range(3)]
+    statuses = pipeline.Run(orders, timeout=5.0)
+    next(statuses)
+    thread.join()
+
+    # the second start is already fired, and withdrawn when the caller stops iterating
+    assert memory.Read(['startOrderCycle']) == {'startOrderCycle': True}
+    statuses.close()
+    assert memory.Read(['startOrderCycle']) == {'startOrderCycle': False}
+    assert pipeline.GetStagedOrder().uniqueId == 'order1'
+
+    # a staged order is not started with other orders unless the caller passes it again
+    with pytest.raises(ValueError):
+        next(pipeline.Run(orders[2:], timeout=0.05))
+    order = pipeline.DiscardStagedOrder()
+    assert order.uniqueId == 'order1'
+    assert pipeline.GetStagedOrder() is None
+
+    # an order that timed out stays staged as well
+    with pytest.raises(plclogic.PLCWaitTimeout):
+        next(pipeline.Run([order] + orders[2:], timeout=0.05))
+    assert memory.Read(['startOrderCycle']) == {'startOrderCycle': False}
+    assert pipeline.GetStagedOrder() is order
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import threading
 import pytest
 
 from mujinplc import plcmemory
@@ -26,3 +27,179 @@ def test_MemoryValueTypes(keyvalues):
     memory = plcmemory.PLCMemory()
     memory.Write(keyvalues)
     assert memory.Read(keyvalues.keys()) == keyvalues
+
+class RecordingObserver:
+
+    def __init__(self):
+        self.modifications = []
+
+    def MemoryModified(self, modifications):
+        self.modifications.append(dict(modifications))
+
+def test_ObserverKeyFilter():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'signal1': 1, 'signal2': 2})
+    unfiltered = RecordingObserver()
+    filtered = RecordingObserver()
+    memory.AddObserver(unfiltered)
+    memory.AddObserver(filtered, keys=['signal1'])
+    assert unfiltered.modifications == [{'signal1': 1, 'signal2': 2}]
+    assert filtered.modifications == [{'signal1': 1}]
+
+    memory.Write({'signal2': 3})
+    memory.Write({'signal1': 4, 'signal2': 5})
+    assert unfiltered.modifications[1:] == [{'signal2': 3}, {'signal1': 4, 'signal2': 5}]
+    assert filtered.modifications[1:] == [{'signal1': 4}]
+
+def test_ObserverPrefixFilter():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'location1ContainerId': 'a', 'location2ContainerId': 'b'})
+    observer = RecordingObserver()
+    memory.AddObserver(observer, keys=['isError'], prefixes=['location1'])
+    assert observer.modifications == [{'location1ContainerId': 'a'}]
+
+    memory.Write({'location1ContainerType': 'c', 'location2ContainerType': 'd', 'isError': True})
+    assert observer.modifications[1:] == [{'location1ContainerType': 'c', 'isError': True}]
+
+def test_ReadPrefix():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'location1ContainerId': 'a', 'location10ContainerId': 'b', 'location2ContainerId': 'c', 'isError': False})
+    memory.Write({'location1ContainerType': 'd'})
+    assert memory.ReadPrefix('location1') == {'location1ContainerId': 'a', 'location1ContainerType': 'd', 'location10ContainerId': 'b'}
+    assert memory.ReadPrefix('location1Container') == {'location1ContainerId': 'a', 'location1ContainerType': 'd'}
+    assert memory.ReadPrefix('moveLocation') == {}
+    assert memory.ReadRange('location1', 'location2') == memory.ReadPrefix('location1')
+
+    # prefix and range reads do not take the lock, so even an observer notified under it can read
+    reads = []
+    observer = type('ReadingObserver', (), {'MemoryModified': lambda self, modifications: reads.append((memory.ReadPrefix('location2'), memory.ReadRange('is', 'isF')))})()
+    memory.AddObserver(observer, keys=['location2ContainerId'])
+    memory.Write({'location2ContainerId': 'g', 'isError': True})
+    assert reads[-1] == ({'location2ContainerId': 'g'}, {'isError': True})
+
+    # overlapping prefixes deliver each modification once
+    observer = RecordingObserver()
+    memory.AddObserver(observer, prefixes=['location', 'location1'])
+    memory.Write({'location1ContainerId': 'e', 'location3ContainerId': 'f', 'isError': True})
+    assert observer.modifications[1:] == [{'location1ContainerId': 'e', 'location3ContainerId': 'f'}]
+
+def test_ModificationVersions():
+    memory = plcmemory.PLCMemory()
+    observer = RecordingObserver()
+    versions = []
+    observer.MemoryModified = lambda modifications: versions.append(modifications.version)
+    memory.AddObserver(observer)
+    memory.Write({'signal': 1})
+    memory.Write({'signal': 1}) # no modification, no new version
+    memory.Write({'signal': 2})
+    assert versions == [0, 1, 2]
+    assert memory.GetVersion() == 2
+
+def test_DispatcherOrdering():
+    memory = plcmemory.PLCMemory(dispatcher=plcmemory.PLCMemoryDispatcher())
+
+    class ReentrantObserver:
+
+        def __init__(self):
+            self.versions = []
+
+        def MemoryModified(self, modifications):
+            self.versions.append(modifications.version)
+            # reading and writing from within a notification must not deadlock
+            if memory.Read(['signal']) == {'signal': 1}:
+                memory.Write({'signal': 2})
+
+    observer = ReentrantObserver()
+    memory.AddObserver(observer)
+
+    def Run(index):
+        for count in range(100):
+            memory.Write({'thread%d' % index: count})
+
+    threads = [threading.Thread(target=Run, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    memory.Write({'signal': 1})
+    for thread in threads:
+        thread.join()
+
+    assert memory.Read(['signal']) == {'signal': 2}
+    assert observer.versions == list(range(memory.GetVersion() + 1))
+
+def test_ReadSince():
+    memory = plcmemory.PLCMemory(changeLogSize=2)
+    assert memory.ReadSince(0) == (0, {}, False)
+    memory.Write({'signal1': 1, 'signal2': 1})
+    memory.Write({'signal1': 2})
+    assert memory.ReadSince(0) == (2, {'signal1': 2, 'signal2': 1}, False)
+    assert memory.ReadSince(1) == (2, {'signal1': 2}, False)
+    assert memory.ReadSince(2) == (2, {}, False)
+
+    # version 1 falls out of the change log, a full snapshot is returned instead
+    memory.Write({'signal3': 3})
+    assert memory.ReadSince(0) == (3, {'signal1': 2, 'signal2': 1, 'signal3': 3}, True)
+    assert memory.ReadSince(1) == (3, {'signal1': 2, 'signal3': 3}, False)
+
+def test_Transaction():
+    memory = plcmemory.PLCMemory()
+    observer = RecordingObserver()
+    memory.AddObserver(observer)
+
+    with memory.Transaction() as transaction:
+        transaction.Write({'startOrderCycle': True, 'orderNumber': 1})
+        transaction.Write({'orderNumber': 2})
+        assert transaction.Read(['startOrderCycle', 'orderNumber']) == {'startOrderCycle': True, 'orderNumber': 2}
+        assert memory.Read(['startOrderCycle']) == {}
+    assert observer.modifications == [{}, {'startOrderCycle': True, 'orderNumber': 2}]
+
+    with pytest.raises(RuntimeError):
+        with memory.Transaction() as transaction:
+            transaction.Write({'orderNumber': 3})
+            raise RuntimeError()
+    assert memory.Read(['orderNumber']) == {'orderNumber': 2}
+
+def test_GroupCommit():
+    memory = plcmemory.PLCMemory(groupCommitWindow=0.05)
+    observer = RecordingObserver()
+    memory.AddObserver(observer)
+
+    threads = [threading.Thread(target=memory.Write, args=({'thread%d' % index: index},)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert memory.Read(['thread%d' % index for index in range(4)]) == {'thread%d' % index: index for index in range(4)}
+    assert memory.GetVersion() < 4
+    assert len(observer.modifications) == 1 + memory.GetVersion()
+
+def test_CompareAndSet():
+    memory = plcmemory.PLCMemory()
+    assert memory.CompareAndSet('startOrderCycle', None, True)
+    assert not memory.CompareAndSet('startOrderCycle', False, True)
+    assert memory.CompareAndSet('startOrderCycle', True, False)
+    assert memory.Read(['startOrderCycle']) == {'startOrderCycle': False}
+
+    assert not memory.WriteIf({'startOrderCycle': False, 'isRunningOrderCycle': True}, {'orderUniqueId': 'order1', 'startOrderCycle': True})
+    assert memory.Read(['orderUniqueId', 'startOrderCycle']) == {'startOrderCycle': False}
+    assert memory.WriteIf({'startOrderCycle': False, 'isRunningOrderCycle': None}, {'orderUniqueId': 'order1', 'startOrderCycle': True})
+    assert memory.Read(['orderUniqueId', 'startOrderCycle']) == {'orderUniqueId': 'order1', 'startOrderCycle': True}
+
+def test_SharedStateSnapshotCopies():
+    for size in (100, 10000):
+        memory = plcmemory.PLCMemory()
+        memory.Write({'signal%d' % index: index for index in range(size)})
+        snapshot = memory.GetSnapshot()
+        assert len(snapshot) == size
+        assert snapshot['signal7'] == 7
+        assert 'signal%d' % size not in snapshot
+
+        # a write only copies the path to each modified key, plus the leaves of a leaf split by a new key, regardless of the number of signals
+        memory.Write({'signal7': -7, 'newSignal': True})
+        newSnapshot = memory.GetSnapshot()
+        assert newSnapshot.CountUnsharedNodes(snapshot) <= 24
+        assert snapshot.CountUnsharedNodes(snapshot) == 0
+        assert snapshot['signal7'] == 7 and 'newSignal' not in snapshot
+        assert newSnapshot['signal7'] == -7 and newSnapshot['newSignal'] is True
+        assert len(newSnapshot) == size + 1
+        assert dict(newSnapshot) == memory.ReadAll()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from mujinplc import plcmemoryarena, plcjournal
+
+class NamespaceObserver:
+
+    def __init__(self):
+        self.modifications = []
+
+    def MemoryModified(self, modifications):
+        self.modifications.append((modifications.namespace, dict(modifications)))
+
+def test_MemoryArena():
+    arena = plcmemoryarena.PLCMemoryArena()
+    controller1 = arena.CreateMemory('controller1')
+    with pytest.raises(ValueError):
+        arena.CreateMemory('controller1')
+    with pytest.raises(KeyError):
+        arena.GetMemory('controller2')
+
+    observer = NamespaceObserver()
+    arena.AddObserver(observer)
+    controller2 = arena.CreateMemory('controller2')
+    assert arena.GetNamespaces() == ['', 'controller1', 'controller2']
+    assert arena.GetMemory('controller2') is controller2
+    assert arena.GetMemory('') is arena.GetDefaultMemory()
+
+    # memories are independent, and arena observers see both
+    controller1.Write({'startOrderCycle': True})
+    controller2.Write({'startOrderCycle': False})
+    assert controller1.Read(['startOrderCycle']) == {'startOrderCycle': True}
+    assert controller2.Read(['startOrderCycle']) == {'startOrderCycle': False}
+    assert observer.modifications == [
+        ('', {}),
+        ('controller1', {}),
+        ('controller2', {}),
+        ('controller1', {'startOrderCycle': True}),
+        ('controller2', {'startOrderCycle': False}),
+    ]
+    assert arena.GetStats()['controller1']['keys'] == 1
+
+def test_MemoryArenaJournal(tmp_path):
+    journalDirectory = str(tmp_path / 'journal')
+    arena = plcmemoryarena.PLCMemoryArena()
+    controller1 = arena.CreateMemory('controller1')
+    controller1.Write({'orderNumber': 1})
+    journal = plcjournal.PLCMemoryJournal(arena, journalDirectory, segmentSize=256)
+    controller2 = arena.CreateMemory('controller2')
+    for index in range(20):
+        controller1.Write({'orderNumber': index})
+        controller2.Write({'orderNumber': index * 2})
+    journal.Close()
+
+    reader = plcjournal.PLCJournalReader(journalDirectory)
+    assert reader.GetSegmentCount() > 1
+    timestamps = [record.timestamp for record in reader.ReadRecords()]
+    assert timestamps == sorted(timestamps)
+
+    # replay every namespace into a new arena
+    replayed = plcmemoryarena.PLCMemoryArena()
+    reader.Replay(replayed, speed=None)
+    assert replayed.GetNamespaces() == ['', 'controller1', 'controller2']
+    assert replayed.GetMemory('controller1').ReadAll() == {'orderNumber': 19}
+    assert replayed.GetMemory('controller2').ReadAll() == {'orderNumber': 38}
+
+    # replay a single namespace from the middle of the journal
+    replayed = plcmemoryarena.PLCMemoryArena()
+    start = [record.timestamp for record in reader.ReadRecords() if record.namespace == 'controller2' and record.keyvalues.get('orderNumber') == 20][0]
+    reader.Replay(replayed.CreateMemory('controller2'), start=start, end=start, speed=None, namespace='controller2')
+    assert replayed.GetMemory('controller2').ReadAll() == {'orderNumber': 20}
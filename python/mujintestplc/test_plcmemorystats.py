@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from mujinplc import plcmemory, plcmemoryarena, plcmemorystats
+
+class SlowObserver:
+
+    def MemoryModified(self, modifications):
+        time.sleep(0.001)
+
+class FastObserver:
+
+    def MemoryModified(self, modifications):
+        pass
+
+def test_Histogram():
+    histogram = plcmemorystats.PLCHistogram()
+    assert histogram.GetStats()['p99'] == 0
+    for value in range(1, 101):
+        histogram.Record(value)
+    stats = histogram.GetStats()
+    assert stats['count'] == 100
+    assert stats['max'] == 100
+    assert stats['mean'] == 50.5
+    assert 32 <= stats['p50'] <= 64
+    assert stats['p99'] == 100
+
+def test_MemoryInstrumentation():
+    assert 'instrumentation' not in plcmemory.PLCMemory().GetStats()
+
+    memory = plcmemory.PLCMemory(dispatcher=plcmemory.PLCMemoryDispatcher(), instrumentation=True)
+    slowObserver = SlowObserver()
+    fastObserver = FastObserver()
+    memory.AddObserver(slowObserver)
+    memory.AddObserver(fastObserver, keys=['orderNumber'])
+    for index in range(10):
+        memory.Write({'orderNumber': index, 'isRunningOrderCycle': index % 2 == 0})
+        memory.Write({'orderNumber': index, 'numPutInDestination': index})
+
+    stats = memory.GetStats()['instrumentation']
+    assert stats['lockWait']['count'] >= 20
+    assert stats['lockHold']['count'] >= 20
+    assert stats['batchSize']['count'] == 20
+    assert stats['keyWrites']['orderNumber']['count'] == 10
+    assert stats['keyWrites']['isRunningOrderCycle']['count'] == 10
+    assert stats['keyWrites']['numPutInDestination']['count'] == 10
+    assert stats['observerLatency'][plcmemorystats.GetObserverName(slowObserver)]['count'] == 20
+    assert stats['observerLatency'][plcmemorystats.GetObserverName(fastObserver)]['count'] == 10
+
+    hotspots = plcmemorystats.GetHotspots(stats)
+    assert hotspots['key'] in ('orderNumber', 'isRunningOrderCycle')
+    assert hotspots['observer'] == plcmemorystats.GetObserverName(slowObserver)
+
+    # short lived observers of the same class share one entry
+    for index in range(10):
+        observer = FastObserver()
+        memory.AddObserver(observer, keys=['orderNumber'])
+        memory.Write({'orderNumber': 100 + index})
+        del observer
+    stats = memory.GetStats()['instrumentation']
+    assert sorted(stats['observerLatency']) == ['FastObserver', 'SlowObserver']
+
+def test_StatsDumper():
+    arena = plcmemoryarena.PLCMemoryArena(instrumentation=True)
+    controller1 = arena.CreateMemory('controller1')
+    controller2 = arena.CreateMemory('controller2')
+    dumper = plcmemorystats.PLCMemoryStatsDumper(arena)
+
+    controller1.Write({'startOrderCycle': True})
+    controller2.Write({'stopOrderCycle': True})
+    hotspots = dumper.Dump()
+    assert hotspots['controller1']['key'] == 'startOrderCycle'
+    assert hotspots['controller2']['key'] == 'stopOrderCycle'
+
+    # hotspots only cover writes since the previous dump
+    controller1.Write({'orderNumber': 1})
+    hotspots = dumper.Dump()
+    assert hotspots['controller1']['key'] == 'orderNumber'
+    assert hotspots['controller2']['key'] is None
+
+    # stopping does not wait for the interval to elapse
+    dumper = plcmemorystats.PLCMemoryStatsDumper(arena, interval=60.0)
+    dumper.Start()
+    start = time.monotonic()
+    dumper.Stop()
+    assert time.monotonic() - start < 5.0
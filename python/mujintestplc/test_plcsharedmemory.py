@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import glob
+import struct
+import multiprocessing
+import pytest
+
+from mujinplc import plcstorage, plcsharedmemory, plccontroller
+
+def CreateSchema():
+    return plcstorage.PLCSignalSchema({
+        'startOrderCycle': bool,
+        'isRunningOrderCycle': bool,
+        'orderNumber': int,
+        'orderUniqueId': str,
+    })
+
+@pytest.fixture
+def memoryPath(tmp_path):
+    return str(tmp_path / 'plcmemory')
+
+def test_SharedMemoryAttach(memoryPath):
+    memory1 = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema(), create=True, maxStringLength=8)
+    memory2 = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema())
+    try:
+        controller = plccontroller.PLCController(memory2)
+        memory1.Write({'orderNumber': -3, 'orderUniqueId': 'order1', 'startOrderCycle': True})
+        assert memory2.Read(['orderNumber', 'orderUniqueId', 'isRunningOrderCycle']) == {'orderNumber': -3, 'orderUniqueId': 'order1'}
+        assert controller.WaitUntil('startOrderCycle', True, timeout=5.0)
+        assert controller.GetInteger('orderNumber') == -3
+
+        memory2.Write({'isRunningOrderCycle': True})
+        assert memory1.Read(['isRunningOrderCycle']) == {'isRunningOrderCycle': True}
+        # the version of a value that was read is seen right away, without waiting for the notification thread
+        assert memory1.GetVersion() == memory2.GetVersion() == 2
+        assert memory1.ReadSince(1) == (2, {'isRunningOrderCycle': True}, False)
+        assert memory2.ReadPrefix('order') == {'orderNumber': -3, 'orderUniqueId': 'order1'}
+
+        with pytest.raises(ValueError):
+            memory1.Write({'orderUniqueId': 'too long string'})
+        with pytest.raises(ValueError):
+            memory1.Write({'unknownSignal': True})
+    finally:
+        memory1.Close()
+        memory2.Close()
+
+def test_SharedMemoryWriteIf(memoryPath):
+    memory1 = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema(), create=True)
+    memory2 = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema())
+    try:
+        assert memory1.CompareAndSet('startOrderCycle', None, True)
+        assert not memory2.CompareAndSet('startOrderCycle', None, True)
+        assert memory2.WriteIf({'startOrderCycle': True}, {'isRunningOrderCycle': True})
+        assert memory1.Read(['startOrderCycle', 'isRunningOrderCycle']) == {'startOrderCycle': True, 'isRunningOrderCycle': True}
+    finally:
+        memory1.Close()
+        memory2.Close()
+
+def test_SharedMemorySchemaMismatch(memoryPath):
+    memory = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema(), create=True)
+    try:
+        with pytest.raises(ValueError):
+            plcsharedmemory.PLCSharedMemory(memoryPath, plcstorage.PLCSignalSchema({'startOrderCycle': bool}))
+    finally:
+        memory.Close()
+
+def RunChildProcess(memoryPath, attached):
+    memory = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema())
+    try:
+        controller = plccontroller.PLCController(memory)
+        attached.set()
+        if controller.WaitUntil('startOrderCycle', True, timeout=10.0):
+            memory.Write({'isRunningOrderCycle': True, 'orderNumber': controller.GetInteger('orderNumber') + 1})
+    finally:
+        memory.Close()
+
+def test_SharedMemoryMultiProcess(memoryPath):
+    memory = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema(), create=True)
+    try:
+        controller = plccontroller.PLCController(memory)
+        context = multiprocessing.get_context('spawn')
+        attached = context.Event()
+        process = context.Process(target=RunChildProcess, args=(memoryPath, attached))
+        process.start()
+        try:
+            assert attached.wait(timeout=10.0)
+            memory.Write({'orderNumber': 41, 'startOrderCycle': True})
+            assert controller.WaitUntil('isRunningOrderCycle', True, timeout=10.0)
+            assert controller.GetInteger('orderNumber') == 42
+        finally:
+            process.join()
+    finally:
+        memory.Close()
+
+def test_SharedMemoryClose(memoryPath):
+    memory = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema(), create=True)
+    memory.Write({'startOrderCycle': True})
+    memory.Close()
+    memory.Close()
+    assert not glob.glob(memoryPath + '.*.notify')
+
+    with pytest.raises(ValueError):
+        memory.Write({'startOrderCycle': False})
+    with pytest.raises(ValueError):
+        memory.Read(['startOrderCycle'])
+    with pytest.raises(ValueError):
+        memory.GetVersion()
+
+    # the values stay in the file for the next process to attach
+    memory = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema())
+    try:
+        assert memory.Read(['startOrderCycle']) == {'startOrderCycle': True}
+    finally:
+        memory.Close()
+
+def test_SharedMemoryReleasedWithoutClose(memoryPath):
+    memory = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema(), create=True)
+    thread = memory._thread
+    assert thread.daemon
+    del memory
+    gc.collect()
+    thread.join(timeout=5.0)
+    assert not thread.is_alive()
+    assert not glob.glob(memoryPath + '.*.notify')
+
+def test_SharedMemoryTornRead(memoryPath, monkeypatch):
+    memory = plcsharedmemory.PLCSharedMemory(memoryPath, CreateSchema(), create=True)
+    try:
+        memory.Write({'orderUniqueId': 'order1'})
+        storage = memory._storage
+        decodeSlotValue = storage.DecodeSlotValue
+        tornReads = []
+
+        def DecodeTornSlotValue(slot, buffer, offset):
+            if not tornReads:
+                # another process completes a write of the string while it is being decoded
+                tornReads.append(slot)
+                struct.pack_into('<Q', memory._buffer, memory._sequenceOffset, memory._GetSequence() + 2)
+                return True, b'\xff\xfe'.decode('utf-8')
+            return decodeSlotValue(slot, buffer, offset)
+
+        monkeypatch.setattr(storage, 'DecodeSlotValue', DecodeTornSlotValue)
+        assert memory.Read(['orderUniqueId']) == {'orderUniqueId': 'order1'}
+        assert tornReads
+
+        # failures not caused by a concurrent write are raised
+        monkeypatch.setattr(storage, 'DecodeSlotValue', lambda slot, buffer, offset: b'\xff'.decode('utf-8'))
+        with pytest.raises(UnicodeDecodeError):
+            memory.Read(['orderUniqueId'])
+    finally:
+        memory.Close()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+
+from mujinplc import plcmemory, plccontroller, plcsignaldispatcher
+
+def test_SignalDispatcher():
+    memory = plcmemory.PLCMemory()
+    memory.Write({'isRunningOrderCycle': True})
+    dispatcher = plcsignaldispatcher.PLCSignalDispatcher(memory)
+
+    # already true
+    assert dispatcher.WaitUntil('isRunningOrderCycle', True).result(timeout=0) is True
+
+    # many waiters share the same state
+    predicate = plccontroller.PLCWaitPredicate({'isRunningOrderCycle': False}, {'isError': True})
+    futures = [dispatcher.WaitUntilPredicate(predicate) for index in range(10)]
+    assert dispatcher.GetWaiterCount() == 10
+    assert not any(future.done() for future in futures)
+    memory.Write({'numLeftInOrder': 1})
+    assert not any(future.done() for future in futures)
+    memory.Write({'isRunningOrderCycle': False})
+    assert all(future.result(timeout=0) for future in futures)
+    assert dispatcher.GetWaiterCount() == 0
+    assert dispatcher.Get('numLeftInOrder') == 1
+
+def test_SignalDispatcherTimeout():
+    memory = plcmemory.PLCMemory()
+    dispatcher = plcsignaldispatcher.PLCSignalDispatcher(memory)
+    assert not dispatcher.Wait(dispatcher.WaitUntil('isCycleReady', True), timeout=0.01)
+    assert dispatcher.GetWaiterCount() == 0
+
+    future = dispatcher.WaitUntil('isCycleReady', True)
+    thread = threading.Timer(0.01, memory.Write, args=({'isCycleReady': True},))
+    thread.start()
+    assert dispatcher.Wait(future, timeout=5.0)
+    thread.join()
+
+def test_SignalDispatcherAsync():
+    memory = plcmemory.PLCMemory()
+    dispatcher = plcsignaldispatcher.PLCSignalDispatcher(memory)
+
+    async def WaitAsync():
+        waits = asyncio.gather(*[dispatcher.WaitUntilAllOrAnyAsync({'isModeAuto': True, 'isSystemReady': True}) for index in range(3)])
+        memory.Write({'isModeAuto': True})
+        memory.Write({'isSystemReady': True})
+        return await asyncio.wait_for(waits, 5.0)
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(WaitAsync()) == [True, True, True]
+    finally:
+        loop.close()
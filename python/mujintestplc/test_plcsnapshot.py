@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from mujinplc import plcmemory, plcsnapshot
+
+@pytest.fixture
+def snapshotPath(tmp_path):
+    return str(tmp_path / 'plcmemory.snapshot')
+
+def test_SnapshotRoundtrip(snapshotPath):
+    keyvalues = {
+        'startOrderCycle': True,
+        'isRunningOrderCycle': False,
+        'orderNumber': -(1 << 40),
+        'orderUniqueId': u'注文1',
+        'orderPickLocation': None,
+    }
+    plcsnapshot.SaveSnapshot(snapshotPath, keyvalues, version=5)
+    assert plcsnapshot.LoadSnapshot(snapshotPath) == keyvalues
+
+    memory = plcmemory.PLCMemory()
+    assert plcsnapshot.RestoreSnapshot(memory, snapshotPath)
+    assert memory.ReadAll() == keyvalues
+
+def test_RestoreMissingSnapshot(snapshotPath):
+    assert not plcsnapshot.RestoreSnapshot(plcmemory.PLCMemory(), snapshotPath)
+
+def test_SnapshotterSavesOnStop(snapshotPath):
+    memory = plcmemory.PLCMemory()
+    snapshotter = plcsnapshot.PLCMemorySnapshotter(memory, snapshotPath, interval=60.0)
+    assert snapshotter.Snapshot()
+    assert not snapshotter.Snapshot()
+
+    snapshotter.Start()
+    memory.Write({'orderNumber': 7})
+    snapshotter.Stop()
+    assert plcsnapshot.LoadSnapshot(snapshotPath) == {'orderNumber': 7}
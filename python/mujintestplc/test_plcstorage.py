@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import pytest
+
+from mujinplc import plcmemory, plcstorage
+
+def CreateSchema():
+    return plcstorage.PLCSignalSchema({
+        'isError': bool,
+        'isRobotMoving': bool,
+        'errorcode': int,
+        'detailedErrorCode': str,
+    })
+
+def test_CompactStorageMapping():
+    storage = plcstorage.PLCCompactStorage(CreateSchema())
+    assert len(storage) == 0
+    assert 'isError' not in storage
+
+    storage.update({'isError': True, 'errorcode': -5, 'detailedErrorCode': 'detail', 'other': 'overflow'})
+    storage['isRobotMoving'] = None
+    assert dict(storage) == {'isError': True, 'isRobotMoving': None, 'errorcode': -5, 'detailedErrorCode': 'detail', 'other': 'overflow'}
+
+    storage['isError'] = False
+    assert storage['isError'] is False
+
+@pytest.mark.parametrize('keyvalues', [
+    {'isError': 1},
+    {'errorcode': True},
+    {'errorcode': 'string'},
+    {'errorcode': 1 << 63},
+    {'detailedErrorCode': 0},
+])
+def test_CompactStorageTypeCheck(keyvalues):
+    memory = plcmemory.PLCMemory(storage=plcstorage.PLCCompactStorage(CreateSchema()))
+    with pytest.raises(ValueError):
+        memory.Write(dict(keyvalues, isRobotMoving=True))
+    # nothing is written when any value is bad
+    assert memory.Read(['isRobotMoving']) == {}
+    assert memory.GetVersion() == 0
+
+def test_MemorySlots():
+    memory = plcmemory.PLCMemory(storage=plcstorage.PLCCompactStorage(CreateSchema()))
+    modifications = []
+    observer = type('Observer', (), {'MemoryModified': lambda self, keyvalues: modifications.append(dict(keyvalues))})()
+    memory.AddObserver(observer)
+
+    isErrorSlot, errorcodeSlot = memory.GetSlots(['isError', 'errorcode'])
+    memory.WriteSlots({isErrorSlot: True, errorcodeSlot: 0x1000})
+    memory.WriteSlots({isErrorSlot: True})
+    assert memory.ReadSlots([isErrorSlot, errorcodeSlot]) == {isErrorSlot: True, errorcodeSlot: 0x1000}
+    assert memory.Read(['isError', 'errorcode', 'detailedErrorCode']) == {'isError': True, 'errorcode': 0x1000}
+    assert modifications == [{}, {'isError': True, 'errorcode': 0x1000}]
+
+def test_MemorySlotsRequireCompactStorage():
+    memory = plcmemory.PLCMemory()
+    with pytest.raises(ValueError):
+        memory.GetSlots(['isError'])
+
+def test_ConsistentReadsDuringWrites():
+    schema = plcstorage.PLCSignalSchema({'signal%d' % index: int for index in range(50)})
+    memory = plcmemory.PLCMemory(storage=plcstorage.PLCCompactStorage(schema))
+    keys = list(schema.GetNames())
+    isok = [True]
+
+    def RunWriter():
+        count = 0
+        while isok[0]:
+            count += 1
+            memory.Write({key: count for key in keys})
+
+    writer = threading.Thread(target=RunWriter)
+    writer.start()
+    try:
+        for count in range(500):
+            # every read has to see all keys from the same write
+            assert len(set(memory.Read(keys).values())) <= 1
+    finally:
+        isok[0] = False
+        writer.join()